@@ -6,6 +6,7 @@ import numpy as np
 from core.database.connection import DatabaseConnection
 from core.models.access_log import AccessStatus, AccessLog
 from app.services.auth.authentication_service import AuthenticationService
+from app.services.auth.login_throttle import login_throttle
 from app.services.auth.face_recognition_service import FaceRecognitionService
 from app.services.finance.finance_service import FinanceService
 
@@ -20,6 +21,7 @@ class AccessController:
         self.auth_service = AuthenticationService()
         self.face_service = FaceRecognitionService()
         self.finance_service = FinanceService()
+        self.throttle = login_throttle
     
     def verify_access(self, student_number: str, password: str, 
                      face_image_path: str, access_point: str) -> dict:
@@ -45,13 +47,22 @@ class AccessController:
         }
         
         try:
+            # 0. Rejeter les rafales sans calcul bcrypt
+            allowed, retry_after = self.throttle.acquire(student_number, access_point)
+            if not allowed:
+                result["reason"] = f"Too many attempts, retry in {int(retry_after) + 1}s"
+                result["throttled"] = True
+                return result
+
             # 1. Vérifier le mot de passe
             student = self.auth_service.authenticate_student(student_number, password)
             if not student:
+                self.throttle.record_failure(student_number, access_point)
                 result["reason"] = "Invalid password"
                 self._log_access(None, access_point, AccessStatus.DENIED_PASSWORD)
                 return result
             
+            self.throttle.record_success(student_number, access_point)
             result["password_valid"] = True
             result["student_id"] = student['id']
             
@@ -70,9 +81,9 @@ class AccessController:
             
             result["face_valid"] = True
             
-            # 3. Vérifier le seuil financier
-            if not self.finance_service.is_threshold_reached(student['id']):
-                result["reason"] = "Financial threshold not reached"
+            # 3. Vérifier le seuil financier et la validité du code (instantané matérialisé)
+            if not self.finance_service.is_eligible_now(student['id']):
+                result["reason"] = "Financial threshold not reached or access code not valid"
                 self._log_access(student['id'], access_point, AccessStatus.DENIED_FINANCE)
                 return result
             
@@ -0,0 +1,317 @@
+"""Passerelle asyncio multi-portes pour les contrôleurs ESP32
+
+Une seule instance maintient une connexion TCP persistante vers chaque ESP32
+(une par salle d'examen) et remplace la boucle série bloquante d'ArduinoBridge.
+
+Protocole (trames ASCII terminées par '\\n', comme le sketch terminal_porte.ino):
+
+    ESP32 -> passerelle
+        PASS:<matricule>:<code>   code saisi au clavier
+        CAPTURE:<chemin_image>    capture du visage prête
+        PING / PONG               battement de cœur (la passerelle répond PONG)
+
+    passerelle -> ESP32
+        SCAN_VISAGE, ACCES_OK, ERR_AUTH, ERR_FACE, ERR_FINANCE, ERR_BUSY,
+        PING (toutes les ACCESS_GATEWAY_HEARTBEAT_S; la porte répond PONG)
+
+Sans aucune trame pendant HEARTBEAT_S x HEARTBEAT_MISSES (coupure de courant ou
+de Wi-Fi côté porte: connexion TCP à demi ouverte), la connexion est abandonnée
+et la boucle de reconnexion reprend.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_FRAME_BYTES = 512
+
+
+@dataclass(frozen=True)
+class DoorConfig:
+    door_id: str
+    host: str
+    port: int
+
+
+@dataclass
+class DoorEvent:
+    kind: str
+    args: tuple
+    received_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class DoorMetrics:
+    connected: bool = False
+    reconnects: int = 0
+    frames_in: int = 0
+    dropped_busy: int = 0
+    verifications: int = 0
+    granted: int = 0
+    denied: int = 0
+    heartbeat_timeouts: int = 0
+    last_latency_ms: float = 0.0
+
+
+def parse_doors(spec: str) -> List[DoorConfig]:
+    """Parse ACCESS_GATEWAY_DOORS ("id=hote:port,id2=hote:port")"""
+    doors = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            door_id, address = item.split("=", 1)
+            host, port = address.rsplit(":", 1)
+            doors.append(DoorConfig(door_id.strip(), host.strip(), int(port)))
+        except ValueError:
+            logger.error(f"Invalid door definition ignored: {item!r}")
+    return doors
+
+
+def _default_controller_factory():
+    from app.services.access.access_controller import AccessController
+    return AccessController()
+
+
+def result_to_command(result: dict) -> str:
+    """Traduit le résultat de AccessController.verify_access en commande porte"""
+    if result.get("access_granted"):
+        return "ACCES_OK"
+    if result.get("throttled"):
+        return "ERR_BUSY"
+    if not result.get("password_valid"):
+        return "ERR_AUTH"
+    if not result.get("face_valid"):
+        return "ERR_FACE"
+    if not result.get("finance_valid"):
+        return "ERR_FINANCE"
+    return "ERR_AUTH"
+
+
+class AccessGateway:
+    """Passerelle d'accès: connexions persistantes, files par porte et pool de vérification"""
+
+    def __init__(self, doors: Optional[List[DoorConfig]] = None, workers: int = None,
+                 queue_size: int = None, controller_factory: Callable = None):
+        self.doors = doors if doors is not None else parse_doors(settings.ACCESS_GATEWAY_DOORS)
+        self.workers = workers or settings.ACCESS_GATEWAY_WORKERS
+        self.queue_size = queue_size or settings.ACCESS_GATEWAY_DOOR_QUEUE_SIZE
+        self.reconnect_max_s = settings.ACCESS_GATEWAY_RECONNECT_MAX_S
+        self.pending_ttl_s = settings.ACCESS_GATEWAY_PENDING_TTL_S
+        self.heartbeat_s = settings.ACCESS_GATEWAY_HEARTBEAT_S
+        self.heartbeat_misses = max(1, settings.ACCESS_GATEWAY_HEARTBEAT_MISSES)
+        self.controller_factory = controller_factory or _default_controller_factory
+        self.metrics: Dict[str, DoorMetrics] = {d.door_id: DoorMetrics() for d in self.doors}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+
+    # ---------- Pool de vérification (threads bloquants: bcrypt, visage, MySQL) ----------
+
+    def _controller(self):
+        controller = getattr(self._local, "controller", None)
+        if controller is None:
+            controller = self.controller_factory()
+            self._local.controller = controller
+        return controller
+
+    def _verify(self, door_id: str, student_number: str, code: str, image_path: str) -> dict:
+        return self._controller().verify_access(student_number, code, image_path, door_id)
+
+    # ---------- Cycle de vie ----------
+
+    async def run(self) -> None:
+        """Lance une tâche par porte et attend l'arrêt"""
+        if not self.doors:
+            logger.warning("Access gateway started without any door (ACCESS_GATEWAY_DOORS empty)")
+            return
+        self._stopping = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="door-verify")
+        self._tasks = [asyncio.create_task(self._door_loop(door), name=f"door-{door.door_id}")
+                       for door in self.doors]
+        logger.info(f"Access gateway serving {len(self.doors)} door(s) with {self.workers} worker(s)")
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+            logger.info("Access gateway stopped")
+
+    def stop(self) -> None:
+        """Demande l'arrêt de la passerelle (à appeler depuis la boucle asyncio)"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def get_metrics(self) -> Dict[str, dict]:
+        """Métriques par porte (pour le tableau de bord)"""
+        return {door_id: vars(m).copy() for door_id, m in self.metrics.items()}
+
+    # ---------- Gestion d'une porte ----------
+
+    async def _door_loop(self, door: DoorConfig) -> None:
+        """Connexion persistante avec reconnexion exponentielle"""
+        delay = 1.0
+        metrics = self.metrics[door.door_id]
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(door.host, door.port)
+            except OSError as e:
+                logger.info(f"Door {door.door_id} unreachable ({e}), retry in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_s)
+                continue
+
+            delay = 1.0
+            metrics.connected = True
+            logger.info(f"Door {door.door_id} connected ({door.host}:{door.port})")
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+            worker = asyncio.create_task(self._door_worker(door, queue, writer))
+            heartbeat = asyncio.create_task(self._heartbeat(door, writer)) if self.heartbeat_s > 0 else None
+            try:
+                await self._read_frames(door, reader, writer, queue)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                logger.warning(f"Door {door.door_id} connection lost: {e}")
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                # Ligne sans '\n' au-delà de la limite du StreamReader: flux désynchronisé, on reconnecte
+                logger.warning(f"Door {door.door_id}: frame exceeds stream limit, dropping connection ({e})")
+            finally:
+                metrics.connected = False
+                metrics.reconnects += 1
+                worker.cancel()
+                if heartbeat is not None:
+                    heartbeat.cancel()
+                await asyncio.gather(worker, *([heartbeat] if heartbeat else []), return_exceptions=True)
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+
+    async def _heartbeat(self, door: DoorConfig, writer: asyncio.StreamWriter) -> None:
+        """PING périodique: la réponse PONG prouve que la porte est toujours joignable"""
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            try:
+                await self._send(writer, "PING")
+            except (ConnectionError, OSError) as e:
+                # La lecture constatera la coupure (EOF ou délai du battement de cœur)
+                logger.debug(f"Door {door.door_id}: heartbeat not sent ({e})")
+                return
+
+    async def _read_frames(self, door: DoorConfig, reader: asyncio.StreamReader,
+                           writer: asyncio.StreamWriter, queue: asyncio.Queue) -> None:
+        metrics = self.metrics[door.door_id]
+        read_timeout = self.heartbeat_s * self.heartbeat_misses if self.heartbeat_s > 0 else None
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(), timeout=read_timeout)
+            except asyncio.TimeoutError:
+                metrics.heartbeat_timeouts += 1
+                raise ConnectionError(f"no frame for {read_timeout:g}s (heartbeat timeout)")
+            if not line:
+                raise ConnectionError("closed by peer")
+            if len(line) > MAX_FRAME_BYTES:
+                logger.warning(f"Door {door.door_id}: oversized frame dropped")
+                continue
+            frame = line.decode("utf-8", errors="replace").strip()
+            if not frame:
+                continue
+            metrics.frames_in += 1
+
+            kind, _, payload = frame.partition(":")
+            kind = kind.upper()
+            if kind == "PONG":
+                continue
+            if kind == "PING":
+                await self._send(writer, "PONG")
+                continue
+            if kind == "PASS":
+                student_number, _, code = payload.partition(":")
+                event = DoorEvent("PASS", (student_number.strip(), code.strip()))
+            elif kind == "CAPTURE":
+                event = DoorEvent("CAPTURE", (payload.strip(),))
+            else:
+                logger.debug(f"Door {door.door_id}: unknown frame {kind!r}")
+                continue
+
+            # Backpressure: la porte est prévenue plutôt que de laisser la file grossir
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                metrics.dropped_busy += 1
+                await self._send(writer, "ERR_BUSY")
+
+    async def _door_worker(self, door: DoorConfig, queue: asyncio.Queue,
+                           writer: asyncio.StreamWriter) -> None:
+        """Traite les événements d'une porte dans l'ordre (un étudiant à la fois)"""
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics[door.door_id]
+        pending = None
+        while True:
+            event = await queue.get()
+            try:
+                if event.kind == "PASS":
+                    student_number, code = event.args
+                    if not student_number or not code:
+                        await self._send(writer, "ERR_AUTH")
+                        continue
+                    pending = (student_number, code, event.received_at)
+                    await self._send(writer, "SCAN_VISAGE")
+                    continue
+
+                if event.kind == "CAPTURE":
+                    if not pending or event.received_at - pending[2] > self.pending_ttl_s:
+                        pending = None
+                        await self._send(writer, "ERR_AUTH")
+                        continue
+                    student_number, code, _ = pending
+                    pending = None
+                    started = time.monotonic()
+                    try:
+                        result = await loop.run_in_executor(
+                            self._executor, self._verify,
+                            door.door_id, student_number, code, event.args[0]
+                        )
+                    except Exception as e:
+                        logger.error(f"Door {door.door_id}: verification error: {e}")
+                        result = {}
+                    command = result_to_command(result)
+                    metrics.verifications += 1
+                    metrics.last_latency_ms = (time.monotonic() - started) * 1000
+                    if command == "ACCES_OK":
+                        metrics.granted += 1
+                    else:
+                        metrics.denied += 1
+                    await self._send(writer, command)
+            finally:
+                queue.task_done()
+
+    async def _send(self, writer: asyncio.StreamWriter, command: str) -> None:
+        writer.write(f"{command}\n".encode("ascii"))
+        await writer.drain()
+
+
+def main() -> None:
+    """Point d'entrée: python -m app.services.access.access_gateway"""
+    logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL, logging.INFO),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    gateway = AccessGateway()
+    try:
+        asyncio.run(gateway.run())
+    except KeyboardInterrupt:
+        logger.info("Access gateway interrupted")
+
+
+if __name__ == "__main__":
+    main()
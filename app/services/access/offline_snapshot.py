@@ -0,0 +1,380 @@
+"""Instantané signé des éligibilités pour les terminaux de porte hors-ligne
+
+Si MySQL ou le réseau tombe le jour de l'examen, les terminaux vérifient
+localement contre un fichier binaire exporté à l'avance:
+
+    [en-tête 64 octets][N enregistrements de taille fixe triés]
+    [P périodes d'examen (début, fin) de l'année][HMAC-SHA256 32 octets]
+
+Les enregistrements sont lus sans copie (mmap + numpy.frombuffer) et recherchés
+par dichotomie sur le matricule. Un fichier delta (même format, sans encodage
+facial ni périodes) couvre les paiements et codes émis après l'instantané.
+
+L'éligibilité suit la règle en ligne (`is_access_code_valid`): un code complet
+n'ouvre la porte que pendant une période d'examen de son année, d'où les
+périodes embarquées et vérifiées à l'heure du passage.
+"""
+import math
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Dict, Optional
+import numpy as np
+from config.settings import OFFLINE_SNAPSHOT_KEY, SECRET_KEY_PLACEHOLDERS
+from core.database.connection import DatabaseConnection
+from core.security.password_hasher import PasswordHasher
+from app.services.finance.exam_calendar import exam_calendar
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"UORSNAP1"
+FORMAT_VERSION = 2
+KIND_FULL = 0
+KIND_DELTA = 1
+
+# magic, version, kind, record_count, encoding_dim, as_of (epoch), academic_year_id,
+# exam_period_id, empreinte de l'instantané de base (deltas uniquement), period_count
+HEADER = struct.Struct("<8sHHIIqII16sI8x")
+SIGNATURE_SIZE = 32
+FACE_DIM = 128
+STUDENT_NUMBER_SIZE = 24
+PASSWORD_HASH_SIZE = 60
+
+FLAG_ELIGIBLE = 0x01
+FLAG_HAS_FACE = 0x02
+FLAG_FULL_ACCESS = 0x04
+FLAG_REVOKED = 0x08
+FLAG_EXAM_PERIOD_ONLY = 0x10   # code complet: valide seulement pendant une période d'examen
+
+# Période d'examen [start, end[ en secondes epoch (fin = lendemain 00:00 du dernier jour)
+PERIOD_DTYPE = np.dtype([("start", "<i8"), ("end", "<i8")])
+
+
+def record_dtype(encoding_dim: int) -> np.dtype:
+    """Structure d'un enregistrement (encodage facial en float32 pour la compacité)"""
+    fields = [
+        ("student_number", f"S{STUDENT_NUMBER_SIZE}"),
+        ("password_hash", f"S{PASSWORD_HASH_SIZE}"),
+        ("flags", "u1"),
+        ("_pad", "V3"),
+        ("expires_at", "<i8"),
+    ]
+    if encoding_dim:
+        fields.append(("face", "<f4", (encoding_dim,)))
+    return np.dtype(fields)
+
+
+def _sign(key: bytes, payload) -> bytes:
+    return hmac.new(key, payload, hashlib.sha256).digest()
+
+
+def _key_bytes(key) -> bytes:
+    """Clé HMAC; refuse une clé vide ou d'exemple (signature forgeable par quiconque)"""
+    key = key if key is not None else OFFLINE_SNAPSHOT_KEY
+    key = key.encode() if isinstance(key, str) else bytes(key or b"")
+    if not key.strip() or key.decode("utf-8", "ignore") in SECRET_KEY_PLACEHOLDERS:
+        raise ValueError("OFFLINE_SNAPSHOT_KEY is empty or a placeholder: set a secret key shared with the door terminals")
+    return key
+
+
+def _epoch(value) -> int:
+    if not value:
+        return 0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def _exam_periods(academic_year_id: int) -> np.ndarray:
+    """Périodes d'examen de l'année (calendrier partagé), bornes en epoch"""
+    periods = exam_calendar.get_periods(academic_year_id) if academic_year_id else []
+    return np.array([(int(period["start"].timestamp()), math.ceil(period["end"].timestamp()))
+                     for period in periods], dtype=PERIOD_DTYPE)
+
+
+class OfflineSnapshotExporter:
+    """Construit les instantanés et deltas à partir de MySQL"""
+
+    def __init__(self, key: Optional[bytes] = None):
+        self._db = None
+        self.key = _key_bytes(key)
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    def _fetch_rows(self, academic_year_id: int, include_face: bool, since: Optional[datetime] = None):
+        """Lit les colonnes strictement nécessaires, en flux"""
+        face_col = ", s.face_encoding" if include_face else ""
+        query = f"""
+            SELECT s.student_number, s.password_hash, s.is_active{face_col},
+                   f.amount_paid, f.threshold_required, f.final_fee,
+                   f.access_code_type, f.access_code_expires_at
+            FROM student s
+            JOIN finance_profile f ON f.student_id = s.id
+            WHERE f.academic_year_id = %s
+        """
+        params = [academic_year_id]
+        if since is None:
+            query += " AND s.is_active = 1"
+        else:
+            query += " AND (f.updated_at > %s OR s.updated_at > %s)"
+            params.extend([since, since])
+
+        connection = self.db.get_connection()
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            if cursor:
+                cursor.close()
+            self.db.close_connection(connection)
+
+    def _build_records(self, rows, encoding_dim: int, as_of: datetime) -> np.ndarray:
+        dtype = record_dtype(encoding_dim)
+        items = []
+        for row in rows:
+            student_number = str(row.get("student_number") or "").encode("ascii", "ignore")
+            password_hash = str(row.get("password_hash") or "").encode("ascii", "ignore")
+            if not student_number or len(student_number) > STUDENT_NUMBER_SIZE:
+                logger.warning(f"Student number {student_number!r} not exportable, skipped")
+                continue
+
+            amount_paid = float(row.get("amount_paid") or 0)
+            threshold = float(row.get("threshold_required") or 0)
+            final_fee = float(row.get("final_fee") or 0)
+            expires_at = _epoch(row.get("access_code_expires_at"))
+            flags = 0
+            if amount_paid >= threshold and (not expires_at or expires_at > as_of.timestamp()):
+                flags |= FLAG_ELIGIBLE
+            if row.get("access_code_type") == "full" or (final_fee > 0 and amount_paid >= final_fee):
+                flags |= FLAG_FULL_ACCESS
+            if row.get("access_code_type") == "full":
+                # Même règle qu'en ligne: profil exporté par année, donc toujours rattaché à une année
+                flags |= FLAG_EXAM_PERIOD_ONLY
+            if not row.get("is_active", 1):
+                flags = FLAG_REVOKED
+
+            face = None
+            if encoding_dim and row.get("face_encoding"):
+                encoding = np.frombuffer(row["face_encoding"], dtype=np.float64)
+                if encoding.shape == (encoding_dim,):
+                    face = encoding.astype(np.float32)
+                    flags |= FLAG_HAS_FACE
+            items.append((student_number, password_hash, flags, expires_at, face))
+
+        records = np.zeros(len(items), dtype=dtype)
+        items.sort(key=lambda item: item[0])
+        for i, (student_number, password_hash, flags, expires_at, face) in enumerate(items):
+            records[i]["student_number"] = student_number
+            records[i]["password_hash"] = password_hash
+            records[i]["flags"] = flags
+            records[i]["expires_at"] = expires_at
+            if face is not None:
+                records[i]["face"] = face
+        return records
+
+    def _write(self, path: str, kind: int, records: np.ndarray, encoding_dim: int, as_of: datetime,
+               academic_year_id: int, exam_period_id: int, base_digest: bytes = b"",
+               periods: Optional[np.ndarray] = None) -> str:
+        periods = periods if periods is not None else np.zeros(0, dtype=PERIOD_DTYPE)
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, kind, len(records), encoding_dim,
+                             int(as_of.timestamp()), academic_year_id or 0, exam_period_id or 0,
+                             base_digest[:16].ljust(16, b"\0"), len(periods))
+        body = header + records.tobytes() + periods.tobytes()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.write(_sign(self.key, body))
+        os.replace(tmp_path, path)
+        return path
+
+    def export_snapshot(self, path: str, academic_year_id: int, exam_period_id: int = 0,
+                        as_of: Optional[datetime] = None) -> dict:
+        """Exporte l'instantané complet des étudiants actifs d'une année"""
+        as_of = as_of or datetime.now()
+        records = self._build_records(self._fetch_rows(academic_year_id, True), FACE_DIM, as_of)
+        self._write(path, KIND_FULL, records, FACE_DIM, as_of, academic_year_id, exam_period_id,
+                    periods=_exam_periods(academic_year_id))
+        eligible = int(np.count_nonzero(records["flags"] & FLAG_ELIGIBLE)) if len(records) else 0
+        logger.info(f"Offline snapshot written to {path}: {len(records)} students, {eligible} eligible")
+        return {"path": path, "students": len(records), "eligible": eligible, "as_of": as_of}
+
+    def export_delta(self, path: str, base_snapshot_path: str, as_of: Optional[datetime] = None) -> dict:
+        """Exporte les changements (paiements, nouveaux codes) depuis un instantané"""
+        base = OfflineSnapshot(base_snapshot_path, key=self.key)
+        try:
+            since = datetime.fromtimestamp(base.as_of)
+            academic_year_id, exam_period_id, base_digest = base.academic_year_id, base.exam_period_id, base.digest
+        finally:
+            base.close()
+        as_of = as_of or datetime.now()
+        records = self._build_records(self._fetch_rows(academic_year_id, False, since), 0, as_of)
+        self._write(path, KIND_DELTA, records, 0, as_of, academic_year_id, exam_period_id, base_digest)
+        logger.info(f"Offline delta written to {path}: {len(records)} change(s) since {since}")
+        return {"path": path, "changes": len(records), "since": since, "as_of": as_of}
+
+
+class OfflineSnapshot:
+    """Instantané chargé côté terminal (lecture seule, sans copie)"""
+
+    def __init__(self, path: str, key: Optional[bytes] = None):
+        self.key = _key_bytes(key)
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        try:
+            if len(view) < HEADER.size + SIGNATURE_SIZE:
+                raise ValueError("Snapshot file truncated")
+            (magic, version, kind, count, encoding_dim, as_of,
+             academic_year_id, exam_period_id, base_digest, period_count) = HEADER.unpack_from(view, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or kind != KIND_FULL:
+                raise ValueError("Not a full offline snapshot")
+            records_size = count * record_dtype(encoding_dim).itemsize
+            if len(view) != HEADER.size + records_size + period_count * PERIOD_DTYPE.itemsize + SIGNATURE_SIZE:
+                raise ValueError("Snapshot file size does not match its header")
+            self.digest = bytes(view[-SIGNATURE_SIZE:])
+            with view[:-SIGNATURE_SIZE] as body:
+                expected = _sign(self.key, body)
+            if not hmac.compare_digest(expected, self.digest):
+                raise ValueError("Offline snapshot signature mismatch")
+        except Exception:
+            view.release()
+            self.close()
+            raise
+        view.release()
+
+        self.as_of = as_of
+        self.academic_year_id = academic_year_id
+        self.exam_period_id = exam_period_id
+        self.records = np.frombuffer(self._mmap, dtype=record_dtype(encoding_dim),
+                                     count=count, offset=HEADER.size)
+        self.periods = np.frombuffer(self._mmap, dtype=PERIOD_DTYPE, count=period_count,
+                                     offset=HEADER.size + records_size)
+        self._numbers = self.records["student_number"]
+        self._overrides: Dict[bytes, np.void] = {}
+        self.delta_as_of = None
+
+    def close(self) -> None:
+        self.records = None
+        self.periods = None
+        self._numbers = None
+        if getattr(self, "_mmap", None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Des vues numpy existent encore: le mmap sera libéré avec elles
+                pass
+        if getattr(self, "_file", None) is not None:
+            self._file.close()
+
+    def apply_delta(self, path: str) -> int:
+        """Charge un delta signé lié à cet instantané; retourne le nombre de changements"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size + SIGNATURE_SIZE:
+            raise ValueError("Delta file truncated")
+        body, signature = data[:-SIGNATURE_SIZE], data[-SIGNATURE_SIZE:]
+        if not hmac.compare_digest(_sign(self.key, body), signature):
+            raise ValueError("Offline delta signature mismatch")
+        (magic, version, kind, count, encoding_dim, as_of,
+         _year, _period, base_digest, _periods) = HEADER.unpack_from(body, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or kind != KIND_DELTA or base_digest != self.digest[:16]:
+            raise ValueError("Delta does not belong to this snapshot")
+        if self.delta_as_of and as_of <= self.delta_as_of:
+            return 0
+        changes = np.frombuffer(body, dtype=record_dtype(encoding_dim), count=count, offset=HEADER.size)
+        for record in changes:
+            self._overrides[bytes(record["student_number"])] = record
+        self.delta_as_of = as_of
+        return count
+
+    def lookup(self, student_number: str) -> Optional[dict]:
+        """Recherche dichotomique d'un étudiant (delta prioritaire)"""
+        key = student_number.encode("ascii", "ignore")
+        override = self._overrides.get(key)
+        index = int(np.searchsorted(self._numbers, key))
+        base = self.records[index] if index < len(self._numbers) and self._numbers[index] == key else None
+        if base is None and override is None:
+            return None
+        source = override if override is not None else base
+        flags = int(source["flags"])
+        if flags & FLAG_REVOKED:
+            return None
+        face = base["face"] if base is not None and int(base["flags"]) & FLAG_HAS_FACE else None
+        return {
+            "student_number": student_number,
+            "password_hash": bytes(source["password_hash"]).decode("ascii"),
+            "eligible": bool(flags & FLAG_ELIGIBLE),
+            "full_access": bool(flags & FLAG_FULL_ACCESS),
+            "exam_period_only": bool(flags & FLAG_EXAM_PERIOD_ONLY),
+            "expires_at": int(source["expires_at"]) or None,
+            "face_encoding": face,
+        }
+
+    def in_exam_period(self, now: Optional[datetime] = None) -> bool:
+        """`now` tombe dans une période d'examen de l'année de l'instantané"""
+        if self.periods is None or not len(self.periods):
+            return False
+        now_ts = int((now or datetime.now()).timestamp())
+        return bool(np.any((self.periods["start"] <= now_ts) & (now_ts < self.periods["end"])))
+
+    def is_eligible(self, entry: dict, now: Optional[datetime] = None) -> bool:
+        """Seuil atteint et code valide à `now` (même règle que `is_access_code_valid`)"""
+        now = now or datetime.now()
+        expires_at = entry["expires_at"]
+        if not entry["eligible"] or (expires_at and now.timestamp() > expires_at):
+            return False
+        return not entry["exam_period_only"] or self.in_exam_period(now)
+
+    def verify(self, student_number: str, password: str,
+               face_encoding: Optional[np.ndarray] = None, tolerance: float = 0.5,
+               now: Optional[datetime] = None) -> dict:
+        """Vérification locale: mêmes clés de résultat que AccessController.verify_access"""
+        result = {
+            "access_granted": False,
+            "reason": "Unknown student",
+            "password_valid": False,
+            "face_valid": False,
+            "finance_valid": False,
+            "student_id": None,
+            "offline": True,
+        }
+        entry = self.lookup(student_number)
+        if not entry or not PasswordHasher.verify_password(password, entry["password_hash"]):
+            result["reason"] = "Invalid password"
+            return result
+        result["password_valid"] = True
+
+        stored = entry["face_encoding"]
+        if stored is not None:
+            if face_encoding is None:
+                result["reason"] = "Face recognition failed"
+                return result
+            distance = float(np.linalg.norm(stored.astype(np.float64) - face_encoding))
+            if distance > tolerance:
+                result["reason"] = "Face recognition failed"
+                return result
+        result["face_valid"] = True
+
+        if not self.is_eligible(entry, now):
+            result["reason"] = "Financial threshold not reached or access code not valid"
+            return result
+
+        result["finance_valid"] = True
+        result["access_granted"] = True
+        result["reason"] = "Access granted (offline)"
+        return result
@@ -3,6 +3,7 @@ Module d'authentification et reconnaissance faciale
 Exports publics suivant le principe d'encapsulation
 """
 from app.services.auth.authentication_service import AuthenticationService
+from app.services.auth.login_throttle import LoginThrottle, login_throttle
 from app.services.auth.face_recognition_service import (
     FaceRecognitionService,
     MockFaceRecognitionService
@@ -12,6 +13,8 @@ from app.services.auth.face_recognition_config import FACE_CONFIG
 
 __all__ = [
     'AuthenticationService',
+    'LoginThrottle',
+    'login_throttle',
     'FaceRecognitionService',
     'MockFaceRecognitionService',
     'IFaceRecognitionService',
@@ -2,21 +2,33 @@
 import logging
 import secrets
 from typing import Optional
+from mysql.connector import errorcode
 from core.security.password_hasher import PasswordHasher
 from core.security.validators import Validators
 from core.models.student import Student
 from core.database.connection import DatabaseConnection
+from app.services.auth.login_throttle import login_throttle
+from app.services.finance.finance_aggregate_service import FinanceAggregateService
+from app.services.finance.finance_projections import STUDENT_AUTH_COLUMNS, select_list
 
 logger = logging.getLogger(__name__)
 
 
 class AuthenticationService:
     """Service d'authentification pour les étudiants et administrateurs"""
+
+    _STUDENT_IDENTITY_COLUMNS = (
+        "'student' AS role, id, student_number AS login, student_number, email, "
+        "firstname, lastname, password_hash"
+    )
+    _dummy_hash = None
     
     def __init__(self):
         self.db = DatabaseConnection()
         self.password_hasher = PasswordHasher()
         self.validators = Validators()
+        self.throttle = login_throttle
+        self.aggregates = FinanceAggregateService()
 
     def _get_table_columns(self, table_name: str) -> set:
         try:
@@ -68,7 +80,9 @@ class AuthenticationService:
                 password_hash
             )
             
-            self.db.execute_update(query, params)
+            with self.db.transaction() as cursor, \
+                    self.aggregates.track(cursor, "s.student_number = %s", (student.student_number,)):
+                cursor.execute(query, params)
             logger.info(f"Student {student.student_number} registered successfully")
             return True
             
@@ -88,8 +102,8 @@ class AuthenticationService:
             Dictionnaire avec les données de l'étudiant ou None
         """
         try:
-            # Récupérer l'étudiant de la base
-            query = "SELECT * FROM student WHERE student_number = %s"
+            # Récupérer l'étudiant de la base (sans photo ni encodage du visage)
+            query = f"SELECT {select_list(STUDENT_AUTH_COLUMNS)} FROM student WHERE student_number = %s"
             results = self.db.execute_query(query, (student_number,))
             
             if not results:
@@ -132,8 +146,10 @@ class AuthenticationService:
             logger.error(f"Error authenticating admin: {e}")
             return None
 
-    def authenticate(self, identifier: str, password: str):
-        """Authentifie par numéro d'étudiant ou email.
+    def authenticate(self, identifier: str, password: str, access_point: str = "admin_ui"):
+        """Authentifie un administrateur, un matricule ou un email.
+
+        Les rafales d'échecs sont rejetées par le limiteur avant tout calcul bcrypt.
 
         Returns:
             (user_dict, error_message)
@@ -141,35 +157,83 @@ class AuthenticationService:
         if not identifier or not password:
             return None, "Please enter credentials"
 
-        # 1) Try admin
-        admin = self.authenticate_admin(identifier, password)
-        if admin:
-            admin["role"] = "admin"
-            return admin, None
+        allowed, retry_after = self.throttle.acquire(identifier, access_point)
+        if not allowed:
+            logger.warning(f"Login throttled for {identifier} at {access_point} ({retry_after:.0f}s)")
+            return None, f"Too many attempts. Retry in {int(retry_after) + 1}s"
 
-        # 2) Try student number
-        user = self.authenticate_student(identifier, password)
+        user, error = self._authenticate_credentials(identifier, password)
         if user:
-            user["role"] = "student"
-            return user, None
+            self.throttle.record_success(identifier, access_point)
+        elif error == "Invalid credentials":
+            self.throttle.record_failure(identifier, access_point)
+        return user, error
 
-        # 3) Try email
+    def _authenticate_credentials(self, identifier: str, password: str):
+        """Vérifie les identifiants: une seule requête, une seule vérification bcrypt"""
         try:
-            query = "SELECT * FROM student WHERE email = %s"
-            results = self.db.execute_query(query, (identifier,))
-            if not results:
-                return None, "Invalid credentials"
+            candidate = self.resolve_identity(identifier)
+        except Exception as e:
+            logger.error(f"Error resolving identity: {e}")
+            return None, "Authentication error"
 
-            student = results[0]
-            if not self.password_hasher.verify_password(password, student['password_hash']):
-                return None, "Invalid credentials"
+        # Hash factice si le compte n'existe pas: même coût bcrypt, pas d'oracle temporel
+        password_hash = candidate.pop("password_hash", None) if candidate else None
+        valid = self.password_hasher.verify_password(password, password_hash or self._get_dummy_hash())
+        if not candidate or not password_hash or not valid:
+            logger.warning(f"Authentication failed for {identifier}")
+            return None, "Invalid credentials"
+
+        logger.info(f"{candidate['role'].capitalize()} {identifier} authenticated successfully")
+        return candidate, None
+
+    def resolve_identity(self, identifier: str) -> Optional[dict]:
+        """Résout l'identifiant vers un seul compte (admin, matricule ou email)
 
-            student["role"] = "student"
-            logger.info(f"Student {student.get('email')} authenticated successfully")
-            return student, None
+        Seules les colonnes nécessaires sont lues (pas de photo ni d'encodage facial).
+        Les administrateurs sont prioritaires sur un matricule ou un email identique
+        (un nom d'utilisateur admin peut être une adresse email).
+        """
+        identifier = (identifier or "").strip()
+        if not identifier:
+            return None
+
+        student_filter = "email = %s" if "@" in identifier else "student_number = %s"
+        query = f"""
+            SELECT 'admin' AS role, id, username AS login, NULL AS student_number, NULL AS email,
+                   NULL AS firstname, NULL AS lastname, password_hash, 0 AS priority
+            FROM administrator
+            WHERE username = %s AND is_active = 1
+            UNION ALL
+            SELECT {self._STUDENT_IDENTITY_COLUMNS}, 1 AS priority
+            FROM student
+            WHERE {student_filter}
+            ORDER BY priority
+            LIMIT 1
+        """
+        try:
+            rows = self.db.execute_query(query, (identifier, identifier))
         except Exception as e:
-            logger.error(f"Error authenticating by email: {e}")
-            return None, "Authentication error"
+            # Seule une table administrator absente (bases de test) autorise le repli étudiant;
+            # connexion perdue, verrou ou colonne manquante: l'erreur remonte
+            if getattr(e, "errno", None) != errorcode.ER_NO_SUCH_TABLE or "administrator" not in str(e):
+                raise
+            logger.warning(f"administrator table missing, student-only identity lookup: {e}")
+            rows = self.db.execute_query(
+                f"SELECT {self._STUDENT_IDENTITY_COLUMNS} FROM student WHERE {student_filter} LIMIT 1",
+                (identifier,)
+            )
+        if not rows:
+            return None
+        row = rows[0]
+        row.pop("priority", None)
+        return row
+
+    @classmethod
+    def _get_dummy_hash(cls) -> str:
+        if cls._dummy_hash is None:
+            cls._dummy_hash = PasswordHasher.hash_password(secrets.token_urlsafe(16))
+        return cls._dummy_hash
     
     def change_password(self, student_number: str, old_password: str, new_password: str) -> bool:
         """
@@ -262,7 +326,9 @@ class AuthenticationService:
             placeholders = ", ".join(["%s"] * len(insert_columns))
             columns_sql = ", ".join(insert_columns)
             query = f"INSERT INTO student ({columns_sql}) VALUES ({placeholders})"
-            self.db.execute_update(query, tuple(insert_values))
+            with self.db.transaction() as cursor, \
+                    self.aggregates.track(cursor, "s.student_number = %s", (student.student_number,)):
+                cursor.execute(query, tuple(insert_values))
 
             result = self.db.execute_query(
                 "SELECT id FROM student WHERE student_number = %s",
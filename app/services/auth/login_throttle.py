@@ -0,0 +1,138 @@
+"""Limitation des tentatives de connexion avant la vérification bcrypt
+
+Chaque vérification bcrypt (coût 12) occupe un cœur pendant des centaines de
+millisecondes. Ce module rejette tôt, sans hacher, les rafales de codes erronés:
+
+- un seau à jetons par (identifiant, point d'accès) et un par point d'accès;
+- un délai exponentiel après chaque échec, remis à zéro au succès;
+- une table bornée en mémoire (éviction LRU) et des métriques de rejet.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ThrottleState:
+    tokens: float
+    updated_at: float
+    failures: int = 0
+    blocked_until: float = 0.0
+
+
+class LoginThrottle:
+    """Seau à jetons + délai exponentiel, borné en mémoire et thread-safe"""
+
+    def __init__(self, capacity: int = None, refill_per_min: float = None,
+                 point_capacity: int = None, point_refill_per_min: float = None,
+                 backoff_base_s: float = None, backoff_max_s: float = None,
+                 max_entries: int = None, clock=time.monotonic):
+        self.capacity = capacity or settings.LOGIN_THROTTLE_CAPACITY
+        self.refill_per_s = (refill_per_min or settings.LOGIN_THROTTLE_REFILL_PER_MIN) / 60.0
+        self.point_capacity = point_capacity or settings.LOGIN_THROTTLE_POINT_CAPACITY
+        self.point_refill_per_s = (point_refill_per_min or settings.LOGIN_THROTTLE_POINT_REFILL_PER_MIN) / 60.0
+        self.backoff_base_s = backoff_base_s if backoff_base_s is not None else settings.LOGIN_THROTTLE_BACKOFF_BASE_S
+        self.backoff_max_s = backoff_max_s or settings.LOGIN_THROTTLE_BACKOFF_MAX_S
+        self.max_entries = max_entries or settings.LOGIN_THROTTLE_MAX_ENTRIES
+        self._clock = clock
+        self._states: "OrderedDict[tuple, _ThrottleState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "allowed": 0,
+            "rejected_rate": 0,
+            "rejected_backoff": 0,
+            "rejected_access_point": 0,
+            "failures": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def _key(identifier: str, access_point: str) -> tuple:
+        return ((identifier or "").strip().lower(), access_point or "")
+
+    def _state(self, key: tuple, capacity: int, now: float) -> _ThrottleState:
+        state = self._states.get(key)
+        if state is None:
+            state = _ThrottleState(tokens=float(capacity), updated_at=now)
+            self._states[key] = state
+            if len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+                self._metrics["evictions"] += 1
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    @staticmethod
+    def _refill(state: _ThrottleState, capacity: int, rate: float, now: float) -> None:
+        state.tokens = min(float(capacity), state.tokens + (now - state.updated_at) * rate)
+        state.updated_at = now
+
+    def acquire(self, identifier: str, access_point: str = "") -> Tuple[bool, float]:
+        """Consomme une tentative; retourne (autorisé, secondes avant nouvel essai)"""
+        now = self._clock()
+        with self._lock:
+            key = self._key(identifier, access_point)
+            state = self._state(key, self.capacity, now)
+            if state.blocked_until > now:
+                self._metrics["rejected_backoff"] += 1
+                return False, state.blocked_until - now
+
+            self._refill(state, self.capacity, self.refill_per_s, now)
+            if state.tokens < 1:
+                self._metrics["rejected_rate"] += 1
+                return False, (1 - state.tokens) / self.refill_per_s if self.refill_per_s else self.backoff_max_s
+
+            point = self._state((None, access_point or ""), self.point_capacity, now)
+            self._refill(point, self.point_capacity, self.point_refill_per_s, now)
+            if point.tokens < 1:
+                self._metrics["rejected_access_point"] += 1
+                return False, (1 - point.tokens) / self.point_refill_per_s if self.point_refill_per_s else self.backoff_max_s
+
+            state.tokens -= 1
+            point.tokens -= 1
+            self._metrics["allowed"] += 1
+            return True, 0.0
+
+    def record_failure(self, identifier: str, access_point: str = "") -> float:
+        """Enregistre un échec et retourne le délai de blocage appliqué"""
+        now = self._clock()
+        with self._lock:
+            state = self._state(self._key(identifier, access_point), self.capacity, now)
+            state.failures += 1
+            delay = min(self.backoff_base_s * (2 ** (state.failures - 1)), self.backoff_max_s)
+            state.blocked_until = now + delay
+            self._metrics["failures"] += 1
+            if state.failures >= 5:
+                logger.warning(f"Repeated login failures for {identifier!r} at {access_point!r}: "
+                               f"{state.failures} (blocked {delay:.0f}s)")
+            return delay
+
+    def record_success(self, identifier: str, access_point: str = "") -> None:
+        """Réinitialise l'état après une authentification réussie"""
+        with self._lock:
+            self._states.pop(self._key(identifier, access_point), None)
+
+    def get_metrics(self) -> dict:
+        """Compteurs de rejets pour le tableau de bord"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["tracked_keys"] = len(self._states)
+        return metrics
+
+    def reset(self, identifier: Optional[str] = None, access_point: str = "") -> None:
+        """Débloque un identifiant (ou tout) - action administrateur"""
+        with self._lock:
+            if identifier is None:
+                self._states.clear()
+            else:
+                self._states.pop(self._key(identifier, access_point), None)
+
+
+# Instance partagée par tous les services d'authentification du processus
+login_throttle = LoginThrottle()
@@ -2,6 +2,10 @@
 import logging
 from datetime import datetime, timedelta
 from core.database.connection import DatabaseConnection
+from app.services.finance.eligibility_materializer import eligibility_index
+from app.services.finance.finance_aggregate_service import FinanceAggregateService
+from app.services.integration.notification_ledger import delivery_ledger
+from app.services.integration.notification_outbox import notification_outbox
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +16,18 @@ class DashboardService:
     def __init__(self):
         try:
             self.db_connection = DatabaseConnection()
+            self.aggregates = FinanceAggregateService()
             logger.info("[Dashboard] Database connection pool initialized successfully")
         except Exception as e:
             logger.error(f"[Dashboard] Database connection error: {str(e)[:100]}")
             self.db_connection = None
+            self.aggregates = None
+
+    def _finance_totals(self):
+        """Ligne globale de finance_aggregate (lecture par clé primaire), None si indisponible"""
+        if not self.aggregates:
+            return None
+        return self.aggregates.get_overall()
     
     def get_total_students(self) -> int:
         """Récupère le nombre total d'étudiants actifs"""
@@ -37,6 +49,9 @@ class DashboardService:
         """Récupère le nombre d'étudiants éligibles aux examens"""
         if not self.db_connection:
             return 0
+        totals = self._finance_totals()
+        if totals:
+            return int(totals["eligible_count"])
         try:
             db = self.db_connection.get_connection()
             cursor = db.cursor()
@@ -58,6 +73,9 @@ class DashboardService:
         """Récupère le nombre d'étudiants non éligibles"""
         if not self.db_connection:
             return 0
+        totals = self._finance_totals()
+        if totals:
+            return int(totals["student_count"]) - int(totals["eligible_count"])
         try:
             db = self.db_connection.get_connection()
             cursor = db.cursor()
@@ -75,6 +93,16 @@ class DashboardService:
             logger.error(f"Erreur non_eligible_students: {e}")
             return 0
     
+    def get_exam_access_eligible(self, academic_year_id: int = None, exam_period_id: int = None) -> int:
+        """Étudiants autorisés à entrer en salle maintenant (seuil + code valide), comptés sur bitsets"""
+        if not self.db_connection:
+            return 0
+        try:
+            return eligibility_index.count(academic_year_id, exam_period_id)
+        except Exception as e:
+            logger.error(f"Erreur exam_access_eligible: {e}")
+            return 0
+
     def get_access_granted(self) -> int:
         """Nombre d'accès accordés (dernières 24h)"""
         if not self.db_connection:
@@ -119,6 +147,9 @@ class DashboardService:
         """Montant total collecté auprès des étudiants"""
         if not self.db_connection:
             return 0.0
+        totals = self._finance_totals()
+        if totals:
+            return float(totals["revenue"])
         try:
             db = self.db_connection.get_connection()
             cursor = db.cursor()
@@ -178,6 +209,12 @@ class DashboardService:
         """Récupère le taux de complétion des profils financiers"""
         if not self.db_connection:
             return {"total": 0, "eligible": 0, "percentage": 0}
+        totals = self._finance_totals()
+        if totals:
+            total = int(totals["student_count"])
+            eligible = int(totals["eligible_count"])
+            percentage = (eligible / total) * 100 if total else 0
+            return {"total": total, "eligible": eligible, "percentage": percentage}
         try:
             db = self.db_connection.get_connection()
             cursor = db.cursor()
@@ -235,6 +272,13 @@ class DashboardService:
         """Récupère les étudiants par statut de paiement"""
         if not self.db_connection:
             return {"never_paid": 0, "partial_paid": 0, "eligible": 0}
+        totals = self._finance_totals()
+        if totals:
+            return {
+                "never_paid": int(totals["never_paid_count"]),
+                "partial_paid": int(totals["partial_paid_count"]),
+                "eligible": int(totals["eligible_count"])
+            }
         try:
             db = self.db_connection.get_connection()
             cursor = db.cursor()
@@ -371,3 +415,32 @@ class DashboardService:
         except Exception as e:
             logger.error(f"Erreur faculty_stats_photos: {e}")
             return []
+
+    def get_notification_metrics(self, hours: int = 24) -> dict:
+        """Livraison des notifications: totaux et latences par canal et par voie, série horaire, file
+
+        {"channels": {canal: {sent, retried, dead, success_rate, avg_latency_ms, latency_ms_max,
+                              avg_queue_ms, slow, latency (p50/p95/p99 de la dernière heure)}},
+         "lanes": {voie: {..., queue_latency (p50/p95/p99 de l'attente en file)}},
+         "hourly": [...], "queue": {canal: {statut: nombre}},
+         "backlog": {canal: {voie: {ready, oldest_wait_s}}}}
+        """
+        try:
+            # Les tentatives encore en tampon sont comptées dans les agrégats lus
+            delivery_ledger.flush()
+            channels = delivery_ledger.get_channel_summary(hours)
+            for channel, summary in channels.items():
+                summary["latency"] = delivery_ledger.get_latency_percentiles(channel)
+            lanes = delivery_ledger.get_channel_summary(hours, by="lane")
+            for lane, summary in lanes.items():
+                summary["queue_latency"] = delivery_ledger.get_latency_percentiles(lane=lane, metric="queue_ms")
+            return {
+                "channels": channels,
+                "lanes": lanes,
+                "hourly": delivery_ledger.get_hourly(hours),
+                "queue": notification_outbox.get_stats(),
+                "backlog": notification_outbox.get_lane_backlog(),
+            }
+        except Exception as e:
+            logger.error(f"Erreur notification_metrics: {e}")
+            return {"channels": {}, "lanes": {}, "hourly": [], "queue": {}, "backlog": {}}
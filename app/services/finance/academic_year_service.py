@@ -3,6 +3,7 @@ import logging
 from datetime import datetime, date
 from typing import Optional, List
 from core.database.connection import DatabaseConnection
+from app.services.finance.exam_calendar import exam_calendar
 
 logger = logging.getLogger(__name__)
 
@@ -102,6 +103,7 @@ class AcademicYearService:
             self.db.execute_update(query, (
                 name, start_date, end_date, threshold_amount, final_fee, partial_valid_days, 1
             ))
+            exam_calendar.invalidate()
             return True
         except Exception as e:
             logger.error(f"Error creating academic year: {e}")
@@ -127,6 +129,7 @@ class AcademicYearService:
                 insert_cmd = "INSERT INTO academic_year (year_name, threshold_amount, final_fee, partial_valid_days, is_active) VALUES (%s, %s, %s, %s, 1)"
                 cursor.execute(insert_cmd, (year_name, str(threshold_amount), str(final_fee), partial_valid_days))
                 connection.commit()
+                exam_calendar.invalidate()
                 
                 # Récupérer l'ID inséré dans la MÊME session
                 cursor.execute("SELECT LAST_INSERT_ID() as year_id")
@@ -161,6 +164,7 @@ class AcademicYearService:
                 VALUES (%s, %s, %s, %s)
             """
             self.db.execute_update(query, (academic_year_id, name, start_date, end_date))
+            exam_calendar.invalidate()
             return True
         except Exception as e:
             logger.error(f"Error adding exam period: {e}")
@@ -180,17 +184,17 @@ class AcademicYearService:
             return []
 
     def is_within_exam_period(self, academic_year_id: int, when: Optional[datetime] = None) -> bool:
-        """Vérifie si la date courante est dans une période d'examen"""
+        """Vérifie si la date courante est dans une période d'examen (calendrier en mémoire)"""
         try:
-            when = when or datetime.now()
-            query = """
-                SELECT COUNT(*) as cnt
-                FROM exam_period
-                WHERE academic_year_id = %s
-                  AND %s BETWEEN start_date AND end_date
-            """
-            rows = self.db.execute_query(query, (academic_year_id, when))
-            return bool(rows and rows[0].get("cnt"))
+            return exam_calendar.is_within(academic_year_id, when)
         except Exception as e:
             logger.error(f"Error checking exam period: {e}")
             return False
+
+    def get_current_period_end(self, academic_year_id: int, when: Optional[datetime] = None) -> Optional[datetime]:
+        """Fin de la période d'examen en cours (None hors période)"""
+        return exam_calendar.current_period_end(academic_year_id, when)
+
+    def get_next_period_start(self, academic_year_id: int, when: Optional[datetime] = None) -> Optional[datetime]:
+        """Début de la prochaine période d'examen (None s'il n'y en a plus)"""
+        return exam_calendar.next_period_start(academic_year_id, when)
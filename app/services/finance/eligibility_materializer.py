@@ -0,0 +1,309 @@
+"""Ensemble matérialisé des étudiants éligibles (bitsets par année académique)
+
+L'éligibilité d'un étudiant combine le seuil (`amount_paid >= threshold_required`),
+le type et l'expiration du code d'accès, et la période d'examen en cours pour
+les codes complets (`is_access_code_valid` + `is_within_exam_period`). Au lieu
+de recalculer tout cela à chaque passage de porte, les profils sont chargés une
+fois en bitsets NumPy (un bit par student_id):
+
+- `partial`: seuil atteint, code non expiré, valide hors période d'examen
+  (code partiel, pas encore de code, ou profil sans année académique);
+- `full`: seuil atteint, code complet non expiré, valide seulement pendant une
+  période d'examen de son année.
+
+Pendant une période d'examen l'ensemble éligible est `partial | full`, en dehors
+c'est `partial`. La porte lit un bit (O(1)), le tableau de bord compte les bits
+(O(n/64) mots). Les paiements, émissions de codes et déploiements de seuils
+rafraîchissent les étudiants concernés; les périodes viennent du calendrier
+d'examens partagé, les expirations sont appliquées à la lecture via un tas, et
+l'instantané est rechargé après
+ELIGIBILITY_SNAPSHOT_TTL_S (changements faits par un autre processus).
+
+Un bit à zéro n'est donc pas un refus définitif: `FinanceService.is_eligible_now`
+revérifie en base avant de refuser l'accès.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from config.settings import ELIGIBILITY_SNAPSHOT_TTL_S
+from core.database.connection import DatabaseConnection
+from app.services.finance.exam_calendar import exam_calendar
+
+logger = logging.getLogger(__name__)
+
+# Clé des profils sans année académique (jamais soumis aux périodes d'examen)
+NO_YEAR = 0
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:
+    _BYTE_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray) -> int:
+        return int(_BYTE_POPCOUNT[words.view(np.uint8)].sum(dtype=np.int64))
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, dt_time.min)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return None
+
+
+class _Bitset:
+    """Tableau de mots uint64, un bit par student_id"""
+
+    __slots__ = ("words",)
+
+    def __init__(self, size: int = 0):
+        self.words = np.zeros((size >> 6) + 1, dtype=np.uint64)
+
+    def _grow(self, student_id: int) -> None:
+        needed = (student_id >> 6) + 1
+        if needed > len(self.words):
+            self.words = np.concatenate(
+                (self.words, np.zeros(max(needed, len(self.words) * 2) - len(self.words), dtype=np.uint64))
+            )
+
+    def add(self, student_id: int) -> None:
+        self._grow(student_id)
+        self.words[student_id >> 6] |= np.uint64(1 << (student_id & 63))
+
+    def discard(self, student_id: int) -> None:
+        if (student_id >> 6) < len(self.words):
+            self.words[student_id >> 6] &= ~np.uint64(1 << (student_id & 63))
+
+    def __contains__(self, student_id: int) -> bool:
+        word = student_id >> 6
+        return word < len(self.words) and bool((int(self.words[word]) >> (student_id & 63)) & 1)
+
+    def count(self) -> int:
+        return _popcount(self.words)
+
+    def union(self, other: "_Bitset") -> np.ndarray:
+        size = max(len(self.words), len(other.words))
+        merged = np.zeros(size, dtype=np.uint64)
+        merged[:len(self.words)] |= self.words
+        merged[:len(other.words)] |= other.words
+        return merged
+
+    @staticmethod
+    def ids(words: np.ndarray) -> np.ndarray:
+        bits = np.unpackbits(words.view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits)
+
+
+class EligibilityMaterializer:
+    """Bitsets d'éligibilité par année académique, tenus à jour par événements"""
+
+    def __init__(self, ttl_s: float = None):
+        self.ttl_s = ELIGIBILITY_SNAPSHOT_TTL_S if ttl_s is None else ttl_s
+        self._db = None
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self._partial: Dict[int, _Bitset] = {}
+        self._full: Dict[int, _Bitset] = {}
+        self._year_of: Dict[int, int] = {}
+        self._expires: Dict[int, datetime] = {}
+        self._expiry_heap: List[tuple] = []
+        self._columns: set = set()
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    # ---------- Chargement ----------
+
+    def _profile_query(self, where_sql: str = "") -> str:
+        optional = [
+            name if name in self._columns else f"NULL AS {name}"
+            for name in ("academic_year_id", "access_code_type", "access_code_expires_at")
+        ]
+        return f"""
+            SELECT student_id, amount_paid, threshold_required, {', '.join(optional)}
+            FROM finance_profile
+            {where_sql}
+        """
+
+    def _finance_profile_columns(self) -> set:
+        rows = self.db.execute_query(
+            """
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'finance_profile'
+            """
+        ) or []
+        return {row.get("COLUMN_NAME") for row in rows if row.get("COLUMN_NAME")}
+
+    def load(self) -> int:
+        """Recharge l'instantané complet (une requête); retourne le nombre de profils"""
+        try:
+            self._columns = self._finance_profile_columns()
+            rows = self.db.execute_query(self._profile_query()) or []
+        except Exception as e:
+            logger.error(f"Error loading eligibility snapshot: {e}")
+            return 0
+        now = datetime.now()
+        with self._lock:
+            self._partial, self._full = {}, {}
+            self._year_of, self._expires, self._expiry_heap = {}, {}, []
+            for row in rows:
+                self._apply_row(row, now)
+            heapq.heapify(self._expiry_heap)
+            self._loaded_at = time.monotonic()
+        logger.info(f"Eligibility snapshot loaded: {len(rows)} profile(s) in {len(self._partial)} academic year(s)")
+        return len(rows)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s:
+            self.load()
+
+    def invalidate(self) -> None:
+        """Force un rechargement complet à la prochaine lecture"""
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- Mise à jour par événements ----------
+
+    def _clear_student(self, student_id: int) -> None:
+        year_id = self._year_of.pop(student_id, None)
+        if year_id is not None:
+            self._partial[year_id].discard(student_id)
+            self._full[year_id].discard(student_id)
+        self._expires.pop(student_id, None)
+
+    def _apply_row(self, row: dict, now: datetime) -> None:
+        """Place un profil dans les bitsets de son année (appelé sous verrou)"""
+        student_id = int(row["student_id"])
+        self._clear_student(student_id)
+        year_id = int(row.get("academic_year_id") or NO_YEAR)
+        self._year_of[student_id] = year_id
+        partial = self._partial.setdefault(year_id, _Bitset(student_id))
+        full = self._full.setdefault(year_id, _Bitset(student_id))
+
+        amount_paid = Decimal(str(row.get("amount_paid") or 0))
+        threshold = Decimal(str(row.get("threshold_required") or 0))
+        if amount_paid < threshold:
+            return
+        expires_at = _as_datetime(row.get("access_code_expires_at"))
+        if expires_at is not None:
+            if now > expires_at:
+                return
+            self._expires[student_id] = expires_at
+            self._expiry_heap.append((expires_at, student_id))
+        if row.get("access_code_type") == "full" and year_id != NO_YEAR:
+            full.add(student_id)
+        else:
+            partial.add(student_id)
+
+    def refresh_students(self, student_ids: Iterable[int]) -> None:
+        """Relit les profils de quelques étudiants après un paiement, un code ou un seuil
+
+        Sans effet si aucun instantané n'est chargé (il sera construit à la demande).
+        """
+        ids = sorted({int(student_id) for student_id in student_ids or []})
+        if not ids or self._loaded_at is None:
+            return
+        try:
+            placeholders = ", ".join(["%s"] * len(ids))
+            rows = self.db.execute_query(
+                self._profile_query(f"WHERE student_id IN ({placeholders})"), tuple(ids)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error refreshing eligibility for {len(ids)} student(s): {e}")
+            self.invalidate()
+            return
+        now = datetime.now()
+        with self._lock:
+            found = set()
+            for row in rows:
+                self._apply_row(row, now)
+                found.add(int(row["student_id"]))
+            for student_id in set(ids) - found:
+                self._clear_student(student_id)
+            heapq.heapify(self._expiry_heap)
+
+    def _expire(self, now: datetime) -> None:
+        """Retire les codes arrivés à expiration depuis le chargement (appelé sous verrou)"""
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expires_at, student_id = heapq.heappop(heap)
+            # Entrée périmée si le profil a été relu entre-temps
+            if self._expires.get(student_id) == expires_at:
+                year_id = self._year_of.get(student_id)
+                if year_id is not None:
+                    self._partial[year_id].discard(student_id)
+                    self._full[year_id].discard(student_id)
+                del self._expires[student_id]
+
+    # ---------- Lecture ----------
+
+    def current_exam_period(self, academic_year_id: int, when: datetime = None) -> Optional[int]:
+        """exam_period_id de la période couvrant `when`, None hors période"""
+        if not academic_year_id:
+            return None
+        period = exam_calendar.current_period(academic_year_id, when)
+        return period["exam_period_id"] if period else None
+
+    def is_eligible(self, student_id: int, when: datetime = None) -> bool:
+        """Seuil atteint et code d'accès valide maintenant (test d'un bit)"""
+        self._ensure_loaded()
+        when = when or datetime.now()
+        with self._lock:
+            self._expire(when)
+            year_id = self._year_of.get(int(student_id))
+            if year_id is None:
+                return False
+            if int(student_id) in self._partial[year_id]:
+                return True
+            return int(student_id) in self._full[year_id] and \
+                self.current_exam_period(year_id, when) is not None
+
+    def _year_words(self, year_id: int, in_period: bool) -> np.ndarray:
+        partial = self._partial.get(year_id)
+        if partial is None:
+            return np.zeros(1, dtype=np.uint64)
+        return partial.union(self._full[year_id]) if in_period else partial.words
+
+    def count(self, academic_year_id: int = None, exam_period_id: int = None, when: datetime = None) -> int:
+        """Nombre d'étudiants éligibles (comptage de bits)
+
+        Args:
+            academic_year_id: Année à compter (toutes par défaut)
+            exam_period_id: Compter comme si cette période était en cours (codes complets inclus)
+            when: Instant de référence (maintenant par défaut)
+        """
+        self._ensure_loaded()
+        when = when or datetime.now()
+        with self._lock:
+            self._expire(when)
+            years = list(self._partial) if academic_year_id is None else [academic_year_id]
+            total = 0
+            for year_id in years:
+                in_period = exam_period_id is not None or self.current_exam_period(year_id, when) is not None
+                total += _popcount(self._year_words(year_id, in_period))
+            return total
+
+    def eligible_ids(self, academic_year_id: int, exam_period_id: int = None, when: datetime = None) -> List[int]:
+        """student_id éligibles d'une année (listes d'émargement, exports)"""
+        self._ensure_loaded()
+        when = when or datetime.now()
+        with self._lock:
+            self._expire(when)
+            in_period = exam_period_id is not None or self.current_exam_period(academic_year_id, when) is not None
+            return _Bitset.ids(self._year_words(academic_year_id, in_period)).tolist()
+
+
+# Instance partagée: les événements d'un service profitent aux portes du même processus
+eligibility_index = EligibilityMaterializer()
@@ -0,0 +1,147 @@
+"""Calendrier des périodes d'examen en mémoire (recherche par intervalle)
+
+Les périodes changent quelques fois par an mais sont consultées à chaque
+vérification d'accès. Elles sont chargées une fois par année académique en
+intervalles triés par date de début; la recherche se fait par `bisect`, sans
+requête. Le calendrier est rechargé par `add_exam_period`, à la création d'une
+année, et au plus tard après EXAM_CALENDAR_TTL_S (modifications faites par un
+autre processus).
+
+Les bornes sont des DATE: une période couvre entièrement sa journée de fin.
+"""
+import bisect
+import logging
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+from typing import Dict, List, Optional
+from config.settings import EXAM_CALENDAR_TTL_S
+from core.database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+
+def _to_datetime(value, end_of_day: bool = False) -> Optional[datetime]:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.date() if end_of_day else value
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, dt_time.max if end_of_day else dt_time.min)
+    return value
+
+
+class _YearCalendar:
+    """Intervalles d'une année triés par début, avec fin maximale cumulée"""
+
+    __slots__ = ("periods", "starts", "max_end")
+
+    def __init__(self, periods: List[dict]):
+        self.periods = sorted(periods, key=lambda period: period["start"])
+        self.starts = [period["start"] for period in self.periods]
+        self.max_end = []
+        for period in self.periods:
+            self.max_end.append(max(period["end"], self.max_end[-1]) if self.max_end else period["end"])
+
+    def covering(self, when: datetime) -> List[dict]:
+        """Périodes contenant `when` (plusieurs si elles se chevauchent)"""
+        found = []
+        index = bisect.bisect_right(self.starts, when) - 1
+        # max_end croissant: aucune période antérieure ne peut couvrir `when` au-delà
+        while index >= 0 and self.max_end[index] >= when:
+            if self.periods[index]["end"] >= when:
+                found.append(self.periods[index])
+            index -= 1
+        return found
+
+    def next_after(self, when: datetime) -> Optional[dict]:
+        index = bisect.bisect_right(self.starts, when)
+        return self.periods[index] if index < len(self.periods) else None
+
+
+class ExamCalendar:
+    """Périodes d'examen par année académique, servies depuis la mémoire"""
+
+    def __init__(self, ttl_s: float = None):
+        self.ttl_s = EXAM_CALENDAR_TTL_S if ttl_s is None else ttl_s
+        self._db = None
+        self._lock = threading.Lock()
+        self._years: Dict[int, _YearCalendar] = {}
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    def reload(self) -> int:
+        """Recharge toutes les périodes (une requête); retourne leur nombre"""
+        try:
+            rows = self.db.execute_query(
+                "SELECT * FROM exam_period ORDER BY academic_year_id, start_date"
+            ) or []
+        except Exception as e:
+            logger.error(f"Error loading exam calendar: {e}")
+            return 0
+        by_year: Dict[int, List[dict]] = {}
+        for row in rows:
+            start = _to_datetime(row.get("start_date"))
+            end = _to_datetime(row.get("end_date"), end_of_day=True)
+            if start is None or end is None:
+                continue
+            by_year.setdefault(int(row["academic_year_id"]), []).append({
+                "exam_period_id": row.get("exam_period_id") or row.get("id"),
+                "name": row.get("period_name") or row.get("name"),
+                "start": start,
+                "end": end,
+            })
+        with self._lock:
+            self._years = {year_id: _YearCalendar(periods) for year_id, periods in by_year.items()}
+            self._loaded_at = time.monotonic()
+        logger.info(f"Exam calendar loaded: {len(rows)} period(s) in {len(by_year)} academic year(s)")
+        return len(rows)
+
+    def invalidate(self) -> None:
+        """Rechargement à la prochaine lecture (période ajoutée, nouvelle année)"""
+        self._loaded_at = None
+
+    def _year(self, academic_year_id: int) -> Optional[_YearCalendar]:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s:
+            self.reload()
+        return self._years.get(int(academic_year_id)) if academic_year_id else None
+
+    # ---------- Lecture ----------
+
+    def get_periods(self, academic_year_id: int) -> List[dict]:
+        """[{exam_period_id, name, start, end}] triées par début"""
+        year = self._year(academic_year_id)
+        return list(year.periods) if year else []
+
+    def current_period(self, academic_year_id: int, when: datetime = None) -> Optional[dict]:
+        """Période en cours (celle qui se termine le plus tard si chevauchement)"""
+        year = self._year(academic_year_id)
+        if not year:
+            return None
+        covering = year.covering(when or datetime.now())
+        return max(covering, key=lambda period: period["end"]) if covering else None
+
+    def is_within(self, academic_year_id: int, when: datetime = None) -> bool:
+        return self.current_period(academic_year_id, when) is not None
+
+    def current_period_end(self, academic_year_id: int, when: datetime = None) -> Optional[datetime]:
+        """Fin de la période en cours, None hors période"""
+        period = self.current_period(academic_year_id, when)
+        return period["end"] if period else None
+
+    def next_period_start(self, academic_year_id: int, when: datetime = None) -> Optional[datetime]:
+        """Début de la prochaine période (strictement après `when`), None s'il n'y en a plus"""
+        year = self._year(academic_year_id)
+        if not year:
+            return None
+        period = year.next_after(when or datetime.now())
+        return period["start"] if period else None
+
+
+# Instance partagée: accès, éligibilité et tâches planifiées lisent le même calendrier
+exam_calendar = ExamCalendar()
@@ -0,0 +1,229 @@
+"""Agrégats financiers maintenus de façon incrémentale (tableau de bord)
+
+La table finance_aggregate contient une ligne par portée: globale, faculté,
+département et promotion. Les écritures qui modifient un profil financier
+(paiement, changement de seuil, inscription, désactivation) appliquent leur delta
+dans LA MÊME transaction via `track(...)`. Les KPI du tableau de bord deviennent
+des lectures par clé primaire, quel que soit le nombre d'étudiants.
+
+En cas de dérive (écriture manuelle en base, incident), `rebuild()` recalcule
+tout: voir scripts/rebuild_finance_aggregates.py.
+"""
+import logging
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+from core.database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+SCOPE_OVERALL = "overall"
+SCOPE_FACULTY = "faculty"
+SCOPE_DEPARTMENT = "department"
+SCOPE_PROMOTION = "promotion"
+
+# Compteurs maintenus pour chaque portée (même ordre que dans la table)
+AGGREGATE_FIELDS = ("student_count", "eligible_count", "never_paid_count", "partial_paid_count", "revenue")
+
+# Contribution des étudiants sélectionnés, par promotion
+_CONTRIBUTION_QUERY = """
+    SELECT COALESCE(p.id, 0) AS promotion_id,
+           COALESCE(p.department_id, 0) AS department_id,
+           COALESCE(d.faculty_id, 0) AS faculty_id,
+           SUM(COALESCE(s.is_active, 1) = 1) AS student_count,
+           SUM(COALESCE(s.is_active, 1) = 1 AND COALESCE(fp.is_eligible, 0) = 1) AS eligible_count,
+           SUM(COALESCE(s.is_active, 1) = 1 AND COALESCE(fp.amount_paid, 0) = 0) AS never_paid_count,
+           SUM(COALESCE(s.is_active, 1) = 1 AND COALESCE(fp.amount_paid, 0) > 0
+               AND COALESCE(fp.is_eligible, 0) = 0) AS partial_paid_count,
+           COALESCE(SUM(fp.amount_paid), 0) AS revenue
+    FROM student s
+    LEFT JOIN finance_profile fp ON fp.student_id = s.id
+    LEFT JOIN promotion p ON s.promotion_id = p.id
+    LEFT JOIN department d ON p.department_id = d.id
+    WHERE {where}
+    GROUP BY COALESCE(p.id, 0), COALESCE(p.department_id, 0), COALESCE(d.faculty_id, 0)
+"""
+
+
+class FinanceAggregateService:
+    """Lecture et maintenance incrémentale de finance_aggregate"""
+
+    _table_ready = False
+
+    def __init__(self):
+        self.db = DatabaseConnection()
+
+    def _ensure_table(self) -> None:
+        """Crée la table (et la remplit au premier démarrage) une fois par processus"""
+        if FinanceAggregateService._table_ready:
+            return
+        try:
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS finance_aggregate (
+                    scope ENUM('overall', 'faculty', 'department', 'promotion') NOT NULL,
+                    scope_id INT NOT NULL DEFAULT 0,
+                    student_count INT NOT NULL DEFAULT 0,
+                    eligible_count INT NOT NULL DEFAULT 0,
+                    never_paid_count INT NOT NULL DEFAULT 0,
+                    partial_paid_count INT NOT NULL DEFAULT 0,
+                    revenue DECIMAL(15, 2) NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (scope, scope_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            FinanceAggregateService._table_ready = True
+            # Table neuve ou vidée: la ligne globale sert de marqueur d'initialisation
+            if not self.get_aggregate():
+                self.rebuild()
+        except Exception as e:
+            logger.error(f"Error ensuring finance_aggregate table: {e}")
+
+    # ---------- Maintenance incrémentale ----------
+
+    @staticmethod
+    def _contributions(cursor, where_sql: str, params: tuple) -> Dict[Tuple[str, int], list]:
+        """Contribution (par portée) des étudiants filtrés par `where_sql`"""
+        cursor.execute(_CONTRIBUTION_QUERY.format(where=where_sql), params)
+        totals: Dict[Tuple[str, int], list] = {}
+        for row in cursor.fetchall():
+            row = row if isinstance(row, dict) else dict(zip(cursor.column_names, row))
+            values = [int(row[field] or 0) for field in AGGREGATE_FIELDS[:-1]]
+            values.append(Decimal(str(row["revenue"] or 0)))
+            keys = [(SCOPE_OVERALL, 0)]
+            if row["faculty_id"]:
+                keys.append((SCOPE_FACULTY, int(row["faculty_id"])))
+            if row["department_id"]:
+                keys.append((SCOPE_DEPARTMENT, int(row["department_id"])))
+            if row["promotion_id"]:
+                keys.append((SCOPE_PROMOTION, int(row["promotion_id"])))
+            for key in keys:
+                current = totals.setdefault(key, [0, 0, 0, 0, Decimal("0")])
+                for index, value in enumerate(values):
+                    current[index] += value
+        return totals
+
+    @staticmethod
+    def _apply(cursor, deltas: Dict[Tuple[str, int], list]) -> None:
+        """Ajoute les deltas non nuls (ordre stable des lignes: pas d'interblocage)"""
+        rows = [
+            (scope, scope_id, *[str(value) if isinstance(value, Decimal) else value for value in delta])
+            for (scope, scope_id), delta in sorted(deltas.items())
+            if any(delta)
+        ]
+        if not rows:
+            return
+        cursor.executemany(
+            """
+            INSERT INTO finance_aggregate
+                (scope, scope_id, student_count, eligible_count, never_paid_count, partial_paid_count, revenue)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                student_count = student_count + VALUES(student_count),
+                eligible_count = eligible_count + VALUES(eligible_count),
+                never_paid_count = never_paid_count + VALUES(never_paid_count),
+                partial_paid_count = partial_paid_count + VALUES(partial_paid_count),
+                revenue = revenue + VALUES(revenue)
+            """,
+            rows
+        )
+
+    @contextmanager
+    def track(self, cursor, where_sql: str, params: tuple = (), lock_sql: Optional[str] = None):
+        """Applique à la sortie le delta (après - avant) des étudiants filtrés
+
+        À ouvrir en premier dans la transaction: `lock_sql` (SELECT ... FOR UPDATE)
+        verrouille les profils avant la première lecture cohérente, sinon l'état
+        « avant » pourrait précéder un paiement concurrent déjà validé.
+
+        Usage:
+            with db.transaction() as cursor, aggregates.track_students(cursor, [student_id]):
+                cursor.execute("UPDATE finance_profile ...")
+        """
+        self._ensure_table()
+        if lock_sql:
+            cursor.execute(lock_sql, params)
+            cursor.fetchall()
+        before = self._contributions(cursor, where_sql, params)
+        yield
+        after = self._contributions(cursor, where_sql, params)
+        deltas = {}
+        for key in set(before) | set(after):
+            old = before.get(key, [0, 0, 0, 0, Decimal("0")])
+            new = after.get(key, [0, 0, 0, 0, Decimal("0")])
+            deltas[key] = [n - o for n, o in zip(new, old)]
+        self._apply(cursor, deltas)
+
+    def track_students(self, cursor, student_ids: Iterable[int]):
+        """`track` restreint à une liste d'étudiants (paiements, fiche étudiant)"""
+        student_ids = tuple(int(student_id) for student_id in student_ids) or (0,)
+        placeholders = ", ".join(["%s"] * len(student_ids))
+        return self.track(
+            cursor,
+            f"s.id IN ({placeholders})",
+            student_ids,
+            lock_sql=f"SELECT student_id FROM finance_profile WHERE student_id IN ({placeholders}) FOR UPDATE"
+        )
+
+    def rebuild(self) -> int:
+        """Recalcule entièrement la table (réparation); retourne le nombre de lignes"""
+        try:
+            FinanceAggregateService._table_ready = True
+            with self.db.transaction() as cursor:
+                cursor.execute("SELECT student_id FROM finance_profile FOR UPDATE")
+                cursor.fetchall()
+                totals = self._contributions(cursor, "1 = 1", ())
+                totals.setdefault((SCOPE_OVERALL, 0), [0, 0, 0, 0, Decimal("0")])
+                cursor.execute("DELETE FROM finance_aggregate")
+                self._apply(cursor, totals)
+                # La ligne globale existe même sans étudiant (marqueur d'initialisation)
+                cursor.execute(
+                    "INSERT IGNORE INTO finance_aggregate (scope, scope_id) VALUES (%s, 0)",
+                    (SCOPE_OVERALL,)
+                )
+            logger.info(f"Finance aggregates rebuilt: {len(totals)} row(s)")
+            return len(totals)
+        except Exception as e:
+            logger.error(f"Error rebuilding finance aggregates: {e}")
+            return 0
+
+    # ---------- Lecture ----------
+
+    def get_aggregate(self, scope: str = SCOPE_OVERALL, scope_id: int = 0) -> Optional[dict]:
+        """Lecture par clé primaire d'une ligne d'agrégat"""
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT student_count, eligible_count, never_paid_count, partial_paid_count, revenue
+                FROM finance_aggregate
+                WHERE scope = %s AND scope_id = %s
+                """,
+                (scope, scope_id)
+            )
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"Error reading finance aggregate {scope}/{scope_id}: {e}")
+            return None
+
+    def get_overall(self) -> Optional[dict]:
+        """Ligne globale (crée/initialise la table si nécessaire)"""
+        self._ensure_table()
+        return self.get_aggregate()
+
+    def get_scope_rows(self, scope: str) -> list:
+        """Toutes les lignes d'une portée (faculté, département ou promotion)"""
+        self._ensure_table()
+        try:
+            return self.db.execute_query(
+                """
+                SELECT scope_id, student_count, eligible_count, never_paid_count, partial_paid_count, revenue
+                FROM finance_aggregate
+                WHERE scope = %s
+                ORDER BY scope_id
+                """,
+                (scope,)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading finance aggregates for {scope}: {e}")
+            return []
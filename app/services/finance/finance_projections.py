@@ -0,0 +1,122 @@
+"""Projections étroites des profils financiers et des contacts étudiants
+
+La table student porte deux LONGBLOB (photo d'identité, encodage du visage):
+un `SELECT *` les transfère à chaque vérification de seuil ou notification.
+Chaque usage déclare ici les colonnes dont il a besoin; les accesseurs de
+FinanceService ne sélectionnent que celles-ci et renvoient des objets typés.
+
+scripts/verify_query_projections.py échoue si une méthode du chemin critique
+revient à `SELECT *` ou lit une colonne BLOB qu'elle n'utilise pas.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Optional
+
+# Colonnes volumineuses de student: jamais lues hors reconnaissance faciale / photo
+STUDENT_BLOB_COLUMNS = ("passport_photo_blob", "face_encoding")
+
+# Profil financier complet (écrans d'administration)
+FINANCE_PROFILE_COLUMNS = (
+    "id", "student_id", "amount_paid", "threshold_required", "last_payment_date", "is_eligible",
+    "academic_year_id", "access_code_issued_at", "access_code_expires_at", "access_code_type",
+    "final_fee", "created_at", "updated_at",
+)
+
+# Seuil et validité du code d'accès (portes, émission de codes)
+FINANCE_STATUS_COLUMNS = (
+    "student_id", "amount_paid", "threshold_required", "final_fee",
+    "academic_year_id", "access_code_type", "access_code_expires_at",
+)
+
+# Destinataire d'une notification
+STUDENT_CONTACT_COLUMNS = ("id", "firstname", "lastname", "email", "phone_number")
+
+# Authentification par numéro d'étudiant (sans photo ni encodage du visage)
+STUDENT_AUTH_COLUMNS = (
+    "id", "student_number", "firstname", "lastname", "email", "phone_number",
+    "promotion_id", "academic_year_id", "password_hash", "is_active",
+)
+
+# Listes d'étudiants (éligibles / non éligibles)
+STUDENT_LIST_COLUMNS = (
+    "id", "student_number", "firstname", "lastname", "email", "phone_number",
+    "promotion_id", "academic_year_id", "is_active",
+)
+
+
+def select_list(columns: Iterable[str], available: Optional[set] = None, alias: str = "") -> str:
+    """Liste SELECT explicite; les colonnes absentes du schéma valent NULL
+
+    Args:
+        columns: Colonnes voulues
+        available: Colonnes existantes (toutes supposées présentes si None)
+        alias: Alias de table à préfixer (ex: "s")
+    """
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(
+        f"{prefix}{name}" if available is None or name in available else f"NULL AS {name}"
+        for name in columns
+    )
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+@dataclass(frozen=True)
+class FinanceStatus:
+    """Seuil, frais et code d'accès d'un étudiant"""
+
+    student_id: int
+    amount_paid: Decimal
+    threshold_required: Decimal
+    final_fee: Optional[Decimal]
+    academic_year_id: Optional[int]
+    access_code_type: Optional[str]
+    access_code_expires_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row: dict) -> "FinanceStatus":
+        expires_at = row.get("access_code_expires_at")
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        final_fee = row.get("final_fee")
+        return cls(
+            student_id=int(row["student_id"]),
+            amount_paid=_decimal(row.get("amount_paid")),
+            threshold_required=_decimal(row.get("threshold_required")),
+            final_fee=_decimal(final_fee) if final_fee is not None else None,
+            academic_year_id=row.get("academic_year_id"),
+            access_code_type=row.get("access_code_type"),
+            access_code_expires_at=expires_at,
+        )
+
+    @property
+    def threshold_reached(self) -> bool:
+        return self.amount_paid >= self.threshold_required
+
+
+@dataclass(frozen=True)
+class StudentContact:
+    """Coordonnées nécessaires à une notification"""
+
+    id: int
+    firstname: Optional[str]
+    lastname: Optional[str]
+    email: Optional[str]
+    phone_number: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: dict) -> "StudentContact":
+        return cls(
+            id=int(row["id"]),
+            firstname=row.get("firstname"),
+            lastname=row.get("lastname"),
+            email=row.get("email"),
+            phone_number=row.get("phone_number"),
+        )
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.firstname} {self.lastname}"
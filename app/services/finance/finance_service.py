@@ -1,29 +1,58 @@
 """Service de gestion des finances"""
 import logging
 import random
-import threading
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional
+from config.settings import ACCESS_CODE_HASH_WORKERS, ACCESS_CODE_BATCH_SIZE
 from core.database.connection import DatabaseConnection
+from core.security.password_hasher import PasswordHasher
 from app.services.finance.academic_year_service import AcademicYearService
+from app.services.finance.eligibility_materializer import eligibility_index
+from app.services.finance.finance_aggregate_service import FinanceAggregateService
+from app.services.finance.finance_projections import (
+    FINANCE_PROFILE_COLUMNS, FINANCE_STATUS_COLUMNS, STUDENT_CONTACT_COLUMNS, STUDENT_LIST_COLUMNS,
+    FinanceStatus, StudentContact, select_list
+)
+from app.services.finance.revenue_rollup_service import RevenueRollupService
+from app.services.finance.side_effect_executor import finance_side_effects
+from app.services.finance.threshold_rollout import ThresholdRolloutService
 from app.services.integration.notification_service import NotificationService
+from app.services.integration.recipient_directory import recipient_directory
 from app.services.auth.authentication_service import AuthenticationService
 
 logger = logging.getLogger(__name__)
 
 
+def _hash_access_code(access_code: str) -> str:
+    """Hachage bcrypt exécuté dans un processus du pool (fonction picklable)"""
+    return PasswordHasher.hash_password(access_code)
+
+
 class FinanceService:
     """Service pour gérer les paiements et seuils financiers"""
+
+    _payment_history_ready = False
+    _payment_history_columns = None
+    _table_columns = {}
     
     def __init__(self):
         self.db = DatabaseConnection()
         self.academic_service = AcademicYearService()
+        self.aggregates = FinanceAggregateService()
+        self.rollups = RevenueRollupService()
+        self.eligibility = eligibility_index
+        self.threshold_rollout = ThresholdRolloutService(self)
         self.notification_service = NotificationService()
+        self.recipients = recipient_directory
         self.auth_service = AuthenticationService()
 
     def _ensure_payment_history_table(self) -> None:
         """Crée la table d'historique des paiements si nécessaire"""
+        # Le DDL provoque un commit implicite: une seule fois par processus
+        if FinanceService._payment_history_ready:
+            return
         try:
             query = """
                 CREATE TABLE IF NOT EXISTS payment_history (
@@ -41,9 +70,19 @@ class FinanceService:
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
             """
             self.db.execute_update(query)
+            FinanceService._payment_history_ready = True
         except Exception as e:
             logger.error(f"Error ensuring payment_history table: {e}")
 
+    def _get_payment_history_columns(self) -> set:
+        """Colonnes de payment_history (mises en cache pour le chemin de paiement)"""
+        if FinanceService._payment_history_columns is None:
+            columns = self._get_table_columns("payment_history")
+            if not columns:
+                return set()
+            FinanceService._payment_history_columns = columns
+        return FinanceService._payment_history_columns
+
     def _ensure_access_code_history_table(self) -> None:
         """Crée la table d'historique des codes d'accès si nécessaire"""
         try:
@@ -66,7 +105,10 @@ class FinanceService:
             logger.error(f"Error ensuring access_code_history table: {e}")
 
     def _get_table_columns(self, table_name: str) -> set:
-        """Retourne l'ensemble des colonnes existantes pour une table"""
+        """Retourne l'ensemble des colonnes existantes pour une table (mis en cache par processus)"""
+        cached = FinanceService._table_columns.get(table_name)
+        if cached:
+            return cached
         try:
             query = """
                 SELECT COLUMN_NAME
@@ -75,7 +117,10 @@ class FinanceService:
                   AND TABLE_NAME = %s
             """
             rows = self.db.execute_query(query, (table_name,)) or []
-            return {row.get("COLUMN_NAME") for row in rows if row.get("COLUMN_NAME")}
+            columns = {row.get("COLUMN_NAME") for row in rows if row.get("COLUMN_NAME")}
+            if columns:
+                FinanceService._table_columns[table_name] = columns
+            return columns
         except Exception as e:
             logger.error(f"Error fetching columns for {table_name}: {e}")
             return set()
@@ -83,13 +128,37 @@ class FinanceService:
     def get_student_finance(self, student_id: int) -> Optional[dict]:
         """Récupère le profil financier d'un étudiant"""
         try:
-            query = "SELECT * FROM finance_profile WHERE student_id = %s"
+            columns = select_list(FINANCE_PROFILE_COLUMNS, self._get_table_columns("finance_profile"))
+            query = f"SELECT {columns} FROM finance_profile WHERE student_id = %s"
             results = self.db.execute_query(query, (student_id,))
             return results[0] if results else None
         except Exception as e:
             logger.error(f"Error getting finance profile: {e}")
             return None
 
+    def get_finance_status(self, student_id: int) -> Optional[FinanceStatus]:
+        """Seuil, frais et code d'accès d'un étudiant (colonnes strictement nécessaires)"""
+        try:
+            columns = select_list(FINANCE_STATUS_COLUMNS, self._get_table_columns("finance_profile"))
+            rows = self.db.execute_query(
+                f"SELECT {columns} FROM finance_profile WHERE student_id = %s", (student_id,)
+            )
+            return FinanceStatus.from_row(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Error getting finance status: {e}")
+            return None
+
+    def get_student_contact(self, student_id: int) -> Optional[StudentContact]:
+        """Nom, email et téléphone d'un étudiant pour une notification"""
+        try:
+            rows = self.db.execute_query(
+                f"SELECT {select_list(STUDENT_CONTACT_COLUMNS)} FROM student WHERE id = %s", (student_id,)
+            )
+            return StudentContact.from_row(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Error getting student contact: {e}")
+            return None
+
     def create_finance_profile(self, student_id: int, threshold_required: Decimal = None, academic_year_id: int = None) -> bool:
         """Crée un profil financier initial pour un étudiant
         
@@ -169,15 +238,12 @@ class FinanceService:
     def is_threshold_reached(self, student_id: int) -> bool:
         """Vérifie si le seuil financier est atteint"""
         try:
-            finance = self.get_student_finance(student_id)
+            finance = self.get_finance_status(student_id)
             if not finance:
                 logger.warning(f"No finance profile found for student {student_id}")
                 return False
             
-            amount_paid = Decimal(str(finance['amount_paid']))
-            threshold = Decimal(str(finance['threshold_required']))
-            
-            is_eligible = amount_paid >= threshold
+            is_eligible = finance.threshold_reached
             logger.info(f"Student {student_id} threshold check: {is_eligible}")
             return is_eligible
             
@@ -189,16 +255,22 @@ class FinanceService:
         """Enregistre un paiement pour un étudiant
         
         NOUVELLE ARCHITECTURE: Utilise les frais/seuils de la PROMOTION de l'étudiant
+
+        Le solde est incrémenté atomiquement côté MySQL (UPDATE conditionnel: pas de
+        lecture-modification-écriture en Python) et l'historique est inséré dans la
+        même transaction: deux caissiers simultanés ne peuvent ni perdre un paiement
+        ni dépasser les frais. Les agrégats du tableau de bord, les séries
+        d'encaissement et le reçu (outbox des notifications) suivent dans la même
+        transaction.
         """
         try:
-            self._ensure_payment_history_table()
-            finance = self.get_student_finance(student_id)
-            if not finance:
-                logger.error(f"No finance profile for student {student_id}")
+            amount = Decimal(str(amount))
+            if amount <= 0:
+                logger.warning(f"Payment rejected for student {student_id}: non-positive amount {amount}")
                 return False
-            
-            current_paid = Decimal(str(finance['amount_paid']))
-            new_amount = current_paid + amount
+            self._ensure_payment_history_table()
+            self.rollups._ensure_table()
+            self.notification_service.outbox._ensure_table()
             
             # TOUJOURS utiliser les valeurs de la PROMOTION (source unique de vérité)
             promo_data = self.db.execute_query(
@@ -232,24 +304,44 @@ class FinanceService:
                 logger.warning(f"Payment rejected for student {student_id}: No active academic fees (final_fee={final_fee})")
                 return False
 
-            if final_fee > 0 and new_amount > final_fee:
-                logger.warning(f"Overpayment blocked for student {student_id}: {new_amount} > {final_fee}")
-                return False
-
-            is_eligible = 1 if new_amount >= threshold else 0
             now = datetime.now()
+            history_cols = self._get_payment_history_columns()
 
-            query = """
-                UPDATE finance_profile 
-                SET amount_paid = %s, last_payment_date = %s, is_eligible = %s, updated_at = %s
-                WHERE student_id = %s
-            """
-            params = (str(new_amount), now, is_eligible, now, student_id)
-            self.db.execute_update(query, params)
+            with self.db.transaction() as cursor, self.aggregates.track_students(cursor, [student_id]):
+                # is_eligible est évalué avant amount_paid (MySQL applique les SET dans l'ordre)
+                cursor.execute(
+                    """
+                    UPDATE finance_profile
+                    SET is_eligible = (amount_paid + %s >= %s),
+                        amount_paid = amount_paid + %s,
+                        last_payment_date = %s,
+                        updated_at = %s
+                    WHERE student_id = %s AND amount_paid + %s <= %s
+                    """,
+                    (str(amount), str(threshold), str(amount), now, now,
+                     student_id, str(amount), str(final_fee))
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        "SELECT amount_paid FROM finance_profile WHERE student_id = %s",
+                        (student_id,)
+                    )
+                    current = cursor.fetchone()
+                    if not current:
+                        logger.error(f"No finance profile for student {student_id}")
+                    else:
+                        logger.warning(f"Overpayment blocked for student {student_id}: "
+                                       f"{current['amount_paid']} + {amount} > {final_fee}")
+                    return False
+
+                # Ligne verrouillée par l'UPDATE: lecture cohérente du nouveau solde
+                cursor.execute(
+                    "SELECT amount_paid FROM finance_profile WHERE student_id = %s",
+                    (student_id,)
+                )
+                new_amount = Decimal(str(cursor.fetchone()['amount_paid']))
+                is_eligible = 1 if new_amount >= threshold else 0
 
-            try:
-                history_cols = self._get_table_columns("payment_history")
-                amount_usd = amount
                 insert_cols = []
                 insert_vals = []
 
@@ -259,52 +351,51 @@ class FinanceService:
                         insert_vals.append(value)
 
                 add_hist("student_id", student_id)
-                add_hist("amount_paid_fc", str(amount_usd))
-                add_hist("amount_paid_usd", str(amount_usd))
+                add_hist("amount_paid_fc", str(amount))
+                add_hist("amount_paid_usd", str(amount))
                 add_hist("payment_method", "Paiement bancaire")
                 add_hist("payment_reference", None)
                 add_hist("created_at", now)
 
+                payment_key = None
                 if insert_cols:
                     placeholders = ", ".join(["%s"] * len(insert_cols))
                     cols_sql = ", ".join(insert_cols)
-                    self.db.execute_update(
+                    cursor.execute(
                         f"INSERT INTO payment_history ({cols_sql}) VALUES ({placeholders})",
                         tuple(insert_vals)
                     )
-            except Exception as e:
-                logger.error(f"Error inserting payment history: {e}")
+                    payment_key = f"payment:{cursor.lastrowid}"
+                self.rollups.record_payments(cursor, [(student_id, "Paiement bancaire", amount, now)])
 
-            remaining_amount = final_fee - new_amount
-            if remaining_amount < 0:
-                remaining_amount = Decimal("0")
+                remaining_amount = final_fee - new_amount
+                if remaining_amount < 0:
+                    remaining_amount = Decimal("0")
 
-            def _notify_async():
-                try:
-                    logger.info(f"Starting async notification for student {student_id}")
-                    success = self.notification_service.send_payment_notification(
-                        student_email=promo.get('email'),
-                        student_phone=promo.get('phone_number'),
-                        student_name=f"{promo.get('firstname')} {promo.get('lastname')}",
-                        amount_paid=float(new_amount),
-                        remaining_amount=float(remaining_amount),
-                        final_fee=float(final_fee),
-                        threshold_amount=float(threshold),
-                        threshold_reached=bool(is_eligible),
-                        promotion_info=f"{faculty_name} / {department_name} / {promotion_name}"
-                    )
-                    if not success:
-                        logger.error(f"Notification failed for student {student_id} - Email: {promo.get('email')}, Phone: {promo.get('phone_number')}")
-                    else:
-                        logger.info(f"Notification sent successfully for student {student_id}")
+                # Reçu mis en file dans la transaction: validé avec le paiement, jamais perdu
+                self.notification_service.send_payment_notification(
+                    student_email=promo.get('email'),
+                    student_phone=promo.get('phone_number'),
+                    student_name=f"{promo.get('firstname')} {promo.get('lastname')}",
+                    amount_paid=float(new_amount),
+                    remaining_amount=float(remaining_amount),
+                    final_fee=float(final_fee),
+                    threshold_amount=float(threshold),
+                    threshold_reached=bool(is_eligible),
+                    promotion_info=f"{faculty_name} / {department_name} / {promotion_name}",
+                    idempotency_key=payment_key,
+                    cursor=cursor
+                )
 
-                    if is_eligible:
-                        is_full_paid = new_amount >= final_fee
-                        self._issue_access_code_if_needed(student_id, is_full_paid)
-                except Exception as notify_err:
-                    logger.error(f"Notification async error for student {student_id}: {notify_err}", exc_info=True)
+            self.notification_service.outbox.wake()
+            self.eligibility.refresh_students([student_id])
 
-            threading.Thread(target=_notify_async, daemon=True).start()
+            if is_eligible:
+                # Hachage bcrypt du code: hors du thread appelant
+                finance_side_effects.submit(
+                    self._issue_access_code_if_needed, student_id, new_amount >= final_fee,
+                    task_name=f"payment_access_code:{student_id}"
+                )
 
             logger.info(f"Payment recorded for student {student_id} ({promotion_name}): {amount}")
             return True
@@ -349,8 +440,8 @@ class FinanceService:
     def get_eligible_students(self) -> list:
         """Récupère tous les étudiants éligibles"""
         try:
-            query = """
-                SELECT s.*, f.amount_paid, f.threshold_required
+            query = f"""
+                SELECT {select_list(STUDENT_LIST_COLUMNS, alias="s")}, f.amount_paid, f.threshold_required
                 FROM student s
                 JOIN finance_profile f ON s.id = f.student_id
                 WHERE f.amount_paid >= f.threshold_required AND s.is_active = 1
@@ -363,8 +454,8 @@ class FinanceService:
     def get_non_eligible_students(self) -> list:
         """Récupère tous les étudiants non éligibles"""
         try:
-            query = """
-                SELECT s.*, f.amount_paid, f.threshold_required
+            query = f"""
+                SELECT {select_list(STUDENT_LIST_COLUMNS, alias="s")}, f.amount_paid, f.threshold_required
                 FROM student s
                 JOIN finance_profile f ON s.id = f.student_id
                 WHERE f.amount_paid < f.threshold_required AND s.is_active = 1
@@ -374,25 +465,37 @@ class FinanceService:
             logger.error(f"Error getting non-eligible students: {e}")
             return []
 
+    def is_eligible_now(self, student_id: int) -> bool:
+        """Seuil atteint et code d'accès valide maintenant
+
+        Un bit positif de l'instantané en mémoire suffit (sans requête). Un bit négatif
+        est revérifié en base: un paiement ou un code émis par un autre processus
+        n'est visible dans l'instantané qu'après son rechargement.
+        """
+        try:
+            if self.eligibility.is_eligible(student_id):
+                return True
+        except Exception as e:
+            logger.error(f"Error checking materialized eligibility: {e}")
+        eligible = self.is_threshold_reached(student_id) and self.is_access_code_valid(student_id)
+        if eligible:
+            # Instantané en retard: mis à jour pour les passages suivants
+            self.eligibility.refresh_students([student_id])
+        return eligible
+
     def is_access_code_valid(self, student_id: int) -> bool:
         """Vérifie la validité du mot de passe d'accès"""
         try:
-            finance = self.get_student_finance(student_id)
+            finance = self.get_finance_status(student_id)
             if not finance:
                 return False
 
-            expires_at = finance.get('access_code_expires_at')
-            access_type = finance.get('access_code_type')
-            academic_year_id = finance.get('academic_year_id')
-
-            if expires_at and isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at)
-
+            expires_at = finance.access_code_expires_at
             if expires_at and datetime.now() > expires_at:
                 return False
 
-            if access_type == 'full' and academic_year_id:
-                if not self.academic_service.is_within_exam_period(academic_year_id):
+            if finance.access_code_type == 'full' and finance.academic_year_id:
+                if not self.academic_service.is_within_exam_period(finance.academic_year_id):
                     return False
 
             return True
@@ -401,8 +504,13 @@ class FinanceService:
             return False
 
     def update_financial_thresholds(self, academic_year_id: int, threshold_amount: Decimal,
-                                   final_fee: Decimal, partial_valid_days: int) -> bool:
-        """Met à jour le seuil et invalide les accès partiels"""
+                                   final_fee: Decimal, partial_valid_days: int,
+                                   progress_callback: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Met à jour le seuil et invalide les accès partiels
+
+        Les profils sont traités par blocs de clés primaires en transactions courtes
+        (voir ThresholdRolloutService): un job interrompu reprend via resume_pending().
+        """
         try:
             # VALIDATION CRITIQUE : Le seuil ne peut JAMAIS dépasser les frais académiques
             if threshold_amount > final_fee:
@@ -430,42 +538,19 @@ class FinanceService:
             """
             self.db.execute_update(query_year, (str(threshold_amount), str(final_fee), partial_valid_days, now, academic_year_id))
 
-            # Mettre à jour finance_profile - vérifier si la colonne final_fee existe
-            columns = self._get_table_columns("finance_profile")
-            if "final_fee" in columns:
-                query_fp = """
-                    UPDATE finance_profile
-                    SET threshold_required = %s, final_fee = %s, updated_at = %s
-                    WHERE academic_year_id = %s
-                """
-                self.db.execute_update(query_fp, (str(threshold_amount), str(final_fee), now, academic_year_id))
-            else:
-                # Si final_fee n'existe pas, mettre à jour seulement threshold_required
-                query_fp = """
-                    UPDATE finance_profile
-                    SET threshold_required = %s, updated_at = %s
-                    WHERE academic_year_id = %s
-                """
-                self.db.execute_update(query_fp, (str(threshold_amount), now, academic_year_id))
-
-            # Recalculer l'éligibilité selon le nouveau seuil (effet immédiat dans l'interface)
-            if "is_eligible" in columns:
-                query_elig = """
-                    UPDATE finance_profile
-                    SET is_eligible = CASE WHEN amount_paid >= %s THEN 1 ELSE 0 END,
-                        updated_at = %s
-                    WHERE academic_year_id = %s
-                """
-                self.db.execute_update(query_elig, (str(threshold_amount), now, academic_year_id))
-
-            self._invalidate_partial_access_codes(academic_year_id)
-            self._notify_threshold_change(
+            # Profils mis à jour par blocs (seuil, frais, éligibilité, codes partiels, agrégats);
+            # notifications et codes d'accès mis en file par le job
+            rollout_id = self.threshold_rollout.start(
                 academic_year_id,
                 threshold_amount,
                 final_fee,
                 old_threshold,
-                old_final_fee
+                old_final_fee,
+                progress_callback=progress_callback
             )
+            if not rollout_id:
+                logger.error(f"Threshold rollout did not complete for academic year {academic_year_id}")
+                return False
 
             logger.info("Financial thresholds updated and partial codes invalidated")
             return True
@@ -474,15 +559,19 @@ class FinanceService:
             return False
 
     def _issue_access_code_if_needed(self, student_id: int, is_full_paid: bool) -> None:
-        """Génère et délivre un nouveau mot de passe si éligible"""
+        """Génère et délivre un nouveau mot de passe si éligible
+
+        Mot de passe, profil financier, historique et message (outbox, clé
+        `access_code:<id historique>`) sont écrits dans une seule transaction:
+        un code n'est jamais changé sans être enregistré et délivré.
+        """
         try:
             self._ensure_access_code_history_table()
+            self.notification_service.outbox._ensure_table()
             columns = self._get_table_columns("finance_profile")
-            finance = self.get_student_finance(student_id)
-            if not finance:
+            if not self.get_finance_status(student_id):
                 return
 
-            academic_year_id = finance.get('academic_year_id')
             access_type = 'full' if is_full_paid else 'partial'
 
             active_year = self.academic_service.get_active_year()
@@ -497,11 +586,7 @@ class FinanceService:
 
             access_code = self._generate_access_code()
             password_hash = self.auth_service.password_hasher.hash_password(access_code)
-
-            self.db.execute_update(
-                "UPDATE student SET password_hash = %s WHERE id = %s",
-                (password_hash, student_id)
-            )
+            contact = self.get_student_contact(student_id)
 
             now = datetime.now()
             update_fields = []
@@ -517,98 +602,275 @@ class FinanceService:
             add_field("access_code_type", access_type)
             add_field("updated_at", now)
 
-            if update_fields:
-                query = f"UPDATE finance_profile SET {', '.join(update_fields)} WHERE student_id = %s"
-                params.append(student_id)
-                self.db.execute_update(query, tuple(params))
-
-            try:
-                self.db.execute_update(
+            with self.db.transaction() as cursor:
+                cursor.execute(
+                    "UPDATE student SET password_hash = %s WHERE id = %s",
+                    (password_hash, student_id)
+                )
+                if update_fields:
+                    params.append(student_id)
+                    cursor.execute(
+                        f"UPDATE finance_profile SET {', '.join(update_fields)} WHERE student_id = %s",
+                        tuple(params)
+                    )
+                cursor.execute(
                     """
                     INSERT INTO access_code_history (student_id, access_code, access_type, expires_at, issued_at)
                     VALUES (%s, %s, %s, %s, %s)
                     """,
                     (student_id, access_code, access_type, expires_at, now)
                 )
-            except Exception as e:
-                logger.error(f"Error inserting access code history: {e}")
-
-            student_row = self.db.execute_query("SELECT * FROM student WHERE id = %s", (student_id,))
-            if student_row:
-                student = student_row[0]
-                self.notification_service.send_access_code_notification(
-                    student_email=student.get('email'),
-                    student_phone=student.get('phone_number'),
-                    student_name=f"{student.get('firstname')} {student.get('lastname')}",
-                    access_code=access_code,
-                    code_type=access_type,
-                    expires_at=expires_at
-                )
-                logger.info(f"✓ Code d'accès {access_type} envoyé à {student.get('email')}")
+                if contact:
+                    self.notification_service.send_access_code_notification(
+                        student_email=contact.email,
+                        student_phone=contact.phone_number,
+                        student_name=contact.full_name,
+                        access_code=access_code,
+                        code_type=access_type,
+                        expires_at=expires_at,
+                        idempotency_key=f"access_code:{cursor.lastrowid}",
+                        cursor=cursor
+                    )
+
+            self.notification_service.outbox.wake()
+            if update_fields:
+                self.eligibility.refresh_students([student_id])
+            if contact:
+                logger.info(f"✓ Code d'accès {access_type} mis en file pour {contact.email}")
         except Exception as e:
             logger.error(f"Error issuing access code: {e}")
 
-    def _invalidate_partial_access_codes(self, academic_year_id: int) -> None:
-        """Expire tous les accès partiels après changement de seuil"""
+    def issue_access_codes_bulk(self, student_ids: list,
+                                progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                                notify: bool = True) -> dict:
+        """Émet en masse les codes d'accès des étudiants éligibles
+
+        Les codes sont hachés en parallèle sur un pool de processus, puis écrits par
+        lots transactionnels (mot de passe, profil financier, historique, messages
+        dans l'outbox des notifications avec la clé `access_code:<id historique>`).
+
+        Args:
+            student_ids: IDs des étudiants à traiter
+            progress_callback: callable(étape, fait, total) avec étape parmi
+                "hashing", "writing" (barre de progression de l'UI)
+            notify: Mettre en file les codes avec les écritures de chaque lot
+
+        Returns:
+            Résumé {"issued", "skipped", "notified", "failed_notifications"}
+        """
+        summary = {"issued": 0, "skipped": 0, "notified": 0, "failed_notifications": 0}
+
+        def report(stage: str, done: int, total: int) -> None:
+            if progress_callback:
+                try:
+                    progress_callback(stage, done, total)
+                except Exception as e:
+                    logger.debug(f"Progress callback error: {e}")
+
+        ids = list(dict.fromkeys(int(i) for i in (student_ids or [])))
+        if not ids:
+            return summary
+
         try:
+            self._ensure_access_code_history_table()
+            active_year = self.academic_service.get_active_year()
+            if not active_year:
+                logger.warning("Bulk access code issuance skipped: no active academic year")
+                summary["skipped"] = len(ids)
+                return summary
+
             columns = self._get_table_columns("finance_profile")
-            if "access_code_expires_at" not in columns or "access_code_type" not in columns:
-                return
+            final_fee_sql = "COALESCE(NULLIF(f.final_fee, 0), p.fee_usd)" if "final_fee" in columns else "p.fee_usd"
+            batch_size = max(1, ACCESS_CODE_BATCH_SIZE)
+
+            # 1. Candidats éligibles (colonnes strictement nécessaires)
+            candidates = []
+            for start in range(0, len(ids), batch_size):
+                chunk = ids[start:start + batch_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                rows = self.db.execute_query(
+                    f"""
+                    SELECT s.id, f.amount_paid, f.threshold_required, {final_fee_sql} AS final_fee
+                    FROM student s
+                    JOIN finance_profile f ON f.student_id = s.id
+                    JOIN promotion p ON s.promotion_id = p.id
+                    WHERE s.id IN ({placeholders}) AND s.is_active = 1
+                    """,
+                    tuple(chunk)
+                ) or []
+                for row in rows:
+                    amount_paid = Decimal(str(row.get("amount_paid") or 0))
+                    threshold = Decimal(str(row.get("threshold_required") or 0))
+                    if amount_paid < threshold:
+                        continue
+                    final_fee = Decimal(str(row.get("final_fee") or 0))
+                    row["access_type"] = 'full' if final_fee > 0 and amount_paid >= final_fee else 'partial'
+                    candidates.append(row)
+            summary["skipped"] = len(ids) - len(candidates)
+            total = len(candidates)
+            if not total:
+                return summary
+
+            # 2. Hachage parallèle (bcrypt coût 12 sature un cœur par code)
+            codes = [self._generate_access_code() for _ in candidates]
+            hashes = []
+            report("hashing", 0, total)
+            workers = max(1, min(ACCESS_CODE_HASH_WORKERS, total))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, total // (workers * 4))
+                for done, password_hash in enumerate(pool.map(_hash_access_code, codes, chunksize=chunksize), 1):
+                    hashes.append(password_hash)
+                    if done % 20 == 0 or done == total:
+                        report("hashing", done, total)
+
+            # 3. Écritures par lots transactionnels, codes mis en file dans le même lot
+            contacts = {}
+            if notify:
+                self.notification_service.outbox._ensure_table()
+                contacts = self.recipients.get_many(row["id"] for row in candidates)
             now = datetime.now()
-            query = """
-                UPDATE finance_profile
-                SET access_code_expires_at = %s, updated_at = %s
-                WHERE academic_year_id = %s AND access_code_type = 'partial'
-            """
-            self.db.execute_update(query, (now, now, academic_year_id))
+            update_fields = [name for name in ("access_code_issued_at", "access_code_expires_at",
+                                               "access_code_type", "updated_at") if name in columns]
+            finance_sql = None
+            if update_fields:
+                assignments = ", ".join(f"{name} = %s" for name in update_fields)
+                finance_sql = f"UPDATE finance_profile SET {assignments} WHERE student_id = %s"
+
+            for start in range(0, total, batch_size):
+                batch = list(zip(candidates[start:start + batch_size],
+                                 codes[start:start + batch_size],
+                                 hashes[start:start + batch_size]))
+                student_params, finance_params, history_params = [], [], []
+                for row, access_code, password_hash in batch:
+                    expires_at = active_year.get('end_date') if row["access_type"] == 'full' else None
+                    row["expires_at"] = expires_at
+                    values = {
+                        "access_code_issued_at": now,
+                        "access_code_expires_at": expires_at,
+                        "access_code_type": row["access_type"],
+                        "updated_at": now,
+                    }
+                    student_params.append((password_hash, row["id"]))
+                    finance_params.append(tuple(values[name] for name in update_fields) + (row["id"],))
+                    history_params.append((row["id"], access_code, row["access_type"], expires_at, now))
+
+                notified = failed = 0
+                with self.db.transaction() as cursor:
+                    cursor.executemany("UPDATE student SET password_hash = %s WHERE id = %s", student_params)
+                    if finance_sql:
+                        cursor.executemany(finance_sql, finance_params)
+                    for (row, access_code, _), history in zip(batch, history_params):
+                        # Ligne par ligne: l'id de l'historique sert de clé au message
+                        cursor.execute(
+                            """
+                            INSERT INTO access_code_history (student_id, access_code, access_type, expires_at, issued_at)
+                            VALUES (%s, %s, %s, %s, %s)
+                            """,
+                            history
+                        )
+                        if not notify:
+                            continue
+                        contact = contacts.get(int(row["id"]))
+                        sent = contact is not None and self.notification_service.send_access_code_notification(
+                            student_email=contact.email,
+                            student_phone=contact.phone,
+                            student_name=contact.name,
+                            access_code=access_code,
+                            code_type=row["access_type"],
+                            expires_at=row["expires_at"],
+                            idempotency_key=f"access_code:{cursor.lastrowid}",
+                            cursor=cursor
+                        )
+                        if sent:
+                            notified += 1
+                        else:
+                            failed += 1
+                if notified:
+                    self.notification_service.outbox.wake()
+                self.eligibility.refresh_students(row["id"] for row, _, _ in batch)
+                summary["issued"] += len(batch)
+                summary["notified"] += notified
+                summary["failed_notifications"] += failed
+                report("writing", summary["issued"], total)
+
+            logger.info(f"Bulk access codes issued: {summary['issued']} (skipped {summary['skipped']}, "
+                        f"queued {summary['notified']} notification(s))")
+            return summary
         except Exception as e:
-            logger.error(f"Error invalidating partial access codes: {e}")
+            logger.error(f"Error issuing access codes in bulk: {e}", exc_info=True)
+            return summary
 
     def _notify_threshold_change(self, academic_year_id: int, threshold_amount: Decimal,
                                  final_fee: Decimal, old_threshold: Decimal = None,
-                                 old_final_fee: Decimal = None) -> None:
-        """Notifie les étudiants du changement de seuil"""
+                                 old_final_fee: Decimal = None, student_ids: list = None,
+                                 cursor=None, campaign_id: str = None) -> None:
+        """Notifie les étudiants du changement de seuil (tous, ou un bloc `student_ids`)
+
+        Args:
+            cursor: Transaction du bloc de déploiement: montants lus et messages mis en
+                file dans cette transaction, erreur propagée
+            campaign_id: Identifiant déterministe de la campagne (idempotence en reprise)
+        """
         try:
             columns = self._get_table_columns("finance_profile")
             has_final_fee = "final_fee" in columns
             select_final_fee = ", f.final_fee" if has_final_fee else ""
+            params = [academic_year_id]
+            student_filter = ""
+            if student_ids:
+                student_filter = f" AND f.student_id IN ({', '.join(['%s'] * len(student_ids))})"
+                params.extend(student_ids)
+            # Montants seulement: les coordonnées viennent de l'annuaire des destinataires
             query = f"""
-                SELECT s.email, s.phone_number, s.firstname, s.lastname,
-                       f.amount_paid, f.threshold_required{select_final_fee}
-                FROM student s
-                JOIN finance_profile f ON s.id = f.student_id
-                WHERE f.academic_year_id = %s AND s.is_active = 1
+                SELECT f.student_id, f.amount_paid, f.threshold_required{select_final_fee}
+                FROM finance_profile f
+                WHERE f.academic_year_id = %s{student_filter}
             """
-            students = self.db.execute_query(query, (academic_year_id,))
-            for s in students:
-                amount_paid = Decimal(str(s.get("amount_paid") or 0))
-                total_due = s.get("final_fee") if has_final_fee else None
-                if total_due is None or Decimal(str(total_due or 0)) <= 0:
-                    total_due = final_fee
-                total_due = Decimal(str(total_due or 0))
-
-                if total_due <= 0 or amount_paid >= total_due:
-                    continue
-
-                threshold_reached = amount_paid >= threshold_amount
-                remaining_amount = total_due - amount_paid
-                if remaining_amount < 0:
-                    remaining_amount = Decimal("0")
-
-                self.notification_service.send_threshold_change_notification(
-                    student_email=s.get('email'),
-                    student_phone=s.get('phone_number'),
-                    student_name=f"{s.get('firstname')} {s.get('lastname')}",
-                    old_threshold=float(old_threshold) if old_threshold is not None else None,
-                    new_threshold=float(threshold_amount),
-                    old_final_fee=float(old_final_fee) if old_final_fee is not None else None,
-                    new_final_fee=float(final_fee),
-                    amount_paid=float(amount_paid),
-                    remaining_amount=float(remaining_amount),
-                    threshold_reached=bool(threshold_reached)
-                )
+            if cursor is not None:
+                cursor.execute(query, tuple(params))
+                students = cursor.fetchall() or []
+            else:
+                students = self.db.execute_query(query, tuple(params)) or []
+            # Étudiants actifs seulement (l'annuaire ne contient que ceux-là)
+            contacts = self.recipients.get_many(s["student_id"] for s in students)
+
+            def recipients():
+                for s in students:
+                    contact = contacts.get(int(s["student_id"]))
+                    if contact is None:
+                        continue
+                    amount_paid = Decimal(str(s.get("amount_paid") or 0))
+                    total_due = s.get("final_fee") if has_final_fee else None
+                    if total_due is None or Decimal(str(total_due or 0)) <= 0:
+                        total_due = final_fee
+                    total_due = Decimal(str(total_due or 0))
+
+                    if total_due <= 0 or amount_paid >= total_due:
+                        continue
+
+                    yield {
+                        **contact.as_recipient(),
+                        "amount_paid": float(amount_paid),
+                        "remaining_amount": float(max(total_due - amount_paid, Decimal("0"))),
+                        "threshold_reached": bool(amount_paid >= threshold_amount),
+                    }
+
+            self.notification_service.broadcast(
+                "threshold_change",
+                recipients(),
+                common={
+                    "old_threshold": float(old_threshold) if old_threshold is not None else None,
+                    "new_threshold": float(threshold_amount),
+                    "old_final_fee": float(old_final_fee) if old_final_fee is not None else None,
+                    "new_final_fee": float(final_fee),
+                },
+                campaign_id=campaign_id,
+                cursor=cursor,
+            )
         except Exception as e:
             logger.error(f"Error notifying threshold change: {e}")
+            if cursor is not None:
+                raise
 
     def _generate_access_code(self) -> str:
         """Génère un mot de passe numérique (6 chiffres)"""
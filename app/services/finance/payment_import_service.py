@@ -0,0 +1,373 @@
+"""Import en masse des relevés bancaires (CSV/XLSX) dans les profils financiers
+
+Le fichier est lu par blocs (CSV avec pandas, XLSX en flux avec openpyxl; l'ancien
+format XLS est lu en entier). Les lignes sont rapprochées des étudiants
+par matricule. Les règles de trop-perçu sont vérifiées de façon vectorisée. Chaque
+bloc est appliqué dans une seule transaction (soldes + payment_history + reçus dans
+l'outbox des notifications). Les codes d'accès des étudiants devenus éligibles sont
+émis une fois l'import terminé. En mode dry-run, rien n'est écrit et le rapport
+décrit l'effet de chaque ligne.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Set
+import pandas as pd
+from core.database.connection import DatabaseConnection
+from app.services.finance.side_effect_executor import finance_side_effects
+
+logger = logging.getLogger(__name__)
+
+# Alias de colonnes rencontrés dans les exports de la banque / du bursar
+COLUMN_ALIASES = {
+    "student_number": ("student_number", "matricule", "numero_etudiant", "student_id", "id_etudiant"),
+    "amount": ("amount", "montant", "amount_usd", "montant_usd", "credit"),
+    "payment_reference": ("payment_reference", "reference", "ref", "transaction_id", "libelle"),
+    "payment_date": ("payment_date", "date", "date_operation", "value_date"),
+    "payment_method": ("payment_method", "mode", "methode", "canal"),
+}
+
+STATUS_ACCEPTED = "accepted"
+STATUS_REJECTED = "rejected"
+
+
+class PaymentImportService:
+    """Pipeline d'import des relevés bancaires"""
+
+    def __init__(self, finance_service=None, chunk_size: int = 2000):
+        self.db = DatabaseConnection()
+        self.chunk_size = chunk_size
+        self._finance_service = finance_service
+
+    @property
+    def finance_service(self):
+        if self._finance_service is None:
+            from app.services.finance.finance_service import FinanceService
+            self._finance_service = FinanceService()
+        return self._finance_service
+
+    # ---------- Lecture ----------
+
+    def _read_chunks(self, path: str) -> Iterator[pd.DataFrame]:
+        """Lit le fichier par blocs en normalisant les noms de colonnes"""
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".xlsx":
+            chunks = self._read_xlsx_chunks(path)
+        elif extension == ".xls":
+            # Format binaire: pas de lecture en flux, classeur chargé en entier
+            frame = pd.read_excel(path, dtype=str)
+            chunks = (frame.iloc[i:i + self.chunk_size] for i in range(0, len(frame), self.chunk_size))
+        else:
+            chunks = pd.read_csv(path, dtype=str, chunksize=self.chunk_size, sep=None, engine="python")
+
+        first_line = 2  # ligne 1 = en-tête
+        for chunk in chunks:
+            chunk = self._normalize_columns(chunk)
+            chunk.insert(0, "line", range(first_line, first_line + len(chunk)))
+            first_line += len(chunk)
+            yield chunk
+
+    def _read_xlsx_chunks(self, path: str) -> Iterator[pd.DataFrame]:
+        """Lit la première feuille en flux (openpyxl read_only), bloc par bloc
+
+        Cellules converties en texte comme `pd.read_excel(dtype=str)`; les lignes
+        vides sont conservées pour garder la numérotation des lignes de la feuille.
+        """
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(name) if name is not None else f"column_{i}" for i, name in enumerate(header)]
+            buffer = []
+            for row in rows:
+                buffer.append([None if value is None else str(value) for value in row[:len(columns)]])
+                if len(buffer) >= self.chunk_size:
+                    yield pd.DataFrame(buffer, columns=columns, dtype=object)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns, dtype=object)
+        finally:
+            workbook.close()
+
+    def _normalize_columns(self, frame: pd.DataFrame) -> pd.DataFrame:
+        lookup = {str(col).strip().lower().replace(" ", "_"): col for col in frame.columns}
+        renamed = {}
+        for target, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in lookup:
+                    renamed[lookup[alias]] = target
+                    break
+        frame = frame.rename(columns=renamed)
+        if "student_number" not in frame.columns or "amount" not in frame.columns:
+            raise ValueError("Import file must contain a student number and an amount column")
+        for optional in ("payment_reference", "payment_date", "payment_method"):
+            if optional not in frame.columns:
+                frame[optional] = None
+        frame = frame[["student_number", "amount", "payment_reference", "payment_date", "payment_method"]].copy()
+        frame["student_number"] = frame["student_number"].fillna("").astype(str).str.strip()
+        amount_text = frame["amount"].fillna("").astype(str).str.replace(r"[\s$]", "", regex=True).str.replace(",", ".")
+        frame["amount"] = pd.to_numeric(amount_text, errors="coerce").round(2)
+        # NaN est truthy: sans conversion, `payment_method or défaut` laisserait passer NaN.
+        # astype(object): une colonne lue en dtype=str reconvertirait None en NaN
+        for optional in ("payment_reference", "payment_method"):
+            frame[optional] = frame[optional].astype(object).where(frame[optional].notna(), None)
+        return frame
+
+    # ---------- Rapprochement et validation vectorisée ----------
+
+    def _load_students(self, student_numbers: list) -> pd.DataFrame:
+        columns = ["student_number", "student_id", "amount_paid", "fee", "threshold"]
+        if not student_numbers:
+            return pd.DataFrame(columns=columns)
+        placeholders = ", ".join(["%s"] * len(student_numbers))
+        rows = self.db.execute_query(
+            f"""
+            SELECT s.student_number, s.id AS student_id, f.amount_paid,
+                   p.fee_usd AS fee, p.threshold_amount AS threshold
+            FROM student s
+            JOIN finance_profile f ON f.student_id = s.id
+            JOIN promotion p ON s.promotion_id = p.id
+            WHERE s.student_number IN ({placeholders}) AND s.is_active = 1
+            """,
+            tuple(student_numbers)
+        ) or []
+        frame = pd.DataFrame(rows, columns=columns)
+        for col in ("amount_paid", "fee", "threshold"):
+            frame[col] = pd.to_numeric(frame[col], errors="coerce").fillna(0.0).astype(float)
+        return frame
+
+    def _known_references(self, references: list) -> set:
+        references = [ref for ref in references if ref]
+        if not references:
+            return set()
+        placeholders = ", ".join(["%s"] * len(references))
+        rows = self.db.execute_query(
+            f"SELECT payment_reference FROM payment_history WHERE payment_reference IN ({placeholders})",
+            tuple(references)
+        ) or []
+        return {row["payment_reference"] for row in rows}
+
+    def _validate_chunk(self, chunk: pd.DataFrame, carried: Dict[int, float],
+                        carried_refs: Set[str]) -> pd.DataFrame:
+        """Valide un bloc; `carried` et `carried_refs` cumulent les montants et les
+        références acceptés des blocs précédents non écrits
+
+        Un import réel applique chaque bloc avant de lire le suivant: `amount_paid`
+        et les références relus en base incluent déjà ces blocs, les cumuls sont
+        vidés après chaque bloc appliqué. En dry-run, ils font produire au rapport
+        les mêmes rejets que l'import réel.
+        """
+        students = self._load_students(chunk["student_number"].unique().tolist())
+        frame = chunk.merge(students, on="student_number", how="left")
+        frame["status"] = STATUS_ACCEPTED
+        frame["reason"] = ""
+
+        def reject(mask, reason):
+            mask = mask & (frame["status"] == STATUS_ACCEPTED)
+            frame.loc[mask, "status"] = STATUS_REJECTED
+            frame.loc[mask, "reason"] = reason
+
+        reject(frame["amount"].isna() | (frame["amount"] <= 0), "invalid amount")
+        reject(frame["student_id"].isna(), "unknown student number")
+        reject(frame["fee"].fillna(0) <= 0, "no active academic fees")
+        known = self._known_references(frame["payment_reference"].dropna().unique().tolist())
+        reject(frame["payment_reference"].isin(known | carried_refs), "reference already imported")
+        reject(frame["payment_reference"].notna() & frame.duplicated("payment_reference", keep="first"),
+               "duplicate reference in file")
+
+        # Solde courant = base + acceptés des blocs précédents (dry-run) + cumul dans ce bloc
+        frame["student_id"] = frame["student_id"].fillna(-1).astype(int)
+        base = frame["amount_paid"].fillna(0.0) + frame["student_id"].map(carried).fillna(0.0)
+        accepted = frame["status"] == STATUS_ACCEPTED
+        running = frame["amount"].where(accepted, 0.0).groupby(frame["student_id"]).cumsum()
+        # Une ligne qui dépasse les frais bloque les suivantes du même étudiant (revue manuelle)
+        over = accepted & (base + running > frame["fee"] + 1e-9)
+        reject(over.groupby(frame["student_id"]).cummax(), "overpayment")
+
+        accepted = frame["status"] == STATUS_ACCEPTED
+        accepted_amount = frame["amount"].where(accepted, 0.0)
+        frame["balance_after"] = (base + accepted_amount.groupby(frame["student_id"]).cumsum()).round(2)
+        frame["balance_before"] = (frame["balance_after"] - accepted_amount).round(2)
+        frame["becomes_eligible"] = accepted & (frame["balance_before"] < frame["threshold"]) & \
+            (frame["balance_after"] >= frame["threshold"])
+
+        for student_id, total in frame[accepted].groupby("student_id")["amount"].sum().items():
+            carried[student_id] = carried.get(student_id, 0.0) + float(total)
+        carried_refs.update(frame.loc[accepted, "payment_reference"].dropna())
+        return frame
+
+    # ---------- Application ----------
+
+    def _apply_chunk(self, frame: pd.DataFrame, notify: bool = False) -> pd.DataFrame:
+        """Applique les lignes acceptées d'un bloc dans une seule transaction
+
+        Avec `notify`, le reçu de chaque étudiant (dernière ligne acceptée du bloc)
+        est mis en file dans la même transaction, clé `payment:<id payment_history>`.
+        """
+        accepted = frame[frame["status"] == STATUS_ACCEPTED]
+        if accepted.empty:
+            return frame
+        finance_service = self.finance_service
+        finance_service._ensure_payment_history_table()
+        finance_service.rollups._ensure_table()
+        notification_service = finance_service.notification_service
+        if notify:
+            notification_service.outbox._ensure_table()
+        now = datetime.now()
+        per_student = accepted.groupby("student_id").agg(
+            amount=("amount", "sum"), fee=("fee", "first"), threshold=("threshold", "first")
+        )
+        contacts = finance_service.recipients.get_many(per_student.index.tolist()) if notify else {}
+        aggregates = finance_service.aggregates
+        with self.db.transaction() as cursor, aggregates.track_students(cursor, per_student.index.tolist()):
+            failed = []
+            for student_id, row in per_student.iterrows():
+                total = f"{row['amount']:.2f}"
+                cursor.execute(
+                    """
+                    UPDATE finance_profile
+                    SET is_eligible = (amount_paid + %s >= %s),
+                        amount_paid = amount_paid + %s,
+                        last_payment_date = %s,
+                        updated_at = %s
+                    WHERE student_id = %s AND amount_paid + %s <= %s
+                    """,
+                    (total, f"{row['threshold']:.2f}", total, now, now,
+                     int(student_id), total, f"{row['fee']:.2f}")
+                )
+                if cursor.rowcount == 0:
+                    failed.append(student_id)
+
+            if failed:
+                # Solde modifié entre la validation et l'écriture (caisse concurrente)
+                mask = frame["student_id"].isin(failed) & (frame["status"] == STATUS_ACCEPTED)
+                frame.loc[mask, "status"] = STATUS_REJECTED
+                frame.loc[mask, "reason"] = "balance changed during import"
+                frame.loc[mask, "becomes_eligible"] = False
+                accepted = frame[frame["status"] == STATUS_ACCEPTED]
+
+            paid_at = pd.to_datetime(accepted["payment_date"], errors="coerce", dayfirst=True)
+            history = [
+                (int(r.student_id), f"{r.amount:.2f}", f"{r.amount:.2f}",
+                 r.payment_method or "Import relevé bancaire", r.payment_reference,
+                 when.to_pydatetime() if pd.notna(when) else now)
+                for r, when in zip(accepted.itertuples(), paid_at)
+            ]
+            if history:
+                insert_sql = """
+                    INSERT INTO payment_history
+                        (student_id, amount_paid_fc, amount_paid_usd, payment_method, payment_reference, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """
+                # Dernière ligne de chaque étudiant insérée à part: son id sert de clé au reçu
+                is_last = ~accepted["student_id"].duplicated(keep="last").to_numpy()
+                earlier = [row for row, last in zip(history, is_last) if not last]
+                if earlier:
+                    cursor.executemany(insert_sql, earlier)
+                last_ids = {}
+                for row, last in zip(history, is_last):
+                    if last:
+                        cursor.execute(insert_sql, row)
+                        last_ids[row[0]] = cursor.lastrowid
+                finance_service.rollups.record_payments(
+                    cursor, [(row[0], row[3], row[2], row[5]) for row in history]
+                )
+
+                for r in accepted.drop_duplicates("student_id", keep="last").itertuples():
+                    contact = contacts.get(int(r.student_id))
+                    if contact is None:
+                        continue
+                    notification_service.send_payment_notification(
+                        student_email=contact.email,
+                        student_phone=contact.phone,
+                        student_name=contact.name,
+                        amount_paid=float(r.balance_after),
+                        remaining_amount=max(float(r.fee) - float(r.balance_after), 0.0),
+                        final_fee=float(r.fee),
+                        threshold_amount=float(r.threshold),
+                        threshold_reached=bool(r.balance_after >= r.threshold),
+                        idempotency_key=f"payment:{last_ids[int(r.student_id)]}",
+                        cursor=cursor
+                    )
+        if contacts:
+            notification_service.outbox.wake()
+        finance_service.eligibility.refresh_students(per_student.index.tolist())
+        return frame
+
+    def import_file(self, path: str, dry_run: bool = True,
+                    progress_callback: Optional[Callable[[int, int], None]] = None,
+                    notify: bool = True) -> dict:
+        """Importe un relevé bancaire
+
+        Args:
+            path: Fichier CSV ou XLSX
+            dry_run: Ne rien écrire, seulement produire le rapport
+            progress_callback: callable(lignes traitées, lignes acceptées)
+            notify: Mettre en file les reçus (avec chaque bloc) et les codes d'accès
+
+        Returns:
+            {"report": DataFrame ligne par ligne, "total", "accepted", "rejected",
+             "amount", "students", "newly_eligible"}
+        """
+        carried: Dict[int, float] = {}
+        carried_refs: Set[str] = set()
+        reports = []
+        processed = 0
+        for chunk in self._read_chunks(path):
+            frame = self._validate_chunk(chunk, carried, carried_refs)
+            if not dry_run:
+                frame = self._apply_chunk(frame, notify=notify)
+                # Bloc validé en base: le prochain bloc relit ces montants et références
+                carried.clear()
+                carried_refs.clear()
+            reports.append(frame)
+            processed += len(frame)
+            if progress_callback:
+                progress_callback(processed, int((frame["status"] == STATUS_ACCEPTED).sum()))
+
+        report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+        summary = self._summarize(report)
+        summary["dry_run"] = dry_run
+        logger.info(f"Payment import {'(dry-run) ' if dry_run else ''}{path}: "
+                    f"{summary['accepted']}/{summary['total']} lines accepted, ${summary['amount']:,.2f}")
+
+        if not dry_run and notify and summary["newly_eligible"]:
+            self._queue_access_codes(report)
+        return summary
+
+    def _summarize(self, report: pd.DataFrame) -> dict:
+        if report.empty:
+            return {"report": report, "total": 0, "accepted": 0, "rejected": 0,
+                    "amount": 0.0, "students": 0, "newly_eligible": 0}
+        accepted = report[report["status"] == STATUS_ACCEPTED]
+        columns = ["line", "student_number", "amount", "payment_reference", "status", "reason",
+                   "balance_before", "balance_after", "becomes_eligible"]
+        return {
+            "report": report[columns],
+            "total": len(report),
+            "accepted": len(accepted),
+            "rejected": len(report) - len(accepted),
+            "amount": float(accepted["amount"].sum()),
+            "students": int(accepted["student_id"].nunique()),
+            "newly_eligible": int(report["becomes_eligible"].sum()),
+        }
+
+    def _queue_access_codes(self, report: pd.DataFrame) -> None:
+        """Codes d'accès des étudiants devenus éligibles, hors du chemin critique
+
+        Les reçus sont déjà dans l'outbox (transaction de chaque bloc).
+        """
+        accepted = report[report["status"] == STATUS_ACCEPTED]
+        newly_eligible = [int(i) for i in accepted.loc[accepted["becomes_eligible"], "student_id"].unique()]
+        if newly_eligible:
+            finance_side_effects.submit(self.finance_service.issue_access_codes_bulk, newly_eligible,
+                                        task_name="payment_import_access_codes")
+
+    @staticmethod
+    def write_report(summary: dict, path: str) -> str:
+        """Enregistre le rapport ligne par ligne (diff du dry-run) en CSV"""
+        summary["report"].to_csv(path, index=False)
+        return path
@@ -0,0 +1,287 @@
+"""Séries temporelles des encaissements (rollups journaliers et mensuels)
+
+La table revenue_rollup cumule, par jour et par mois, le nombre de paiements et
+le montant encaissé pour chaque portée (globale, faculté, département,
+promotion) et chaque mode de paiement. Chaque paiement l'incrémente dans sa
+propre transaction. Les graphiques et rapports lisent uniquement ces lignes,
+jamais payment_history en entier.
+
+`backfill()` reconstruit la table depuis payment_history (première installation
+ou réparation): voir scripts/backfill_revenue_rollups.py.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+from core.database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+PERIOD_DAY = "day"
+PERIOD_MONTH = "month"
+
+SCOPE_OVERALL = "overall"
+SCOPE_FACULTY = "faculty"
+SCOPE_DEPARTMENT = "department"
+SCOPE_PROMOTION = "promotion"
+
+DEFAULT_PAYMENT_METHOD = "Paiement bancaire"
+
+# Expression SQL de début de période pour le backfill (% doublés: requête paramétrée)
+_PERIOD_START_SQL = {
+    PERIOD_DAY: "DATE(ph.created_at)",
+    PERIOD_MONTH: "DATE_FORMAT(ph.created_at, '%%Y-%%m-01')",
+}
+
+# Colonne d'identifiant de portée pour le backfill
+_SCOPE_ID_SQL = {
+    SCOPE_OVERALL: "0",
+    SCOPE_FACULTY: "d.faculty_id",
+    SCOPE_DEPARTMENT: "p.department_id",
+    SCOPE_PROMOTION: "p.id",
+}
+
+
+def _period_start(period: str, when) -> date:
+    day = when.date() if isinstance(when, datetime) else when
+    return day.replace(day=1) if period == PERIOD_MONTH else day
+
+
+class RevenueRollupService:
+    """Maintenance incrémentale et lecture des séries d'encaissement"""
+
+    _table_ready = False
+
+    def __init__(self):
+        self.db = DatabaseConnection()
+
+    def _ensure_table(self) -> None:
+        """Crée la table (et la remplit depuis l'historique au premier démarrage)"""
+        if RevenueRollupService._table_ready:
+            return
+        try:
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS revenue_rollup (
+                    period ENUM('day', 'month') NOT NULL,
+                    period_start DATE NOT NULL,
+                    scope ENUM('overall', 'faculty', 'department', 'promotion') NOT NULL,
+                    scope_id INT NOT NULL DEFAULT 0,
+                    payment_method VARCHAR(50) NOT NULL DEFAULT '',
+                    payment_count INT NOT NULL DEFAULT 0,
+                    amount DECIMAL(15, 2) NOT NULL DEFAULT 0,
+                    PRIMARY KEY (period, scope, scope_id, period_start, payment_method)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            RevenueRollupService._table_ready = True
+            rows = self.db.execute_query("SELECT 1 AS present FROM revenue_rollup LIMIT 1")
+            if not rows:
+                history = self.db.execute_query("SELECT 1 AS present FROM payment_history LIMIT 1")
+                if history:
+                    self.backfill()
+        except Exception as e:
+            logger.error(f"Error ensuring revenue_rollup table: {e}")
+
+    # ---------- Maintenance incrémentale ----------
+
+    def record_payments(self, cursor, payments: Iterable[Tuple[int, Optional[str], Decimal, datetime]]) -> None:
+        """Cumule des paiements dans la transaction de l'appelant
+
+        La table doit être prête (`_ensure_table()`) AVANT d'ouvrir la transaction:
+        un backfill initial ne doit pas attendre les verrous de l'appelant.
+
+        Args:
+            cursor: Curseur de la transaction qui insère payment_history
+            payments: (student_id, payment_method, amount, created_at)
+        """
+        payments = list(payments)
+        if not payments:
+            return
+        student_ids = sorted({int(payment[0]) for payment in payments})
+        placeholders = ", ".join(["%s"] * len(student_ids))
+        cursor.execute(
+            f"""
+            SELECT s.id AS student_id, COALESCE(p.id, 0) AS promotion_id,
+                   COALESCE(p.department_id, 0) AS department_id, COALESCE(d.faculty_id, 0) AS faculty_id
+            FROM student s
+            LEFT JOIN promotion p ON s.promotion_id = p.id
+            LEFT JOIN department d ON p.department_id = d.id
+            WHERE s.id IN ({placeholders})
+            """,
+            tuple(student_ids)
+        )
+        scopes_by_student = {}
+        for row in cursor.fetchall():
+            row = row if isinstance(row, dict) else dict(zip(cursor.column_names, row))
+            scopes = [(SCOPE_OVERALL, 0)]
+            for scope, column in ((SCOPE_FACULTY, "faculty_id"), (SCOPE_DEPARTMENT, "department_id"),
+                                  (SCOPE_PROMOTION, "promotion_id")):
+                if row[column]:
+                    scopes.append((scope, int(row[column])))
+            scopes_by_student[int(row["student_id"])] = scopes
+
+        totals = {}
+        for student_id, method, amount, created_at in payments:
+            method = (method or DEFAULT_PAYMENT_METHOD)[:50]
+            for period in (PERIOD_DAY, PERIOD_MONTH):
+                start = _period_start(period, created_at or datetime.now())
+                for scope, scope_id in scopes_by_student.get(int(student_id), [(SCOPE_OVERALL, 0)]):
+                    key = (period, scope, scope_id, start, method)
+                    count, total = totals.get(key, (0, Decimal("0")))
+                    totals[key] = (count + 1, total + Decimal(str(amount)))
+
+        # Ordre stable des clés: deux transactions concurrentes ne s'interbloquent pas
+        cursor.executemany(
+            """
+            INSERT INTO revenue_rollup (period, scope, scope_id, period_start, payment_method, payment_count, amount)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                payment_count = payment_count + VALUES(payment_count),
+                amount = amount + VALUES(amount)
+            """,
+            [(*key, count, str(total)) for key, (count, total) in sorted(totals.items())]
+        )
+
+    def backfill(self, since: date = None) -> int:
+        """Reconstruit les rollups depuis payment_history (depuis le mois de `since`)"""
+        try:
+            RevenueRollupService._table_ready = True
+            since_params: tuple = ()
+            if since:
+                since = since.replace(day=1)
+                since_params = (since,)
+            inserted = 0
+            with self.db.transaction() as cursor:
+                if since:
+                    cursor.execute("DELETE FROM revenue_rollup WHERE period_start >= %s", since_params)
+                else:
+                    cursor.execute("DELETE FROM revenue_rollup")
+                for period, start_sql in _PERIOD_START_SQL.items():
+                    for scope, scope_sql in _SCOPE_ID_SQL.items():
+                        conditions = []
+                        if since:
+                            conditions.append("ph.created_at >= %s")
+                        if scope != SCOPE_OVERALL:
+                            conditions.append(f"{scope_sql} IS NOT NULL")
+                        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                        cursor.execute(
+                            f"""
+                            INSERT INTO revenue_rollup
+                                (period, scope, scope_id, period_start, payment_method, payment_count, amount)
+                            SELECT %s, %s, {scope_sql}, {start_sql},
+                                   LEFT(COALESCE(ph.payment_method, %s), 50),
+                                   COUNT(*), COALESCE(SUM(ph.amount_paid_usd), 0)
+                            FROM payment_history ph
+                            JOIN student s ON s.id = ph.student_id
+                            LEFT JOIN promotion p ON s.promotion_id = p.id
+                            LEFT JOIN department d ON p.department_id = d.id
+                            {where}
+                            GROUP BY {scope_sql}, {start_sql}, LEFT(COALESCE(ph.payment_method, %s), 50)
+                            """,
+                            (period, scope, DEFAULT_PAYMENT_METHOD, *since_params, DEFAULT_PAYMENT_METHOD)
+                        )
+                        inserted += cursor.rowcount
+            logger.info(f"Revenue rollups backfilled: {inserted} row(s)")
+            return inserted
+        except Exception as e:
+            logger.error(f"Error backfilling revenue rollups: {e}")
+            return 0
+
+    # ---------- Lecture ----------
+
+    def get_series(self, period: str = PERIOD_DAY, start: date = None, end: date = None,
+                   scope: str = SCOPE_OVERALL, scope_id: int = 0,
+                   payment_method: str = None, fill_gaps: bool = True) -> List[dict]:
+        """Série [{period_start, payment_count, amount}] prête pour un graphique
+
+        Par défaut: les 30 derniers jours (ou 12 derniers mois), tous modes confondus.
+        """
+        self._ensure_table()
+        end = end or date.today()
+        if start is None:
+            start = end - timedelta(days=29) if period == PERIOD_DAY else \
+                (end.replace(day=1) - timedelta(days=335)).replace(day=1)
+        start, end = _period_start(period, start), _period_start(period, end)
+        method_filter = " AND payment_method = %s" if payment_method else ""
+        params = (period, scope, scope_id, start, end) + ((payment_method,) if payment_method else ())
+        try:
+            rows = self.db.execute_query(
+                f"""
+                SELECT period_start, SUM(payment_count) AS payment_count, SUM(amount) AS amount
+                FROM revenue_rollup
+                WHERE period = %s AND scope = %s AND scope_id = %s
+                  AND period_start BETWEEN %s AND %s{method_filter}
+                GROUP BY period_start
+                ORDER BY period_start
+                """,
+                params
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading revenue series: {e}")
+            return []
+
+        series = [
+            {"period_start": row["period_start"], "payment_count": int(row["payment_count"] or 0),
+             "amount": float(row["amount"] or 0)}
+            for row in rows
+        ]
+        if not fill_gaps:
+            return series
+        by_start = {row["period_start"]: row for row in series}
+        filled = []
+        current = start
+        while current <= end:
+            filled.append(by_start.get(current, {"period_start": current, "payment_count": 0, "amount": 0.0}))
+            if period == PERIOD_MONTH:
+                current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            else:
+                current += timedelta(days=1)
+        return filled
+
+    def get_breakdown(self, scope: str, start: date, end: date, period: str = PERIOD_DAY) -> List[dict]:
+        """Totaux par portée (faculté, département ou promotion) sur un intervalle"""
+        self._ensure_table()
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT scope_id, SUM(payment_count) AS payment_count, SUM(amount) AS amount
+                FROM revenue_rollup
+                WHERE period = %s AND scope = %s AND period_start BETWEEN %s AND %s
+                GROUP BY scope_id
+                ORDER BY amount DESC
+                """,
+                (period, scope, _period_start(period, start), _period_start(period, end))
+            ) or []
+            return [
+                {"scope_id": row["scope_id"], "payment_count": int(row["payment_count"] or 0),
+                 "amount": float(row["amount"] or 0)}
+                for row in rows
+            ]
+        except Exception as e:
+            logger.error(f"Error reading revenue breakdown for {scope}: {e}")
+            return []
+
+    def get_method_breakdown(self, start: date, end: date, scope: str = SCOPE_OVERALL,
+                             scope_id: int = 0, period: str = PERIOD_DAY) -> List[dict]:
+        """Totaux par mode de paiement sur un intervalle"""
+        self._ensure_table()
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT payment_method, SUM(payment_count) AS payment_count, SUM(amount) AS amount
+                FROM revenue_rollup
+                WHERE period = %s AND scope = %s AND scope_id = %s AND period_start BETWEEN %s AND %s
+                GROUP BY payment_method
+                ORDER BY amount DESC
+                """,
+                (period, scope, scope_id, _period_start(period, start), _period_start(period, end))
+            ) or []
+            return [
+                {"payment_method": row["payment_method"], "payment_count": int(row["payment_count"] or 0),
+                 "amount": float(row["amount"] or 0)}
+                for row in rows
+            ]
+        except Exception as e:
+            logger.error(f"Error reading payment method breakdown: {e}")
+            return []
@@ -0,0 +1,171 @@
+"""Pool borné pour les effets de bord financiers (notifications, codes d'accès)
+
+Un paiement ne démarre plus son propre thread: les tâches passent par une file
+bornée servie par un nombre fixe de workers. Cela limite les sessions SMTP et
+les connexions MySQL ouvertes en même temps (pool de 20).
+
+Quand la file est pleine, la politique s'applique:
+- block: l'appelant attend une place (durée bornée), puis la tâche est abandonnée;
+- caller_runs: la tâche s'exécute dans le thread appelant (ralentit la source);
+- drop: la tâche est abandonnée immédiatement et comptée.
+
+`drain()` (appelé aussi à la sortie du processus) termine les tâches en file.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+POLICY_BLOCK = "block"
+POLICY_CALLER_RUNS = "caller_runs"
+POLICY_DROP = "drop"
+
+_STOP = object()
+
+
+class SideEffectExecutor:
+    """File bornée + workers fixes, avec politique de saturation et métriques"""
+
+    def __init__(self, workers: int = None, queue_size: int = None, policy: str = None,
+                 block_timeout_s: float = None, name: str = "finance-side-effect"):
+        self.workers = max(1, workers or settings.FINANCE_SIDE_EFFECT_WORKERS)
+        self.policy = (policy or settings.FINANCE_SIDE_EFFECT_POLICY).lower()
+        if self.policy not in (POLICY_BLOCK, POLICY_CALLER_RUNS, POLICY_DROP):
+            logger.warning(f"Unknown side effect policy {self.policy!r}, using {POLICY_BLOCK!r}")
+            self.policy = POLICY_BLOCK
+        self.block_timeout_s = block_timeout_s if block_timeout_s is not None \
+            else settings.FINANCE_SIDE_EFFECT_BLOCK_TIMEOUT_S
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size or settings.FINANCE_SIDE_EFFECT_QUEUE_SIZE))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._latencies = deque(maxlen=1000)
+        self._metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "caller_runs": 0,
+            "max_queue_depth": 0,
+        }
+
+    def _start_workers(self) -> None:
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, func: Callable, *args, task_name: str = None, **kwargs) -> bool:
+        """Met une tâche en file; retourne False si elle a été abandonnée"""
+        task_name = task_name or getattr(func, "__name__", "task")
+        if not self._accepting:
+            logger.warning(f"Side effect {task_name} rejected: executor is draining")
+            with self._lock:
+                self._metrics["dropped"] += 1
+            return False
+        if len(self._threads) < self.workers:
+            self._start_workers()
+
+        task = (func, args, kwargs, task_name, time.monotonic())
+        with self._lock:
+            self._metrics["submitted"] += 1
+        try:
+            if self.policy == POLICY_BLOCK:
+                self._queue.put(task, timeout=self.block_timeout_s)
+            else:
+                self._queue.put_nowait(task)
+        except queue.Full:
+            if self.policy == POLICY_CALLER_RUNS:
+                with self._lock:
+                    self._metrics["caller_runs"] += 1
+                self._run(task)
+                return True
+            with self._lock:
+                self._metrics["dropped"] += 1
+            logger.error(f"Side effect {task_name} dropped: queue full ({self._queue.maxsize})")
+            return False
+
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self._metrics["max_queue_depth"]:
+                self._metrics["max_queue_depth"] = depth
+        return True
+
+    def _run(self, task) -> None:
+        func, args, kwargs, task_name, enqueued_at = task
+        started = time.monotonic()
+        try:
+            func(*args, **kwargs)
+            outcome = "completed"
+        except Exception as e:
+            outcome = "failed"
+            logger.error(f"Side effect {task_name} failed: {e}", exc_info=True)
+        finished = time.monotonic()
+        with self._lock:
+            self._metrics[outcome] += 1
+            self._latencies.append((started - enqueued_at, finished - started))
+
+    def _worker(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _STOP:
+                    return
+                self._run(task)
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Refuse les nouvelles tâches, termine celles en file; True si tout est traité"""
+        timeout = settings.FINANCE_SIDE_EFFECT_DRAIN_TIMEOUT_S if timeout is None else timeout
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            if not any(thread.is_alive() for thread in self._threads):
+                break
+            time.sleep(0.05)
+        remaining = self._queue.unfinished_tasks
+        for thread in self._threads:
+            if thread.is_alive():
+                try:
+                    self._queue.put_nowait(_STOP)
+                except queue.Full:
+                    break
+        if remaining:
+            logger.warning(f"Side effect executor drained with {remaining} task(s) left")
+        return remaining == 0
+
+    def get_metrics(self) -> dict:
+        """Profondeur de file, compteurs et latences (attente en file / exécution)"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            latencies = list(self._latencies)
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["queue_limit"] = self._queue.maxsize
+        metrics["workers"] = self.workers
+        metrics["policy"] = self.policy
+        if latencies:
+            waits = sorted(wait for wait, _ in latencies)
+            runs = sorted(run for _, run in latencies)
+            p95 = max(0, int(len(waits) * 0.95) - 1)
+            metrics.update({
+                "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 2),
+                "wait_p95_ms": round(waits[p95] * 1000, 2),
+                "run_avg_ms": round(sum(runs) / len(runs) * 1000, 2),
+                "run_p95_ms": round(runs[p95] * 1000, 2),
+            })
+        return metrics
+
+
+# Instance partagée par les services financiers du processus
+finance_side_effects = SideEffectExecutor()
+atexit.register(finance_side_effects.drain)
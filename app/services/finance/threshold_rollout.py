@@ -0,0 +1,276 @@
+"""Déploiement d'un changement de seuil financier par blocs (reprise après incident)
+
+Au lieu de plusieurs UPDATE sur toute l'année académique, chaque bloc de
+profils (par clé primaire croissante) est traité dans une transaction courte:
+seuil, frais, éligibilité, expiration des codes partiels, agrégats du tableau de
+bord et avancement du job. Un crash laisse le job en 'running' avec le dernier
+student_id traité: `resume_pending()` reprend exactement là où il s'était arrêté.
+
+Les notifications de chaque bloc sont mises en file dans l'outbox durable, dans
+la transaction du bloc, sous une campagne déterministe (job + premier student_id
+du bloc): un bloc rejoué après un crash ne crée pas de doublon. L'émission des
+codes d'accès (hachage bcrypt) passe par le pool borné des effets de bord
+financiers, jamais par le thread de l'appelant ni sous les verrous du bloc.
+"""
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Optional
+from config.settings import THRESHOLD_ROLLOUT_CHUNK_SIZE
+from core.database.connection import DatabaseConnection
+from app.services.finance.side_effect_executor import finance_side_effects
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_SUPERSEDED = "superseded"
+
+
+class ThresholdRolloutService:
+    """Job de mise à jour d'un seuil par blocs, avec avancement persistant"""
+
+    _table_ready = False
+
+    def __init__(self, finance_service, chunk_size: int = None):
+        self.db = DatabaseConnection()
+        self.finance_service = finance_service
+        self.chunk_size = chunk_size or THRESHOLD_ROLLOUT_CHUNK_SIZE
+
+    def _ensure_table(self) -> None:
+        """Crée la table d'avancement des jobs si nécessaire"""
+        if ThresholdRolloutService._table_ready:
+            return
+        try:
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS threshold_rollout (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    academic_year_id INT NOT NULL,
+                    threshold_amount DECIMAL(15, 2) NOT NULL,
+                    final_fee DECIMAL(15, 2) NOT NULL,
+                    old_threshold DECIMAL(15, 2) DEFAULT NULL,
+                    old_final_fee DECIMAL(15, 2) DEFAULT NULL,
+                    status ENUM('running', 'completed', 'superseded') NOT NULL DEFAULT 'running',
+                    last_student_id INT NOT NULL DEFAULT 0,
+                    processed INT NOT NULL DEFAULT 0,
+                    newly_eligible INT NOT NULL DEFAULT 0,
+                    started_at DATETIME NOT NULL,
+                    updated_at DATETIME NOT NULL,
+                    finished_at DATETIME DEFAULT NULL,
+                    INDEX idx_status (status),
+                    INDEX idx_year (academic_year_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            ThresholdRolloutService._table_ready = True
+        except Exception as e:
+            logger.error(f"Error ensuring threshold_rollout table: {e}")
+
+    # ---------- Job ----------
+
+    def start(self, academic_year_id: int, threshold_amount: Decimal, final_fee: Decimal,
+              old_threshold: Decimal = None, old_final_fee: Decimal = None,
+              progress_callback: Optional[Callable[[int, int], None]] = None) -> Optional[int]:
+        """Crée le job (remplace un job en cours pour la même année) et l'exécute"""
+        self._ensure_table()
+        now = datetime.now()
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                """
+                UPDATE threshold_rollout SET status = %s, updated_at = %s
+                WHERE academic_year_id = %s AND status = %s
+                """,
+                (STATUS_SUPERSEDED, now, academic_year_id, STATUS_RUNNING)
+            )
+            cursor.execute(
+                """
+                INSERT INTO threshold_rollout
+                    (academic_year_id, threshold_amount, final_fee, old_threshold, old_final_fee,
+                     status, started_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (academic_year_id, str(threshold_amount), str(final_fee),
+                 str(old_threshold) if old_threshold is not None else None,
+                 str(old_final_fee) if old_final_fee is not None else None,
+                 STATUS_RUNNING, now, now)
+            )
+            rollout_id = cursor.lastrowid
+        return rollout_id if self.run(rollout_id, progress_callback) else None
+
+    def resume_pending(self) -> int:
+        """Reprend les jobs interrompus (crash, fermeture); retourne leur nombre"""
+        self._ensure_table()
+        try:
+            rows = self.db.execute_query(
+                "SELECT id FROM threshold_rollout WHERE status = %s ORDER BY id",
+                (STATUS_RUNNING,)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error loading pending threshold rollouts: {e}")
+            return 0
+        for row in rows:
+            logger.info(f"Resuming threshold rollout {row['id']}")
+            self.run(row["id"])
+        return len(rows)
+
+    def get_rollout(self, rollout_id: int) -> Optional[dict]:
+        """État d'avancement d'un job"""
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT id, academic_year_id, status, last_student_id, processed, newly_eligible,
+                       started_at, updated_at, finished_at
+                FROM threshold_rollout WHERE id = %s
+                """,
+                (rollout_id,)
+            )
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"Error reading threshold rollout {rollout_id}: {e}")
+            return None
+
+    def run(self, rollout_id: int, progress_callback: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Traite les blocs restants du job jusqu'à la fin"""
+        job = self.db.execute_query(
+            """
+            SELECT academic_year_id, threshold_amount, final_fee, old_threshold, old_final_fee
+            FROM threshold_rollout WHERE id = %s
+            """,
+            (rollout_id,)
+        )
+        if not job:
+            logger.error(f"Threshold rollout {rollout_id} not found")
+            return False
+        job = job[0]
+        academic_year_id = job["academic_year_id"]
+        threshold = Decimal(str(job["threshold_amount"]))
+        final_fee = Decimal(str(job["final_fee"]))
+        old_threshold = Decimal(str(job["old_threshold"])) if job["old_threshold"] is not None else None
+        old_final_fee = Decimal(str(job["old_final_fee"])) if job["old_final_fee"] is not None else None
+
+        # Tables annexes prêtes avant de prendre des verrous (DDL / reconstruction initiale)
+        self.finance_service.aggregates._ensure_table()
+        notification_service = self.finance_service.notification_service
+        notification_service.outbox._ensure_table()
+        # Annuaire chargé hors transaction (lectures des blocs en mémoire)
+        self.finance_service.recipients.get_many([])
+        columns = self.finance_service._get_table_columns("finance_profile")
+        assignments = ["threshold_required = %s"]
+        if "final_fee" in columns:
+            assignments.append("final_fee = %s")
+        if "is_eligible" in columns:
+            assignments.append("is_eligible = (amount_paid >= %s)")
+        if "access_code_type" in columns and "access_code_expires_at" in columns:
+            # Les accès partiels doivent être réémis selon le nouveau seuil
+            assignments.append(
+                "access_code_expires_at = CASE WHEN access_code_type = 'partial' "
+                "THEN %s ELSE access_code_expires_at END"
+            )
+        assignments.append("updated_at = %s")
+
+        total = 0
+        try:
+            rows = self.db.execute_query(
+                "SELECT COUNT(*) AS cnt FROM finance_profile WHERE academic_year_id = %s",
+                (academic_year_id,)
+            )
+            total = int(rows[0]["cnt"]) if rows else 0
+        except Exception as e:
+            logger.warning(f"Unable to count profiles for rollout {rollout_id}: {e}")
+
+        try:
+            while True:
+                now = datetime.now()
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        "SELECT status, last_student_id, processed FROM threshold_rollout WHERE id = %s FOR UPDATE",
+                        (rollout_id,)
+                    )
+                    state = cursor.fetchone()
+                    if not state or state["status"] != STATUS_RUNNING:
+                        logger.info(f"Threshold rollout {rollout_id} stopped (status: {state and state['status']})")
+                        return False
+
+                    # Lecture verrouillante: pas d'instantané avant le verrouillage des profils
+                    cursor.execute(
+                        """
+                        SELECT student_id FROM finance_profile
+                        WHERE academic_year_id = %s AND student_id > %s
+                        ORDER BY student_id
+                        LIMIT %s
+                        FOR UPDATE
+                        """,
+                        (academic_year_id, state["last_student_id"], self.chunk_size)
+                    )
+                    chunk_ids = [row["student_id"] for row in cursor.fetchall()]
+                    if not chunk_ids:
+                        cursor.execute(
+                            """
+                            UPDATE threshold_rollout SET status = %s, updated_at = %s, finished_at = %s
+                            WHERE id = %s
+                            """,
+                            (STATUS_COMPLETED, now, now, rollout_id)
+                        )
+                        break
+
+                    placeholders = ", ".join(["%s"] * len(chunk_ids))
+                    newly_eligible = []
+                    with self.finance_service.aggregates.track_students(cursor, chunk_ids):
+                        if "is_eligible" in columns:
+                            cursor.execute(
+                                f"""
+                                SELECT student_id FROM finance_profile
+                                WHERE student_id IN ({placeholders}) AND is_eligible = 0 AND amount_paid >= %s
+                                """,
+                                (*chunk_ids, str(threshold))
+                            )
+                            newly_eligible = [row["student_id"] for row in cursor.fetchall()]
+
+                        params = [str(threshold)]
+                        if "final_fee" in columns:
+                            params.append(str(final_fee))
+                        if "is_eligible" in columns:
+                            params.append(str(threshold))
+                        if "access_code_type" in columns and "access_code_expires_at" in columns:
+                            params.append(now)
+                        params.append(now)
+                        cursor.execute(
+                            f"UPDATE finance_profile SET {', '.join(assignments)} WHERE student_id IN ({placeholders})",
+                            (*params, *chunk_ids)
+                        )
+
+                    processed = state["processed"] + len(chunk_ids)
+                    cursor.execute(
+                        """
+                        UPDATE threshold_rollout
+                        SET last_student_id = %s, processed = %s, newly_eligible = newly_eligible + %s,
+                            updated_at = %s
+                        WHERE id = %s
+                        """,
+                        (chunk_ids[-1], processed, len(newly_eligible), now, rollout_id)
+                    )
+
+                    # Notifications validées (ou annulées) avec le bloc
+                    self.finance_service._notify_threshold_change(
+                        academic_year_id, threshold, final_fee, old_threshold, old_final_fee,
+                        student_ids=chunk_ids, cursor=cursor,
+                        campaign_id=f"threshold_rollout:{rollout_id}:{chunk_ids[0]}"
+                    )
+
+                notification_service.outbox.wake()
+                self.finance_service.eligibility.refresh_students(chunk_ids)
+                # Bloc validé: codes d'accès hors transaction et hors du thread appelant
+                if newly_eligible:
+                    finance_side_effects.submit(
+                        self.finance_service.issue_access_codes_bulk, newly_eligible,
+                        task_name=f"threshold_access_codes:{rollout_id}"
+                    )
+                if progress_callback:
+                    progress_callback(processed, max(total, processed))
+
+            logger.info(f"Threshold rollout {rollout_id} completed for academic year {academic_year_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Threshold rollout {rollout_id} interrupted: {e}")
+            return False
@@ -0,0 +1,85 @@
+"""Regroupement des notifications d'un même destinataire (fenêtre de coalescence)
+
+Un caissier qui saisit trois tranches d'affilée, ou un paiement suivi de
+l'émission du code d'accès, envoyait plusieurs emails/WhatsApp en quelques
+secondes. Les types regroupables sont mis en file avec un délai de
+NOTIFICATION_COALESCE_WINDOW_S; quand l'un d'eux est réclamé, l'outbox y
+fusionne les autres messages en attente pour le même destinataire et canal:
+
+- reçus de paiement: le plus récent remplace les précédents (il porte le
+  cumul payé et le reste dû); idem pour les changements de seuil;
+- types différents (ex: reçu + nouveau code d'accès): concaténés dans un seul
+  message, dans l'ordre chronologique;
+- types urgents (code d'accès, accès refusé): réclamés sans délai; un code
+  d'accès emporte avec lui les reçus encore en attente.
+"""
+from html import escape
+from typing import Dict, List
+from config import settings
+
+COALESCIBLE_KINDS = ("payment", "access_code", "threshold_change", "welcome")
+URGENT_KINDS = ("access_code", "access_denied")
+# Seul le plus récent compte: l'état qu'il décrit remplace les précédents
+SUPERSEDING_KINDS = ("payment", "threshold_change", "access_code")
+
+_LABELS = {
+    "payment": "Paiement",
+    "access_code": "Code d'accès",
+    "threshold_change": "Seuil financier",
+    "welcome": "Bienvenue",
+}
+_TEXT_SEPARATOR = "\n\n" + "─" * 32 + "\n\n"
+_HTML_SEPARATOR = "<hr style='border:none;border-top:1px solid #ddd;margin:20px 0;'/>"
+
+
+def coalesce_delay_s(kind: str) -> float:
+    """Délai de mise en file: fenêtre pour les types regroupables, 0 pour les urgents"""
+    if kind in URGENT_KINDS or kind not in COALESCIBLE_KINDS:
+        return 0.0
+    return max(0.0, settings.NOTIFICATION_COALESCE_WINDOW_S)
+
+
+def is_coalescible(kind: str) -> bool:
+    return settings.NOTIFICATION_COALESCE_WINDOW_S > 0 and kind in COALESCIBLE_KINDS
+
+
+def select_parts(rows: List[dict]) -> List[dict]:
+    """Messages conservés après remplacement des plus anciens (ordre chronologique)"""
+    latest: Dict[str, dict] = {}
+    kept = []
+    for row in sorted(rows, key=lambda r: r["id"]):
+        if row["kind"] in SUPERSEDING_KINDS:
+            latest[row["kind"]] = row
+        else:
+            kept.append(row)
+    kept.extend(latest.values())
+    return sorted(kept, key=lambda r: r["id"])
+
+
+def merge(rows: List[dict]) -> dict:
+    """Contenu fusionné {kind, subject, body, html_body, attach_logo} de messages d'un destinataire"""
+    parts = select_parts(rows)
+    if len(parts) == 1:
+        part = parts[0]
+        return {key: part.get(key) for key in ("kind", "subject", "body", "html_body", "attach_logo")}
+
+    kinds = []
+    for part in parts:
+        if part["kind"] not in kinds:
+            kinds.append(part["kind"])
+    subject = " + ".join(_LABELS.get(kind, kind) for kind in kinds) + " - U.O.R"
+
+    html_body = None
+    if any(part.get("html_body") for part in parts):
+        html_body = _HTML_SEPARATOR.join(
+            part["html_body"] or
+            f"<div style=\"font-family:Arial, sans-serif; color:#111; white-space:pre-wrap;\">{escape(part['body'], quote=False)}</div>"
+            for part in parts
+        )
+    return {
+        "kind": "+".join(kinds)[:40],
+        "subject": subject,
+        "body": _TEXT_SEPARATOR.join(part["body"] for part in parts),
+        "html_body": html_body,
+        "attach_logo": 1 if any(part.get("attach_logo") for part in parts) else 0,
+    }
@@ -0,0 +1,361 @@
+"""Registre des livraisons de notifications et agrégats horaires par canal
+
+Chaque tentative de livraison de l'outbox (envoyée, à réessayer, abandonnée)
+est notée en mémoire puis écrite par lots (NOTIFICATION_LEDGER_BATCH_SIZE
+lignes ou toutes les NOTIFICATION_LEDGER_FLUSH_S secondes), dans une seule
+transaction avec la mise à jour des agrégats horaires:
+
+- notification_delivery: une ligne par tentative (canal, voie de priorité,
+  destinataire, type, numéro d'essai, latence fournisseur, attente en file,
+  statut, erreur);
+- notification_delivery_hourly: par heure, canal et voie, compteurs par
+  statut, somme/maximum des latences et de l'attente, nombre d'envois lents.
+
+Le tableau de bord lit uniquement ces tables (voir DashboardService) pour
+dimensionner les workers et repérer un fournisseur qui ralentit.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+from config import settings
+from core.database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_SENT = "sent"
+OUTCOME_RETRY = "retry"
+OUTCOME_DEAD = "dead"
+DEFAULT_LANE = "transactional"
+
+
+@dataclass
+class DeliveryRecord:
+    """Résultat d'une tentative de livraison"""
+
+    outbox_id: int
+    kind: str
+    channel: str
+    lane: str
+    recipient: str
+    outcome: str
+    attempt: int
+    latency_ms: int
+    queue_ms: Optional[int]
+    error: Optional[str]
+    recorded_at: datetime
+
+
+class DeliveryLedger:
+    """Tampon des résultats de livraison, écrit par lots avec ses agrégats horaires"""
+
+    _tables_ready = False
+
+    def __init__(self):
+        self._db = None
+        self._buffer: List[DeliveryRecord] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    def _ensure_tables(self) -> None:
+        if DeliveryLedger._tables_ready:
+            return
+        try:
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS notification_delivery (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    outbox_id BIGINT NOT NULL,
+                    kind VARCHAR(40) NOT NULL,
+                    channel ENUM('email', 'whatsapp') NOT NULL,
+                    lane ENUM('transactional', 'bulk') NOT NULL DEFAULT 'transactional',
+                    recipient VARCHAR(255) NOT NULL,
+                    outcome ENUM('sent', 'retry', 'dead') NOT NULL,
+                    attempt INT NOT NULL,
+                    latency_ms INT NOT NULL,
+                    queue_ms INT DEFAULT NULL,
+                    error VARCHAR(255) DEFAULT NULL,
+                    recorded_at DATETIME NOT NULL,
+                    INDEX idx_delivery_time (recorded_at),
+                    INDEX idx_delivery_channel_time (channel, recorded_at),
+                    INDEX idx_delivery_lane_time (lane, recorded_at),
+                    INDEX idx_delivery_recipient (recipient, recorded_at),
+                    INDEX idx_delivery_outbox (outbox_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS notification_delivery_hourly (
+                    hour_start DATETIME NOT NULL,
+                    channel ENUM('email', 'whatsapp') NOT NULL,
+                    lane ENUM('transactional', 'bulk') NOT NULL DEFAULT 'transactional',
+                    sent INT NOT NULL DEFAULT 0,
+                    retried INT NOT NULL DEFAULT 0,
+                    dead INT NOT NULL DEFAULT 0,
+                    latency_ms_sum BIGINT NOT NULL DEFAULT 0,
+                    latency_ms_max INT NOT NULL DEFAULT 0,
+                    queue_ms_sum BIGINT NOT NULL DEFAULT 0,
+                    queue_ms_max INT NOT NULL DEFAULT 0,
+                    slow INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour_start, channel, lane)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            self._upgrade_tables()
+            DeliveryLedger._tables_ready = True
+        except Exception as e:
+            logger.error(f"Error ensuring notification delivery tables: {e}")
+
+    def _upgrade_tables(self) -> None:
+        """Ajoute la voie de priorité aux tables créées par une version antérieure"""
+        columns = {}
+        for row in self.db.execute_query(
+            """
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME IN ('notification_delivery', 'notification_delivery_hourly')
+            """
+        ) or []:
+            columns.setdefault(row.get("TABLE_NAME"), set()).add(row.get("COLUMN_NAME"))
+        lane = "ADD COLUMN lane ENUM('transactional', 'bulk') NOT NULL DEFAULT 'transactional'"
+        if "lane" not in columns.get("notification_delivery", {"lane"}):
+            self.db.execute_update(
+                f"ALTER TABLE notification_delivery {lane}, ADD INDEX idx_delivery_lane_time (lane, recorded_at)"
+            )
+            logger.info("notification_delivery upgraded: lane column")
+        hourly = columns.get("notification_delivery_hourly", {"lane", "queue_ms_max"})
+        changes = []
+        if "lane" not in hourly:
+            changes += [lane, "DROP PRIMARY KEY", "ADD PRIMARY KEY (hour_start, channel, lane)"]
+        if "queue_ms_max" not in hourly:
+            changes.append("ADD COLUMN queue_ms_max INT NOT NULL DEFAULT 0")
+        if changes:
+            self.db.execute_update(f"ALTER TABLE notification_delivery_hourly {', '.join(changes)}")
+            logger.info(f"notification_delivery_hourly upgraded: {len(changes)} change(s)")
+
+    # ---------- Écriture ----------
+
+    def record(self, row: dict, outcome: str, latency_s: float, queue_s: float = None, error: str = None) -> None:
+        """Note le résultat d'une tentative (appelé par les workers de l'outbox, sans I/O)
+
+        queue_s: attente entre le moment où le message était prêt et sa prise
+        en charge par un worker.
+        """
+        now = datetime.now()
+        queue_ms = None if queue_s is None else max(0, int(queue_s * 1000))
+        record = DeliveryRecord(
+            outbox_id=int(row["id"]), kind=str(row.get("kind") or "")[:40], channel=row["channel"],
+            lane=row.get("lane") or DEFAULT_LANE, recipient=str(row.get("recipient") or "")[:255], outcome=outcome,
+            attempt=int(row.get("attempts") or 1), latency_ms=max(0, int(latency_s * 1000)),
+            queue_ms=queue_ms, error=(error or None) and error[:255], recorded_at=now,
+        )
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= settings.NOTIFICATION_LEDGER_BATCH_SIZE
+        self._start_flusher()
+        if full:
+            self._wakeup.set()
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="notification-ledger", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(settings.NOTIFICATION_LEDGER_FLUSH_S)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Écrit le tampon (registre + agrégats) en une transaction; retourne le nombre de lignes"""
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            self._ensure_tables()
+            try:
+                with self.db.transaction() as cursor:
+                    cursor.executemany(
+                        """
+                        INSERT INTO notification_delivery
+                            (outbox_id, kind, channel, lane, recipient, outcome, attempt, latency_ms,
+                             queue_ms, error, recorded_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        """,
+                        [(r.outbox_id, r.kind, r.channel, r.lane, r.recipient, r.outcome, r.attempt, r.latency_ms,
+                          r.queue_ms, r.error, r.recorded_at) for r in records]
+                    )
+                    cursor.executemany(
+                        """
+                        INSERT INTO notification_delivery_hourly
+                            (hour_start, channel, lane, sent, retried, dead, latency_ms_sum, latency_ms_max,
+                             queue_ms_sum, queue_ms_max, slow)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            sent = sent + VALUES(sent),
+                            retried = retried + VALUES(retried),
+                            dead = dead + VALUES(dead),
+                            latency_ms_sum = latency_ms_sum + VALUES(latency_ms_sum),
+                            latency_ms_max = GREATEST(latency_ms_max, VALUES(latency_ms_max)),
+                            queue_ms_sum = queue_ms_sum + VALUES(queue_ms_sum),
+                            queue_ms_max = GREATEST(queue_ms_max, VALUES(queue_ms_max)),
+                            slow = slow + VALUES(slow)
+                        """,
+                        self._hourly_rows(records)
+                    )
+                return len(records)
+            except Exception as e:
+                logger.error(f"Error writing {len(records)} notification delivery record(s): {e}")
+                # Remis en tête du tampon pour le prochain lot (borné pour ne pas croître sans fin)
+                with self._lock:
+                    self._buffer = (records + self._buffer)[-settings.NOTIFICATION_LEDGER_MAX_BUFFER:]
+                return 0
+
+    @staticmethod
+    def _hourly_rows(records: List[DeliveryRecord]) -> list:
+        slow_ms = settings.NOTIFICATION_SLOW_MS
+        totals = defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0, 0])
+        for r in records:
+            bucket = totals[(r.recorded_at.replace(minute=0, second=0, microsecond=0), r.channel, r.lane)]
+            bucket[("sent", "retry", "dead").index(r.outcome)] += 1
+            bucket[3] += r.latency_ms
+            bucket[4] = max(bucket[4], r.latency_ms)
+            bucket[5] += r.queue_ms or 0
+            bucket[6] = max(bucket[6], r.queue_ms or 0)
+            bucket[7] += 1 if r.latency_ms >= slow_ms else 0
+        return [(*key, *values) for key, values in sorted(totals.items())]
+
+    # ---------- Lecture (tableau de bord) ----------
+
+    def get_hourly(self, hours: int = 24, channel: str = None) -> list:
+        """Agrégats horaires récents: [{hour_start, channel, lane, sent, retried, dead, avg_latency_ms, ...}]"""
+        self._ensure_tables()
+        since = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=max(hours - 1, 0))
+        params = [since]
+        channel_filter = ""
+        if channel:
+            channel_filter = " AND channel = %s"
+            params.append(channel)
+        try:
+            rows = self.db.execute_query(
+                f"""
+                SELECT hour_start, channel, lane, sent, retried, dead, latency_ms_sum, latency_ms_max,
+                       queue_ms_sum, queue_ms_max, slow
+                FROM notification_delivery_hourly
+                WHERE hour_start >= %s{channel_filter}
+                ORDER BY hour_start, channel, lane
+                """,
+                tuple(params)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading hourly notification metrics: {e}")
+            return []
+        for row in rows:
+            attempts = int(row["sent"]) + int(row["retried"]) + int(row["dead"])
+            row["attempts"] = attempts
+            row["avg_latency_ms"] = round(int(row["latency_ms_sum"]) / attempts, 1) if attempts else 0.0
+            row["avg_queue_ms"] = round(int(row["queue_ms_sum"]) / attempts, 1) if attempts else 0.0
+            row["success_rate"] = round(int(row["sent"]) / attempts * 100, 1) if attempts else 0.0
+        return rows
+
+    def get_channel_summary(self, hours: int = 24, by: str = "channel") -> dict:
+        """Totaux sur la période par canal (ou par voie, `by="lane"`):
+        {clé: {sent, retried, dead, success_rate, avg/max latence, avg/max attente en file}}"""
+        summary = {}
+        for row in self.get_hourly(hours):
+            total = summary.setdefault(row[by], {
+                "sent": 0, "retried": 0, "dead": 0, "slow": 0,
+                "latency_ms_sum": 0, "latency_ms_max": 0, "queue_ms_sum": 0, "queue_ms_max": 0,
+            })
+            for key in ("sent", "retried", "dead", "slow", "latency_ms_sum", "queue_ms_sum"):
+                total[key] += int(row[key])
+            for key in ("latency_ms_max", "queue_ms_max"):
+                total[key] = max(total[key], int(row[key]))
+        for total in summary.values():
+            attempts = total["sent"] + total["retried"] + total["dead"]
+            total["attempts"] = attempts
+            total["success_rate"] = round(total["sent"] / attempts * 100, 1) if attempts else 0.0
+            total["avg_latency_ms"] = round(total.pop("latency_ms_sum") / attempts, 1) if attempts else 0.0
+            total["avg_queue_ms"] = round(total.pop("queue_ms_sum") / attempts, 1) if attempts else 0.0
+        return summary
+
+    def get_latency_percentiles(self, channel: str = None, minutes: int = 60, limit: int = 5000,
+                                lane: str = None, metric: str = "latency_ms") -> dict:
+        """p50/p95/p99 sur les dernières tentatives d'un canal et/ou d'une voie
+
+        metric: "latency_ms" (appel fournisseur) ou "queue_ms" (attente en file)
+        """
+        if metric not in ("latency_ms", "queue_ms"):
+            raise ValueError(f"Unknown delivery metric: {metric}")
+        self._ensure_tables()
+        filters = ["recorded_at >= %s", f"{metric} IS NOT NULL"]
+        params = [datetime.now() - timedelta(minutes=minutes)]
+        if channel:
+            filters.append("channel = %s")
+            params.append(channel)
+        if lane:
+            filters.append("lane = %s")
+            params.append(lane)
+        try:
+            rows = self.db.execute_query(
+                f"""
+                SELECT {metric} AS value FROM notification_delivery
+                WHERE {' AND '.join(filters)}
+                ORDER BY recorded_at DESC
+                LIMIT %s
+                """,
+                (*params, limit)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading notification {metric}: {e}")
+            return {}
+        values = sorted(int(row["value"]) for row in rows)
+        if not values:
+            return {"count": 0}
+
+        def pct(p: float) -> int:
+            return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+        return {"count": len(values), "p50": pct(50), "p95": pct(95), "p99": pct(99), "max": values[-1]}
+
+    def get_recipient_history(self, recipient: str, limit: int = 50) -> list:
+        """Dernières tentatives pour un destinataire (email ou numéro): l'étudiant a-t-il été notifié ?"""
+        self._ensure_tables()
+        try:
+            return self.db.execute_query(
+                """
+                SELECT outbox_id, kind, channel, lane, outcome, attempt, latency_ms, queue_ms, error, recorded_at
+                FROM notification_delivery
+                WHERE recipient = %s
+                ORDER BY recorded_at DESC
+                LIMIT %s
+                """,
+                (recipient, limit)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading delivery history for {recipient}: {e}")
+            return []
+
+
+# Instance partagée: les workers de l'outbox y notent chaque tentative
+delivery_ledger = DeliveryLedger()
+atexit.register(delivery_ledger.flush)
@@ -0,0 +1,633 @@
+"""Outbox persistante des notifications (email / WhatsApp)
+
+Les services n'envoient plus rien eux-mêmes: ils insèrent les messages rendus
+dans la table notification_outbox, au besoin dans leur propre transaction
+(le paiement et sa notification sont validés ensemble). Des workers par canal
+réclament les messages prêts par bail (lease), les délivrent et notent le
+résultat:
+
+- échec: nouvel essai avec délai exponentiel (+ gigue) jusqu'à
+  NOTIFICATION_MAX_ATTEMPTS, puis lettre morte (status 'dead');
+- crash pendant l'envoi: le bail expire et le message est réclamé à nouveau;
+- clé d'idempotence unique: un même événement n'est mis en file qu'une fois.
+
+Les types regroupables attendent une courte fenêtre et sont fusionnés par
+destinataire au moment de la réclamation (voir notification_coalescer).
+
+Un lot WhatsApp réclamé est délivré en parallèle (WHATSAPP_MAX_IN_FLIGHT);
+un 429 replanifie le message après le Retry-After annoncé.
+
+Deux voies de priorité par canal (colonne priority):
+- transactionnelle (codes d'accès, reçus de paiement...): des workers réservés
+  (NOTIFICATION_PRIORITY_*_WORKERS) ne réclament que cette voie, avec leur
+  propre part des requêtes WhatsApp en vol (WHATSAPP_PRIORITY_IN_FLIGHT);
+- masse (campagnes `broadcast`, changements de seuil): workers ordinaires, qui
+  servent d'abord la voie transactionnelle puis les campagnes, à une part
+  (NOTIFICATION_BULK_RATE_SHARE) du débit WhatsApp pour laisser de la marge
+  aux messages urgents.
+Un code d'accès n'attend donc jamais derrière une campagne; l'attente en
+file est mesurée par voie dans le registre des livraisons.
+
+Chaque tentative est notée dans le registre des livraisons (notification_ledger).
+
+Aucun message n'est perdu au redémarrage: les workers reprennent la table.
+Le réclamation utilise UPDATE ... ORDER BY ... LIMIT (compatible MySQL 5.7,
+sans SKIP LOCKED).
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from config import settings
+from core.database.connection import DatabaseConnection
+from app.services.integration import notification_coalescer
+from app.services.integration.rate_limit import TokenBucket
+from app.services.integration.notification_ledger import (
+    OUTCOME_DEAD, OUTCOME_RETRY, OUTCOME_SENT, delivery_ledger,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_EMAIL = "email"
+CHANNEL_WHATSAPP = "whatsapp"
+CHANNELS = (CHANNEL_EMAIL, CHANNEL_WHATSAPP)
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_DEAD = "dead"
+STATUS_MERGED = "merged"
+
+PRIORITY_TRANSACTIONAL = 0
+PRIORITY_BULK = 1
+LANES = {PRIORITY_TRANSACTIONAL: "transactional", PRIORITY_BULK: "bulk"}
+# Types mis en voie de masse hors `broadcast` (envoyés par vagues)
+BULK_KINDS = ("threshold_change",)
+
+
+def default_priority(kind: str) -> int:
+    return PRIORITY_BULK if kind in BULK_KINDS else PRIORITY_TRANSACTIONAL
+
+
+@dataclass
+class OutboxMessage:
+    """Message rendu, prêt à être délivré sur un canal"""
+
+    kind: str
+    channel: str
+    recipient: str
+    body: str
+    subject: Optional[str] = None
+    html_body: Optional[str] = None
+    attach_logo: bool = False
+    priority: Optional[int] = None   # None: selon le type (default_priority)
+
+
+class NotificationOutbox:
+    """File persistante + workers de livraison par canal"""
+
+    _table_ready = False
+
+    def __init__(self, deliverer=None):
+        self._db = None
+        self._deliverer = deliverer
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._wakeups = {(channel, lane): threading.Event() for channel in CHANNELS for lane in LANES}
+        self._stopping = threading.Event()
+        self._dispatchers = {}
+        self._bulk_bucket = None
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    @property
+    def deliverer(self):
+        if self._deliverer is None:
+            from app.services.integration.notification_service import NotificationService
+            self._deliverer = NotificationService()
+        return self._deliverer
+
+    def _ensure_table(self) -> None:
+        """Crée la table (à appeler avant d'ouvrir une transaction métier)"""
+        if NotificationOutbox._table_ready:
+            return
+        try:
+            self.db.execute_update(
+                """
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    idempotency_key VARCHAR(191) NOT NULL,
+                    kind VARCHAR(40) NOT NULL,
+                    channel ENUM('email', 'whatsapp') NOT NULL,
+                    recipient VARCHAR(255) NOT NULL,
+                    subject VARCHAR(255) DEFAULT NULL,
+                    body MEDIUMTEXT NOT NULL,
+                    html_body MEDIUMTEXT DEFAULT NULL,
+                    attach_logo TINYINT(1) NOT NULL DEFAULT 0,
+                    status ENUM('pending', 'sending', 'sent', 'dead', 'merged') NOT NULL DEFAULT 'pending',
+                    attempts INT NOT NULL DEFAULT 0,
+                    next_attempt_at DATETIME NOT NULL,
+                    lease_token CHAR(32) DEFAULT NULL,
+                    lease_until DATETIME DEFAULT NULL,
+                    last_error VARCHAR(500) DEFAULT NULL,
+                    created_at DATETIME NOT NULL,
+                    sent_at DATETIME DEFAULT NULL,
+                    merged_into BIGINT DEFAULT NULL,
+                    priority TINYINT NOT NULL DEFAULT 0,
+                    UNIQUE KEY uq_outbox_idempotency (idempotency_key),
+                    INDEX idx_outbox_ready (channel, status, next_attempt_at),
+                    INDEX idx_outbox_lane (channel, priority, status, next_attempt_at),
+                    INDEX idx_outbox_lease (lease_token),
+                    INDEX idx_outbox_recipient (recipient, channel, status)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            self._upgrade_table()
+            NotificationOutbox._table_ready = True
+        except Exception as e:
+            logger.error(f"Error ensuring notification_outbox table: {e}")
+
+    def _upgrade_table(self) -> None:
+        """Complète une table créée par une version antérieure (colonnes, index)"""
+        columns = {
+            row.get("COLUMN_NAME"): str(row.get("COLUMN_TYPE") or "")
+            for row in self.db.execute_query(
+                """
+                SELECT COLUMN_NAME, COLUMN_TYPE
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notification_outbox'
+                """
+            ) or []
+        }
+        indexes = {
+            row.get("INDEX_NAME")
+            for row in self.db.execute_query(
+                """
+                SELECT DISTINCT INDEX_NAME
+                FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notification_outbox'
+                """
+            ) or []
+        }
+        changes = []
+        if "merged" not in columns.get("status", "merged"):
+            changes.append("MODIFY COLUMN status ENUM('pending', 'sending', 'sent', 'dead', 'merged') "
+                           "NOT NULL DEFAULT 'pending'")
+        if "merged_into" not in columns:
+            changes.append("ADD COLUMN merged_into BIGINT DEFAULT NULL")
+        if "idx_outbox_recipient" not in indexes:
+            changes.append("ADD INDEX idx_outbox_recipient (recipient, channel, status)")
+        if "priority" not in columns:
+            changes.append("ADD COLUMN priority TINYINT NOT NULL DEFAULT 0")
+        if "idx_outbox_lane" not in indexes:
+            changes.append("ADD INDEX idx_outbox_lane (channel, priority, status, next_attempt_at)")
+        if changes:
+            self.db.execute_update(f"ALTER TABLE notification_outbox {', '.join(changes)}")
+            logger.info(f"notification_outbox upgraded: {len(changes)} change(s)")
+
+    # ---------- Mise en file ----------
+
+    def enqueue(self, messages: Iterable[OutboxMessage], idempotency_key: str = None, cursor=None) -> int:
+        """Insère des messages; retourne le nombre de nouvelles lignes
+
+        Args:
+            messages: Messages rendus (un par canal)
+            idempotency_key: Clé de l'événement métier; suffixée par le canal.
+                Sans clé, chaque appel crée de nouveaux messages.
+            cursor: Curseur de la transaction métier: les messages sont validés
+                (ou annulés) avec elle. La table doit alors être prête avant
+                l'ouverture de la transaction (`_ensure_table()`).
+        """
+        rows = self._rows(idempotency_key or uuid.uuid4().hex, messages, datetime.now())
+        if not rows:
+            return 0
+        if cursor is not None:
+            cursor.executemany(self._INSERT, rows)
+            inserted = cursor.rowcount
+        else:
+            self._ensure_table()
+            with self.db.transaction() as own_cursor:
+                own_cursor.executemany(self._INSERT, rows)
+                inserted = own_cursor.rowcount
+            self.wake()
+        self._start_workers()
+        return max(inserted or 0, 0)
+
+    def enqueue_many(self, items: Iterable[Tuple[str, List[OutboxMessage]]], cursor=None) -> int:
+        """Insère les messages de plusieurs événements en une transaction (campagnes)
+
+        Args:
+            items: (clé d'idempotence, messages) par destinataire
+            cursor: Curseur de la transaction métier (comme pour `enqueue`); l'appelant
+                réveille les workers après la validation
+        """
+        now = datetime.now()
+        rows = [row for key, messages in items for row in self._rows(key, messages, now)]
+        if not rows:
+            return 0
+        if cursor is not None:
+            cursor.executemany(self._INSERT, rows)
+            inserted = cursor.rowcount
+        else:
+            self._ensure_table()
+            with self.db.transaction() as own_cursor:
+                own_cursor.executemany(self._INSERT, rows)
+                inserted = own_cursor.rowcount
+            self.wake()
+        self._start_workers()
+        return max(inserted or 0, 0)
+
+    _INSERT = """
+        INSERT IGNORE INTO notification_outbox
+            (idempotency_key, kind, channel, recipient, subject, body, html_body,
+             attach_logo, status, next_attempt_at, created_at, priority)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
+    @staticmethod
+    def _rows(base_key: str, messages: Iterable[OutboxMessage], now: datetime) -> list:
+        # Types regroupables: prêts après la fenêtre de coalescence
+        return [
+            (f"{base_key}:{message.channel}"[:191], message.kind, message.channel, message.recipient[:255],
+             (message.subject or "")[:255] or None, message.body, message.html_body,
+             1 if message.attach_logo else 0, STATUS_PENDING,
+             now + timedelta(seconds=notification_coalescer.coalesce_delay_s(message.kind)), now,
+             default_priority(message.kind) if message.priority is None else message.priority)
+            for message in messages
+        ]
+
+    def wake(self, channel: str = None) -> None:
+        """Réveille les workers (après la validation d'une transaction métier)"""
+        for (name, _lane), event in self._wakeups.items():
+            if channel is None or channel == name:
+                event.set()
+
+    # ---------- Workers ----------
+
+    def start(self) -> None:
+        """Démarre les workers (au lancement de l'application: reprise du stock en attente)"""
+        self._ensure_table()
+        self._start_workers()
+        self.wake()
+
+    def _worker_counts(self) -> dict:
+        """{(canal, voie): nombre de workers}; la voie transactionnelle a ses workers réservés"""
+        return {
+            (CHANNEL_EMAIL, PRIORITY_TRANSACTIONAL): max(1, settings.NOTIFICATION_PRIORITY_EMAIL_WORKERS),
+            (CHANNEL_EMAIL, PRIORITY_BULK): max(1, settings.NOTIFICATION_EMAIL_WORKERS),
+            (CHANNEL_WHATSAPP, PRIORITY_TRANSACTIONAL): max(1, settings.NOTIFICATION_PRIORITY_WHATSAPP_WORKERS),
+            (CHANNEL_WHATSAPP, PRIORITY_BULK): max(1, settings.NOTIFICATION_WHATSAPP_WORKERS),
+        }
+
+    def _start_workers(self) -> None:
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            running = {}
+            for thread in self._threads:
+                running[thread.lane_key] = running.get(thread.lane_key, 0) + 1
+            self._stopping.clear()
+            for (channel, lane), count in self._worker_counts().items():
+                for index in range(running.get((channel, lane), 0), count):
+                    thread = threading.Thread(
+                        target=self._worker, args=(channel, lane),
+                        name=f"notification-{channel}-{LANES[lane]}-{index}", daemon=True
+                    )
+                    thread.lane_key = (channel, lane)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Arrête les workers après leur lot en cours"""
+        self._stopping.set()
+        self.wake()
+
+    def _worker(self, channel: str, lane: int) -> None:
+        wakeup = self._wakeups[(channel, lane)]
+        while not self._stopping.is_set():
+            try:
+                batch = self._claim(channel, lane)
+            except Exception as e:
+                logger.error(f"Notification outbox claim failed ({channel}/{LANES[lane]}): {e}")
+                batch = []
+            if not batch:
+                wakeup.wait(settings.NOTIFICATION_OUTBOX_POLL_S)
+                wakeup.clear()
+                continue
+            self._dispatch(channel, lane, batch)
+
+    def _in_flight_limit(self, channel: str, lane: int) -> int:
+        # WhatsApp: requêtes HTTP concurrentes (débit borné par le seau à jetons du client);
+        # la voie de masse laisse WHATSAPP_PRIORITY_IN_FLIGHT places à la voie transactionnelle
+        if channel == CHANNEL_WHATSAPP:
+            reserved = max(1, min(settings.WHATSAPP_PRIORITY_IN_FLIGHT, settings.WHATSAPP_MAX_IN_FLIGHT - 1))
+            if lane == PRIORITY_TRANSACTIONAL:
+                return reserved
+            return max(1, settings.WHATSAPP_MAX_IN_FLIGHT - reserved)
+        return 1
+
+    def _throttle_bulk(self, row: dict) -> None:
+        """Campagnes WhatsApp: au plus NOTIFICATION_BULK_RATE_SHARE du débit du fournisseur"""
+        if row["channel"] != CHANNEL_WHATSAPP or row.get("priority") != PRIORITY_BULK:
+            return
+        if self._bulk_bucket is None:
+            with self._lock:
+                if self._bulk_bucket is None:
+                    share = min(max(settings.NOTIFICATION_BULK_RATE_SHARE, 0.0), 1.0)
+                    rate = settings.WHATSAPP_RATE_PER_S * share if settings.WHATSAPP_RATE_PER_S > 0 else 0
+                    self._bulk_bucket = TokenBucket(rate, max(1, int(settings.WHATSAPP_RATE_BURST * share)))
+        self._bulk_bucket.acquire()
+
+    def _dispatch(self, channel: str, lane: int, batch: List[dict]) -> None:
+        """Délivre un lot réclamé, en parallèle jusqu'à la limite de la voie"""
+        limit = self._in_flight_limit(channel, lane)
+        if limit <= 1 or len(batch) <= 1:
+            for row in batch:
+                self._deliver(row)
+            return
+        with self._lock:
+            executor = self._dispatchers.get((channel, lane))
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=limit,
+                                              thread_name_prefix=f"notification-{channel}-{LANES[lane]}-send")
+                self._dispatchers[(channel, lane)] = executor
+        list(executor.map(self._deliver, batch))
+
+    def _claim(self, channel: str, lane: int = PRIORITY_BULK) -> List[dict]:
+        """Réserve un lot de messages prêts (ou dont le bail a expiré)
+
+        Voie transactionnelle: ses seuls messages. Voie de masse: tous les
+        messages du canal, transactionnels en premier.
+        """
+        self._ensure_table()
+        token = uuid.uuid4().hex
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=settings.NOTIFICATION_LEASE_S)
+        if lane == PRIORITY_TRANSACTIONAL:
+            lane_filter, order = " AND priority = %s", "next_attempt_at, id"
+            lane_params = (PRIORITY_TRANSACTIONAL,)
+        else:
+            lane_filter, order, lane_params = "", "priority, next_attempt_at, id", ()
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE notification_outbox
+                SET status = %s, lease_token = %s, lease_until = %s, attempts = attempts + 1
+                WHERE channel = %s{lane_filter}
+                  AND ((status = %s AND next_attempt_at <= %s) OR (status = %s AND lease_until < %s))
+                ORDER BY {order}
+                LIMIT %s
+                """,
+                (STATUS_SENDING, token, lease_until, channel, *lane_params, STATUS_PENDING, now,
+                 STATUS_SENDING, now, settings.NOTIFICATION_OUTBOX_BATCH_SIZE)
+            )
+            if cursor.rowcount <= 0:
+                return []
+            cursor.execute(
+                f"""
+                SELECT id, kind, channel, recipient, subject, body, html_body, attach_logo, attempts, lease_token,
+                       next_attempt_at, priority
+                FROM notification_outbox
+                WHERE lease_token = %s
+                ORDER BY {order}
+                """,
+                (token,)
+            )
+            batch = list(cursor.fetchall())
+            for row in batch:
+                row["lane"] = LANES.get(row.get("priority"), LANES[PRIORITY_TRANSACTIONAL])
+            return self._coalesce(cursor, channel, batch)
+
+    def _coalesce(self, cursor, channel: str, batch: List[dict]) -> List[dict]:
+        """Fusionne dans chaque message réclamé les messages en attente du même destinataire
+
+        Exécuté dans la transaction de réclamation: les messages absorbés sont
+        verrouillés puis marqués 'merged' (merged_into = message conservé).
+        """
+        coalescible = [row for row in batch if notification_coalescer.is_coalescible(row["kind"])]
+        if not coalescible:
+            return batch
+        recipients = sorted({row["recipient"] for row in coalescible})
+        cursor.execute(
+            f"""
+            SELECT id, kind, channel, recipient, subject, body, html_body, attach_logo
+            FROM notification_outbox
+            WHERE channel = %s AND status = %s
+              AND recipient IN ({', '.join(['%s'] * len(recipients))})
+              AND kind IN ({', '.join(['%s'] * len(notification_coalescer.COALESCIBLE_KINDS))})
+            ORDER BY id
+            FOR UPDATE
+            """,
+            (channel, STATUS_PENDING, *recipients, *notification_coalescer.COALESCIBLE_KINDS)
+        )
+        groups = {}
+        for row in coalescible:
+            groups.setdefault(row["recipient"], []).append(row)
+        waiting = {}
+        for row in cursor.fetchall():
+            waiting.setdefault(row["recipient"], []).append(row)
+
+        absorbed_ids = set()
+        for recipient, claimed in groups.items():
+            members = claimed + waiting.get(recipient, [])
+            if len(members) < 2:
+                continue
+            primary = min(claimed, key=lambda r: r["id"])
+            merged = notification_coalescer.merge(members)
+            others = [row["id"] for row in members if row["id"] != primary["id"]]
+            cursor.execute(
+                """
+                UPDATE notification_outbox
+                SET kind = %s, subject = %s, body = %s, html_body = %s, attach_logo = %s
+                WHERE id = %s
+                """,
+                (merged["kind"], (merged["subject"] or "")[:255] or None, merged["body"],
+                 merged["html_body"], merged["attach_logo"], primary["id"])
+            )
+            cursor.execute(
+                f"""
+                UPDATE notification_outbox
+                SET status = %s, merged_into = %s, lease_token = NULL, lease_until = NULL, sent_at = %s
+                WHERE id IN ({', '.join(['%s'] * len(others))})
+                """,
+                (STATUS_MERGED, primary["id"], datetime.now(), *others)
+            )
+            primary.update(merged)
+            absorbed_ids.update(others)
+            logger.info(f"Notification {primary['id']} ({channel}) coalesced {len(others)} message(s) "
+                        f"for {recipient}: {merged['kind']}")
+        return [row for row in batch if row["id"] not in absorbed_ids]
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(settings.NOTIFICATION_RETRY_BASE_S * (2 ** max(attempts - 1, 0)),
+                    settings.NOTIFICATION_RETRY_MAX_S)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _deliver(self, row: dict) -> None:
+        error = None
+        retry_after = None
+        self._throttle_bulk(row)
+        started = datetime.now()
+        ready_at = row.get("next_attempt_at")
+        queue_s = (started - ready_at).total_seconds() if isinstance(ready_at, datetime) else None
+        clock = time.perf_counter()
+        try:
+            self.deliverer.deliver(
+                row["channel"], row["recipient"], row.get("subject"), row["body"],
+                html_body=row.get("html_body"), attach_logo=bool(row.get("attach_logo"))
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            retry_after = getattr(e, "retry_after", None)
+        latency_s = time.perf_counter() - clock
+
+        now = datetime.now()
+        try:
+            if error is None:
+                delivery_ledger.record(row, OUTCOME_SENT, latency_s, queue_s)
+                self.db.execute_update(
+                    """
+                    UPDATE notification_outbox
+                    SET status = %s, sent_at = %s, lease_token = NULL, lease_until = NULL, last_error = NULL
+                    WHERE id = %s AND lease_token = %s
+                    """,
+                    (STATUS_SENT, now, row["id"], row["lease_token"])
+                )
+                return
+            dead = row["attempts"] >= settings.NOTIFICATION_MAX_ATTEMPTS
+            delivery_ledger.record(row, OUTCOME_DEAD if dead else OUTCOME_RETRY, latency_s, queue_s, error)
+            delay = self._retry_delay(row["attempts"])
+            if retry_after:
+                # Limite du fournisseur: réessayer dès la fin de la fenêtre annoncée
+                delay = max(retry_after, 1.0)
+            next_attempt = now + timedelta(seconds=delay)
+            self.db.execute_update(
+                """
+                UPDATE notification_outbox
+                SET status = %s, next_attempt_at = %s, lease_token = NULL, lease_until = NULL, last_error = %s
+                WHERE id = %s AND lease_token = %s
+                """,
+                (STATUS_DEAD if dead else STATUS_PENDING, next_attempt, error, row["id"], row["lease_token"])
+            )
+            if dead:
+                logger.error(f"Notification {row['id']} ({row['kind']}/{row['channel']}) dead-lettered "
+                             f"after {row['attempts']} attempt(s): {error}")
+            else:
+                logger.warning(f"Notification {row['id']} ({row['kind']}/{row['channel']}) attempt "
+                               f"{row['attempts']} failed, retry at {next_attempt:%H:%M:%S}: {error}")
+        except Exception as e:
+            # Le bail expirera: le message sera réclamé à nouveau
+            logger.error(f"Error recording notification {row['id']} outcome: {e}")
+
+    # ---------- Supervision ----------
+
+    def get_stats(self) -> dict:
+        """{canal: {statut: nombre}} pour le tableau de bord"""
+        self._ensure_table()
+        stats = {channel: {} for channel in CHANNELS}
+        try:
+            rows = self.db.execute_query(
+                "SELECT channel, status, COUNT(*) AS cnt FROM notification_outbox GROUP BY channel, status"
+            ) or []
+            for row in rows:
+                stats.setdefault(row["channel"], {})[row["status"]] = int(row["cnt"])
+        except Exception as e:
+            logger.error(f"Error reading notification outbox stats: {e}")
+        return stats
+
+    def get_lane_backlog(self) -> dict:
+        """{canal: {voie: {ready, oldest_wait_s}}}: messages prêts non réclamés et attente du plus ancien"""
+        self._ensure_table()
+        backlog = {channel: {name: {"ready": 0, "oldest_wait_s": 0.0} for name in LANES.values()}
+                   for channel in CHANNELS}
+        now = datetime.now()
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT channel, priority, COUNT(*) AS cnt, MIN(next_attempt_at) AS oldest
+                FROM notification_outbox
+                WHERE status = %s AND next_attempt_at <= %s
+                GROUP BY channel, priority
+                """,
+                (STATUS_PENDING, now)
+            ) or []
+            for row in rows:
+                lane = backlog.setdefault(row["channel"], {}).setdefault(
+                    LANES.get(row["priority"], str(row["priority"])), {"ready": 0, "oldest_wait_s": 0.0})
+                lane["ready"] = int(row["cnt"])
+                if isinstance(row.get("oldest"), datetime):
+                    lane["oldest_wait_s"] = round(max(0.0, (now - row["oldest"]).total_seconds()), 1)
+        except Exception as e:
+            logger.error(f"Error reading notification lane backlog: {e}")
+        return backlog
+
+    def get_progress(self, key_prefix: str) -> dict:
+        """{statut: nombre} des messages dont la clé commence par `key_prefix` (campagne)"""
+        self._ensure_table()
+        progress = {}
+        try:
+            rows = self.db.execute_query(
+                """
+                SELECT status, COUNT(*) AS cnt FROM notification_outbox
+                WHERE idempotency_key LIKE %s
+                GROUP BY status
+                """,
+                (key_prefix.replace("%", r"\%").replace("_", r"\_") + "%",)
+            ) or []
+            for row in rows:
+                progress[row["status"]] = int(row["cnt"])
+        except Exception as e:
+            logger.error(f"Error reading notification progress for {key_prefix}: {e}")
+        return progress
+
+    def get_dead_letters(self, limit: int = 100) -> list:
+        """Messages abandonnés après le nombre maximal d'essais"""
+        self._ensure_table()
+        try:
+            return self.db.execute_query(
+                """
+                SELECT id, kind, channel, recipient, subject, attempts, last_error, created_at
+                FROM notification_outbox
+                WHERE status = %s
+                ORDER BY id DESC
+                LIMIT %s
+                """,
+                (STATUS_DEAD, limit)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error reading dead notifications: {e}")
+            return []
+
+    def requeue_dead(self, ids: Iterable[int] = None) -> int:
+        """Remet en file des lettres mortes (toutes si `ids` est vide) - action administrateur"""
+        self._ensure_table()
+        ids = [int(i) for i in (ids or [])]
+        where = f" AND id IN ({', '.join(['%s'] * len(ids))})" if ids else ""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE notification_outbox SET status = %s, attempts = 0, next_attempt_at = %s
+                    WHERE status = %s{where}
+                    """,
+                    (STATUS_PENDING, datetime.now(), STATUS_DEAD, *ids)
+                )
+                requeued = cursor.rowcount
+            self._start_workers()
+            self.wake()
+            return requeued
+        except Exception as e:
+            logger.error(f"Error requeuing dead notifications: {e}")
+            return 0
+
+
+# Instance partagée: tous les services du processus alimentent la même file
+notification_outbox = NotificationOutbox()
@@ -1,17 +1,37 @@
-"""Service de notification par email et WhatsApp"""
+"""Service de notification par email et WhatsApp
+
+Deux étapes séparées:
+- rendu: les méthodes `send_*` construisent les messages (texte, HTML, WhatsApp)
+  avec les modèles compilés de `notification_templates` et les mettent en file
+  dans l'outbox persistante, sans I/O réseau;
+- livraison: `deliver()` envoie un message de l'outbox sur son canal; il est
+  appelé par les workers de `notification_outbox`, jamais par les services métier.
+
+Les envois de masse passent par `broadcast()`: rendu paresseux des
+destinataires, mise en file par lots, puis livraison par les workers de chaque
+canal sous leur propre limite de débit.
+"""
 import logging
-import smtplib
-import os
+import time
+import uuid
 import requests
-from email.mime.image import MIMEImage
+from dataclasses import dataclass
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import Callable, Iterable, List, Optional
 from config.settings import (
     EMAIL_SERVICE, EMAIL_ADDRESS, EMAIL_PASSWORD, 
     WHATSAPP_ACCOUNT_SID, WHATSAPP_AUTH_TOKEN, WHATSAPP_FROM,
     ULTRAMSG_INSTANCE_ID, ULTRAMSG_TOKEN,
-    EMAIL_LOGO_PATH
+    EMAIL_LOGO_PATH, NOTIFICATION_BROADCAST_BATCH_SIZE
 )
+from app.services.integration.notification_outbox import (
+    CHANNEL_EMAIL, CHANNEL_WHATSAPP, PRIORITY_BULK, OutboxMessage, notification_outbox
+)
+from app.services.integration.notification_templates import RenderedNotification, get_notification_templates
+from app.services.integration.recipient_directory import normalize_phone
+from app.services.integration.smtp_pool import get_smtp_pool
+from app.services.integration.whatsapp_client import get_whatsapp_client
 
 try:
     from twilio.rest import Client
@@ -20,6 +40,28 @@ except ImportError:  # pragma: no cover - optional dependency
 
 logger = logging.getLogger(__name__)
 
+# Champs d'un destinataire de campagne qui ne sont pas des paramètres du modèle
+# (les modèles sont en français: la langue est conservée pour de futures variantes)
+_RECIPIENT_FIELDS = ("email", "phone", "phone_number", "key", "language")
+
+
+@dataclass
+class BroadcastProgress:
+    """Avancement d'une campagne (transmis au rappel de progression)"""
+
+    campaign_id: str
+    template: str
+    stage: str = "queueing"        # queueing -> delivering -> done
+    processed: int = 0             # destinataires lus
+    recipients_queued: int = 0     # destinataires avec au moins un message en file
+    messages_queued: int = 0
+    skipped: int = 0               # ni email ni téléphone sur un canal configuré
+    failed: int = 0                # rendu ou mise en file en échec
+    sent: int = 0
+    dead: int = 0
+    pending: int = 0
+    elapsed_s: float = 0.0
+
 
 class NotificationService:
     """Service pour envoyer des notifications"""
@@ -33,6 +75,11 @@ class NotificationService:
         self.ultramsg_instance = ULTRAMSG_INSTANCE_ID
         self.ultramsg_token = ULTRAMSG_TOKEN
         self.email_logo_path = EMAIL_LOGO_PATH
+        self.outbox = notification_outbox
+        self.templates = get_notification_templates()
+        # Transports (défaut: instances partagées du processus; remplaçables pour les bancs d'essai)
+        self.smtp_pool = None
+        self.whatsapp_client = None
         
         # Log configuration status
         logger.info(f"NotificationService initialized - Email: {bool(self.email_address)}, Ultramsg: {bool(self.ultramsg_instance)}")
@@ -47,123 +94,207 @@ class NotificationService:
             "email_configured": email_ok,
             "whatsapp_configured": whatsapp_ok
         }
+
+    def _dispatch(self, kind: str, student_email: Optional[str], student_phone: Optional[str],
+                  subject: str, body: str, whatsapp_body: str = None, html_body: str = None,
+                  attach_logo: bool = False, idempotency_key: str = None, cursor=None) -> bool:
+        """Met en file les messages rendus sur les canaux configurés
+
+        Avec `cursor`, l'insertion fait partie de la transaction de l'appelant et
+        une erreur est propagée (la transaction métier est annulée plutôt que de
+        perdre le message).
+        """
+        rendered = RenderedNotification(subject, body, whatsapp_body=whatsapp_body,
+                                        html_body=html_body, attach_logo=attach_logo)
+        messages = self._channel_messages(kind, student_email, student_phone, rendered,
+                                          self.get_channel_status())
+        if not messages:
+            logger.warning(f"Notification {kind} not queued: no configured channel for {student_email} / {student_phone}")
+            return False
+        if cursor is not None:
+            self.outbox.enqueue(messages, idempotency_key=idempotency_key, cursor=cursor)
+            return True
+        try:
+            self.outbox.enqueue(messages, idempotency_key=idempotency_key)
+            logger.info(f"Notification {kind} queued for {student_email} / {student_phone} "
+                        f"({', '.join(message.channel for message in messages)})")
+            return True
+        except Exception as e:
+            logger.error(f"Error queuing {kind} notification: {e}")
+            return False
+
+    @staticmethod
+    def _channel_messages(kind: str, student_email: Optional[str], student_phone: Optional[str],
+                          rendered: RenderedNotification, status: dict,
+                          priority: int = None) -> List[OutboxMessage]:
+        messages = []
+        if student_email and status["email_configured"]:
+            messages.append(OutboxMessage(kind, CHANNEL_EMAIL, str(student_email).strip(), rendered.body,
+                                          subject=rendered.subject, html_body=rendered.html_body,
+                                          attach_logo=rendered.attach_logo, priority=priority))
+        if student_phone and rendered.whatsapp_body and status["whatsapp_configured"]:
+            # Numéro E.164 en file: coalescence et registre par destinataire, livraison sans retraitement
+            to_number = normalize_phone(str(student_phone))
+            if to_number:
+                messages.append(OutboxMessage(kind, CHANNEL_WHATSAPP, to_number,
+                                              rendered.whatsapp_body, priority=priority))
+            else:
+                logger.warning(f"Notification {kind}: invalid WhatsApp number {student_phone!r} skipped")
+        return messages
+
+    def broadcast(self, template: str, recipients: Iterable[dict], common: dict = None,
+                  campaign_id: str = None,
+                  progress_callback: Callable[[BroadcastProgress], None] = None,
+                  wait_timeout_s: float = None, cursor=None) -> BroadcastProgress:
+        """Envoie une notification à une liste de destinataires (campagne)
+
+        Les destinataires sont lus et rendus au fil de l'itérateur, mis en file
+        par lots de NOTIFICATION_BROADCAST_BATCH_SIZE (une transaction par lot),
+        puis délivrés en parallèle par les workers email et WhatsApp, chacun
+        sous sa limite de débit. Les messages passent par la voie de masse de
+        l'outbox: ils ne retardent jamais les codes d'accès ni les reçus.
+
+        Args:
+            template: Type de notification (payment, threshold_change, welcome...)
+            recipients: Dicts avec `email`, `phone` (ou `phone_number`), `key`
+                optionnelle (identifiant stable, ex: student_id), `language`
+                optionnelle et les paramètres du modèle; voir
+                `recipient_directory` (Contact.as_recipient)
+            common: Paramètres du modèle partagés par tous les destinataires
+            campaign_id: Identifiant de campagne (idempotence en cas de relance)
+            progress_callback: Appelé après chaque lot, puis pendant la livraison
+            wait_timeout_s: Attendre la fin des livraisons (au plus ce délai)
+            cursor: Transaction de l'appelant: les lots y sont insérés (validés ou
+                annulés avec elle, erreur propagée), sans attente de livraison;
+                l'appelant réveille l'outbox après la validation
+
+        Returns:
+            BroadcastProgress final
+        """
+        started = time.monotonic()
+        progress = BroadcastProgress(campaign_id=campaign_id or f"{template}-{uuid.uuid4().hex}",
+                                     template=template)
+        key_prefix = f"campaign:{progress.campaign_id}:"
+        status = self.get_channel_status()
+        # Champs communs de la campagne préparés une fois pour tous les destinataires
+        renderer = self.templates.bind(template, **(common or {}))
+        batch = []
+
+        def report() -> None:
+            progress.elapsed_s = round(time.monotonic() - started, 3)
+            if progress_callback:
+                try:
+                    progress_callback(progress)
+                except Exception as e:
+                    logger.warning(f"Broadcast progress callback failed: {e}")
+
+        def flush() -> None:
+            if not batch:
+                return
+            try:
+                progress.messages_queued += self.outbox.enqueue_many(batch, cursor=cursor)
+                progress.recipients_queued += len(batch)
+            except Exception as e:
+                if cursor is not None:
+                    raise
+                logger.error(f"Error queuing broadcast batch ({progress.campaign_id}): {e}")
+                progress.failed += len(batch)
+            batch.clear()
+            report()
+
+        for index, recipient in enumerate(recipients):
+            progress.processed += 1
+            email = recipient.get("email")
+            phone = recipient.get("phone", recipient.get("phone_number"))
+            try:
+                if not (email and status["email_configured"]) and not (phone and status["whatsapp_configured"]):
+                    progress.skipped += 1
+                    continue
+                params = {"student_email": email, "student_phone": phone,
+                          **{k: v for k, v in recipient.items() if k not in _RECIPIENT_FIELDS}}
+                messages = self._channel_messages(template, email, phone, renderer(**params), status,
+                                                  priority=PRIORITY_BULK)
+            except Exception as e:
+                logger.warning(f"Broadcast {template}: cannot render recipient {recipient.get('key', index)}: {e}")
+                progress.failed += 1
+                continue
+            if not messages:
+                progress.skipped += 1
+                continue
+            batch.append((f"{key_prefix}{recipient.get('key', index)}", messages))
+            if len(batch) >= NOTIFICATION_BROADCAST_BATCH_SIZE:
+                flush()
+        flush()
+
+        progress.stage = "delivering"
+        report()
+        deadline = started + wait_timeout_s if wait_timeout_s and cursor is None else None
+        while deadline is not None:
+            counts = self.outbox.get_progress(key_prefix)
+            # Un message fusionné dans un autre (coalescence) est livré avec lui
+            progress.sent = counts.get("sent", 0) + counts.get("merged", 0)
+            progress.dead = counts.get("dead", 0)
+            progress.pending = counts.get("pending", 0) + counts.get("sending", 0)
+            if progress.pending == 0 or time.monotonic() >= deadline:
+                break
+            report()
+            time.sleep(0.5)
+        if deadline is not None and progress.pending == 0:
+            progress.stage = "done"
+        report()
+        logger.info(f"Broadcast {progress.campaign_id}: {progress.recipients_queued} recipient(s) queued, "
+                    f"{progress.skipped} skipped, {progress.failed} failed")
+        return progress
+
+    def deliver(self, channel: str, recipient: str, subject: Optional[str], body: str,
+                html_body: str = None, attach_logo: bool = False) -> None:
+        """Livre un message de l'outbox; lève une exception en cas d'échec (nouvel essai)"""
+        if channel == CHANNEL_EMAIL:
+            self._deliver_email(recipient, subject or "", body, html_body=html_body,
+                                logo_path=self.email_logo_path if attach_logo else None)
+        elif channel == CHANNEL_WHATSAPP:
+            self._deliver_whatsapp(recipient, body)
+        else:
+            raise ValueError(f"Unknown notification channel: {channel}")
     
     def send_payment_notification(self, student_email: str, student_phone: str,
                                  student_name: str, amount_paid: float,
                                  remaining_amount: float, final_fee: float,
                                  threshold_amount: float = None,
                                  threshold_reached: bool = None,
-                                 promotion_info: str = None) -> bool:
-        """Envoie une notification de paiement par email et WhatsApp
+                                 promotion_info: str = None,
+                                 idempotency_key: str = None, cursor=None) -> bool:
+        """Met en file une notification de paiement par email et WhatsApp
         
         Args:
             promotion_info: Chaîne formatée "Faculté / Département / Promotion" pour affichage
+            idempotency_key: Clé du paiement (un seul reçu par paiement)
+            cursor: Transaction du paiement (mise en file atomique)
         """
         try:
             logger.info(f"Sending payment notification to {student_email} / {student_phone}")
-            amount_paid_usd = float(amount_paid)
-            remaining_usd = float(max(remaining_amount, 0))
-            final_fee_usd = float(final_fee)
-            threshold_usd = float(threshold_amount) if threshold_amount is not None else None
-
-            completion_msg = ""
-            if remaining_amount <= 0:
-                completion_msg = "\n\nFélicitations! Vous avez fini les frais académiques."
-
-            threshold_status = None
-            if threshold_reached is not None:
-                threshold_status = "Atteint" if threshold_reached else "Non atteint"
-
-            subject = "Notification de Paiement - U.O.R"
-            table_rows = []
-            
-            # Ajouter info de promotion en premier si disponible
-            if promotion_info:
-                table_rows.append(("Promotion", promotion_info))
-            
-            table_rows.extend([
-                ("Montant payé", f"${amount_paid_usd:,.2f}"),
-                ("Total des frais académiques", f"${final_fee_usd:,.2f}"),
-                ("Montant restant", f"${remaining_usd:,.2f}"),
-            ])
-            if threshold_usd is not None:
-                table_rows.append(("Seuil requis", f"${threshold_usd:,.2f}"))
-            if threshold_status:
-                table_rows.append(("Statut du seuil", threshold_status))
-
-            body = f"""
-Bonjour {student_name},
-
-Votre paiement a été reçu avec succès.
-
-{self._build_text_table(table_rows)}{completion_msg}
-""".strip()
-
-            if threshold_status == "Non atteint":
-                body += "\n\nNote: Vous n'avez pas encore atteint le seuil financier requis pour l'accès aux examens."
-
-            body += "\n\nCordialement,\nU.O.R - Système de Contrôle d'Accès"
-
-            whatsapp_rows = []
-            if promotion_info:
-                whatsapp_rows.append(("Promo", promotion_info))
-            whatsapp_rows.extend([
-                ("Payé", f"${amount_paid_usd:,.2f}"),
-                ("Reste", f"${remaining_usd:,.2f}"),
-            ])
-            if threshold_usd is not None:
-                whatsapp_rows.append(("Seuil", f"${threshold_usd:,.2f}"))
-            if threshold_status:
-                whatsapp_rows.append(("Statut", threshold_status))
-
-            whatsapp_msg = f"Bonjour {student_name}, paiement reçu.\n{self._build_text_table(whatsapp_rows)}"
-            if remaining_amount <= 0:
-                whatsapp_msg += " Félicitations! Vous avez fini les frais académiques."
-            if threshold_status == "Non atteint":
-                whatsapp_msg += " Vous n'avez pas encore atteint le seuil requis."
-
-            html_body = self._build_payment_email_html(
-                student_name=student_name,
-                amount_paid=amount_paid_usd,
-                final_fee=final_fee_usd,
-                remaining=remaining_usd,
-                completion_msg=completion_msg,
-                threshold_amount=threshold_usd,
-                threshold_status=threshold_status,
+            rendered = self.templates.payment(
+                student_name=student_name, amount_paid=amount_paid, remaining_amount=remaining_amount,
+                final_fee=final_fee, threshold_amount=threshold_amount, threshold_reached=threshold_reached,
                 promotion_info=promotion_info,
             )
-            email_ok = self._send_email(student_email, subject, body, html_body=html_body, logo_path=self.email_logo_path)
-            logger.info(f"Email notification result: {email_ok}")
-            
-            whatsapp_ok = self._send_whatsapp(student_phone, whatsapp_msg)
-            logger.info(f"WhatsApp notification result: {whatsapp_ok}")
-            
-            result = email_ok or whatsapp_ok
-            logger.info(f"Payment notification overall result: {result} (email: {email_ok}, whatsapp: {whatsapp_ok})")
-            return result
+            return self._dispatch("payment", student_email, student_phone, rendered.subject, rendered.body,
+                                  whatsapp_body=rendered.whatsapp_body, html_body=rendered.html_body,
+                                  attach_logo=rendered.attach_logo, idempotency_key=idempotency_key,
+                                  cursor=cursor)
             
         except Exception as e:
             logger.error(f"Error preparing payment notification: {e}")
+            if cursor is not None:
+                raise
             return False
     
     def send_access_denied_notification(self, student_email: str, student_name: str,
                                        reason: str) -> bool:
         """Envoie une notification d'accès refusé"""
         try:
-            subject = "Accès Refusé - U.O.R"
-            body = f"""
-Bonjour {student_name},
-
-Votre tentative d'accès à la salle d'examen a été refusée.
-Raison: {reason}
-
-Veuillez contacter l'administration pour plus d'informations.
-
-Cordialement,
-U.O.R - Système de Contrôle d'Accès
-            """.strip()
-            
-            return self._send_email(student_email, subject, body)
+            rendered = self.templates.access_denied(student_name=student_name, reason=reason)
+            return self._dispatch("access_denied", student_email, None, rendered.subject, rendered.body)
             
         except Exception as e:
             logger.error(f"Error preparing access denied notification: {e}")
@@ -174,50 +305,11 @@ U.O.R - Système de Contrôle d'Accès
                                   threshold_required: float, final_fee: float) -> bool:
         """Envoie une notification de bienvenue au nouvel étudiant"""
         try:
-            subject = "Bienvenue à U.O.R - Informations importantes"
-            body = f"""
-Bonjour {student_name},
-
-Bienvenue à l'Université Officielle de Ruwenzori (U.O.R) !
-
-Votre inscription a été enregistrée avec succès.
-
-📋 INFORMATIONS DE VOTRE COMPTE:
-• Matricule étudiant: {student_number}
-• Email: {student_email}
-• Téléphone: {student_phone}
-
-💰 INFORMATIONS FINANCIÈRES:
-• Seuil pour accès aux examens: ${threshold_required:,.2f}
-• Frais académiques totaux: ${final_fee:,.2f}
-
-ℹ️ IMPORTANT:
-Pour accéder aux salles d'examens, vous devez:
-1. Effectuer un paiement atteignant au moins le seuil requis
-2. Un code d'accès vous sera automatiquement envoyé par email/WhatsApp
-3. Présentez ce code au terminal d'accès le jour de l'examen
-
-Vous recevrez une notification automatique après chaque paiement.
-
-En cas de question, contactez l'administration.
-
-Cordialement,
-U.O.R - Système de Contrôle d'Accès
-            """.strip()
-
-            whatsapp_msg = (
-                f"Bienvenue {student_name} à l'Université Officielle de Ruwenzori (U.O.R)! "
-                f"Matricule étudiant: {student_number}. "
-                f"Seuil examens: ${threshold_required:,.2f}. "
-                f"Frais totaux: ${final_fee:,.2f}. "
-                f"Un code d'accès vous sera envoyé par email/WhatsApp après paiement du seuil."
-            )
-
-            email_ok = self._send_email(student_email, subject, body)
-            whatsapp_ok = self._send_whatsapp(student_phone, whatsapp_msg)
-
-            logger.info(f"Welcome notification sent to {student_name} - Email: {email_ok}, WhatsApp: {whatsapp_ok}")
-            return email_ok or whatsapp_ok
+            rendered = self.templates.welcome(student_name=student_name, student_number=student_number,
+                                            threshold_required=threshold_required, final_fee=final_fee,
+                                            student_email=student_email, student_phone=student_phone)
+            return self._dispatch("welcome", student_email, student_phone, rendered.subject, rendered.body,
+                                  whatsapp_body=rendered.whatsapp_body)
 
         except Exception as e:
             logger.error(f"Error preparing welcome notification: {e}")
@@ -225,335 +317,116 @@ U.O.R - Système de Contrôle d'Accès
 
     def send_access_code_notification(self, student_email: str, student_phone: str,
                                       student_name: str, access_code: str,
-                                      code_type: str, expires_at: str) -> bool:
-        """Envoie le code d'accès au étudiant par email et WhatsApp"""
-        try:
-            validity_msg = ""
-            if code_type == 'full':
-                validity_msg = "Ce code est valable durant toutes les périodes d'examens de l'année académique."
-            else:
-                validity_msg = "Ce code est valable jusqu'à modification du seuil financier."
-            
-            subject = "Votre code d'accès - U.O.R"
-            body = f"""
-Bonjour {student_name},
-
-Félicitations! Votre code d'accès a été généré avec succès.
+                                      code_type: str, expires_at: str,
+                                      idempotency_key: str = None, cursor=None) -> bool:
+        """Met en file le code d'accès de l'étudiant (email et WhatsApp)
 
-Code d'accès: {access_code}
-{validity_msg}
-
-Utilisez ce code pour accéder à la salle d'examen.
-
-Cordialement,
-U.O.R - Système de Contrôle d'Accès
-            """.strip()
-            
-            whatsapp_msg = f"Bonjour {student_name}, votre code d'accès: {access_code}. {validity_msg}"
-            
-            email_ok = self._send_email(student_email, subject, body)
-            whatsapp_ok = self._send_whatsapp(student_phone, whatsapp_msg)
-            
-            logger.info(f"Access code notification sent to {student_name} - Email: {email_ok}, WhatsApp: {whatsapp_ok}")
-            return email_ok or whatsapp_ok
+        Args:
+            idempotency_key: Clé de l'émission (un seul envoi par code)
+            cursor: Transaction d'émission du code (mise en file atomique)
+        """
+        try:
+            rendered = self.templates.access_code(student_name=student_name, access_code=access_code,
+                                                  code_type=code_type)
+            return self._dispatch("access_code", student_email, student_phone, rendered.subject, rendered.body,
+                                  whatsapp_body=rendered.whatsapp_body, idempotency_key=idempotency_key,
+                                  cursor=cursor)
             
         except Exception as e:
             logger.error(f"Error preparing access code notification: {e}")
+            if cursor is not None:
+                raise
             return False
 
     def send_threshold_change_notification(self, student_email: str, student_phone: str,
                                           student_name: str, old_threshold: float = None,
                                           new_threshold: float = None, old_final_fee: float = None,
                                           new_final_fee: float = None, amount_paid: float = None,
-                                          remaining_amount: float = None, threshold_reached: bool = None) -> bool:
-        """Notifie l'étudiant du changement de seuil financier"""
+                                          remaining_amount: float = None, threshold_reached: bool = None,
+                                          idempotency_key: str = None) -> bool:
+        """Met en file la notification de changement de seuil financier"""
         try:
-            old_usd = float(old_threshold) if old_threshold is not None else None
-            new_usd = float(new_threshold) if new_threshold is not None else None
-            old_fee_usd = float(old_final_fee) if old_final_fee is not None else None
-            new_fee_usd = float(new_final_fee) if new_final_fee is not None else None
-            amount_paid_usd = float(amount_paid) if amount_paid is not None else None
-            remaining_usd = float(remaining_amount) if remaining_amount is not None else None
-
-            threshold_status = None
-            if threshold_reached is not None:
-                threshold_status = "Atteint" if threshold_reached else "Non atteint"
-
-            subject = "Mise à jour du seuil financier - Action requise - U.O.R"
-            body_lines = [
-                f"Bonjour {student_name},",
-                "",
-                "Le seuil financier pour l'accès aux examens a été mis à jour.",
-                ""
-            ]
-
-            table_rows = []
-            if old_usd is not None:
-                table_rows.append(("Ancien seuil", f"${old_usd:,.2f}"))
-            if new_usd is not None:
-                table_rows.append(("Nouveau seuil", f"${new_usd:,.2f}"))
-            if old_fee_usd is not None:
-                table_rows.append(("Anciens frais", f"${old_fee_usd:,.2f}"))
-            if new_fee_usd is not None:
-                table_rows.append(("Nouveaux frais", f"${new_fee_usd:,.2f}"))
-            if amount_paid_usd is not None:
-                table_rows.append(("Montant payé", f"${amount_paid_usd:,.2f}"))
-            if remaining_usd is not None:
-                table_rows.append(("Montant restant", f"${max(remaining_usd, 0):,.2f}"))
-            if threshold_status:
-                table_rows.append(("Statut du seuil", threshold_status))
-
-            if table_rows:
-                body_lines.append(self._build_text_table(table_rows))
-
-            body_lines.extend([
-                "",
-                "IMPORTANT: Si vous aviez un code d'accès temporaire (paiement partiel), celui-ci a été invalidé.",
-                "Veuillez effectuer un nouveau paiement pour atteindre le nouveau seuil et obtenir un code valide.",
-                "",
-                "Les étudiants ayant payé intégralement conservent leur code valable toute l'année.",
-                "",
-                "Cordialement,",
-                "U.O.R - Système de Contrôle d'Accès"
-            ])
-            body = "\n".join(body_lines).strip()
-
-            parts = [f"Bonjour {student_name}, mise à jour du seuil financier."]
-            if old_usd is not None and new_usd is not None:
-                parts.append(f"Seuil: ${old_usd:,.2f} → ${new_usd:,.2f}.")
-            elif new_usd is not None:
-                parts.append(f"Nouveau seuil: ${new_usd:,.2f}.")
-            if old_fee_usd is not None and new_fee_usd is not None:
-                parts.append(f"Frais: ${old_fee_usd:,.2f} → ${new_fee_usd:,.2f}.")
-            elif new_fee_usd is not None:
-                parts.append(f"Nouveaux frais: ${new_fee_usd:,.2f}.")
-            if threshold_status:
-                parts.append(f"Statut seuil: {threshold_status}.")
-            parts.append("Votre code temporaire a été invalidé si applicable.")
-
-            whatsapp_table = self._build_text_table(table_rows) if table_rows else ""
-            whatsapp_msg = " ".join(parts)
-            if whatsapp_table:
-                whatsapp_msg += f"\n{whatsapp_table}"
-
-            html_body = self._build_threshold_change_email_html(
-                student_name=student_name,
-                rows=table_rows,
-                threshold_status=threshold_status
+            rendered = self.templates.threshold_change(
+                student_name=student_name, old_threshold=old_threshold, new_threshold=new_threshold,
+                old_final_fee=old_final_fee, new_final_fee=new_final_fee, amount_paid=amount_paid,
+                remaining_amount=remaining_amount, threshold_reached=threshold_reached
             )
-
-            email_ok = self._send_email(student_email, subject, body, html_body=html_body, logo_path=self.email_logo_path)
-            whatsapp_ok = self._send_whatsapp(student_phone, whatsapp_msg)
-
-            logger.info(f"Threshold change notification sent to {student_name} - Email: {email_ok}, WhatsApp: {whatsapp_ok}")
-            return email_ok or whatsapp_ok
+            return self._dispatch("threshold_change", student_email, student_phone, rendered.subject,
+                                  rendered.body, whatsapp_body=rendered.whatsapp_body,
+                                  html_body=rendered.html_body, attach_logo=rendered.attach_logo,
+                                  idempotency_key=idempotency_key)
 
         except Exception as e:
             logger.error(f"Error preparing threshold change notification: {e}")
             return False
-    
+
     def _send_email(self, recipient: str, subject: str, body: str, html_body: str = None, logo_path: str = None) -> bool:
-        """Envoie un email"""
+        """Envoie un email immédiatement (diagnostics); True si envoyé"""
         try:
-            if not self.email_address or not self.email_password:
-                logger.warning("Email service not configured")
-                return False
-
-            use_logo = bool(logo_path and os.path.exists(logo_path))
-            if html_body or use_logo:
-                msg = MIMEMultipart('related')
-                alt = MIMEMultipart('alternative')
-                alt.attach(MIMEText(body, 'plain'))
-                if html_body:
-                    alt.attach(MIMEText(html_body, 'html'))
-                msg.attach(alt)
-                if use_logo:
-                    with open(logo_path, 'rb') as f:
-                        img = MIMEImage(f.read())
-                    img.add_header('Content-ID', '<uor_logo>')
-                    img.add_header('Content-Disposition', 'inline', filename=os.path.basename(logo_path))
-                    msg.attach(img)
-            else:
-                msg = MIMEMultipart()
-                msg.attach(MIMEText(body, 'plain'))
-            msg['From'] = self.email_address
-            msg['To'] = recipient
-            msg['Subject'] = subject
-            
-            # Configurer le serveur SMTP
-            smtp_server = smtplib.SMTP('smtp.gmail.com', 587, timeout=10)
-            smtp_server.starttls()
-            smtp_server.login(self.email_address, self.email_password)
-            
-            smtp_server.send_message(msg)
-            smtp_server.quit()
-            
-            logger.info(f"Email sent successfully to {recipient}")
+            self._deliver_email(recipient, subject, body, html_body=html_body, logo_path=logo_path)
             return True
-            
         except Exception as e:
             logger.error(f"Error sending email: {e}")
             return False
 
+    def _deliver_email(self, recipient: str, subject: str, body: str, html_body: str = None,
+                       logo_path: str = None) -> None:
+        """Envoie un email; lève une exception en cas d'échec"""
+        if not self.email_address or not self.email_password:
+            raise RuntimeError("Email service not configured")
+
+        # Partie MIME du logo encodée une fois et partagée (plus de lecture par email)
+        logo_part = self.templates.logo_part() if logo_path else None
+        if html_body or logo_part is not None:
+            msg = MIMEMultipart('related')
+            alt = MIMEMultipart('alternative')
+            alt.attach(MIMEText(body, 'plain'))
+            if html_body:
+                alt.attach(MIMEText(html_body, 'html'))
+            msg.attach(alt)
+            if logo_part is not None:
+                msg.attach(logo_part)
+        else:
+            msg = MIMEMultipart()
+            msg.attach(MIMEText(body, 'plain'))
+        msg['From'] = self.email_address
+        msg['To'] = recipient
+        msg['Subject'] = subject
+
+        # Session SMTP partagée: STARTTLS + login une fois pour plusieurs messages
+        (self.smtp_pool or get_smtp_pool()).send(msg)
+        logger.info(f"Email sent successfully to {recipient}")
+
     def _send_whatsapp(self, student_phone: str, message: str) -> bool:
-        """Envoie un message WhatsApp via Ultramsg"""
+        """Envoie un message WhatsApp immédiatement (diagnostics); True si envoyé"""
         try:
-            if not student_phone:
-                logger.warning("No phone number provided")
-                return False
-                
-            if not self.ultramsg_instance or not self.ultramsg_token:
-                logger.error(f"Ultramsg WhatsApp service not configured - Instance: {bool(self.ultramsg_instance)}, Token: {bool(self.ultramsg_token)}")
-                return False
-
-            # Normaliser le numéro de téléphone
-            original_phone = str(student_phone).strip()
-            to_number = original_phone
-            if to_number.lower().startswith("whatsapp:"):
-                to_number = to_number.split("whatsapp:", 1)[1]
-            to_number = to_number.replace(" ", "").replace("-", "")
-            
-            # S'assurer que le numéro commence par +
-            if not to_number.startswith("+"):
-                to_number = "+" + to_number
-            
-            logger.info(f"Sending WhatsApp - Original: {original_phone}, Normalized: {to_number}, Instance: {self.ultramsg_instance}")
-            
-            # API Ultramsg
-            url = f"https://api.ultramsg.com/{self.ultramsg_instance}/messages/chat"
-            payload = {
-                "token": self.ultramsg_token,
-                "to": to_number,
-                "body": message
-            }
-            
-            logger.debug(f"Ultramsg API URL: {url}, Payload keys: {list(payload.keys())}")
-            
-            response = requests.post(url, data=payload, timeout=10)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"Ultramsg API response: {result}")
-            if result.get("sent") == "true" or result.get("sent") == True:
-                logger.info(f"WhatsApp sent successfully to {to_number}")
-                return True
-            else:
-                logger.error(f"Ultramsg sent=false - Response: {result}")
-                return False
-            
+            self._deliver_whatsapp(student_phone, message)
+            return True
         except requests.exceptions.RequestException as e:
             logger.error(f"WhatsApp API network error via Ultramsg: {type(e).__name__}: {e}")
             return False
         except Exception as e:
-            logger.error(f"Unexpected error sending WhatsApp via Ultramsg: {type(e).__name__}: {e}", exc_info=True)
+            logger.error(f"Unexpected error sending WhatsApp via Ultramsg: {type(e).__name__}: {e}")
             return False
 
-    def _build_payment_email_html(self, student_name: str, amount_paid: float, final_fee: float,
-                                   remaining: float, completion_msg: str,
-                                   threshold_amount: float = None, threshold_status: str = None,
-                                   promotion_info: str = None) -> str:
-        """Construit le HTML pour l'email de paiement"""
-        logo_html = ""
-        if self.email_logo_path and os.path.exists(self.email_logo_path):
-            logo_html = "<div style='margin-bottom:16px;'><img src='cid:uor_logo' alt='U.O.R' style='height:64px;'/></div>"
-
-        completion_html = ""
-        if completion_msg:
-            completion_html = "<p style='color:#059669;font-weight:600;'>Félicitations ! Vous avez fini les frais académiques.</p>"
-
-        promotion_row = ""
-        if promotion_info:
-            promotion_row = f"<tr><td style=\"padding:6px 12px;\">Promotion</td><td style=\"padding:6px 12px;\"><strong>{promotion_info}</strong></td></tr>"
-        
-        threshold_row = ""
-        if threshold_amount is not None:
-            threshold_row += f"<tr><td style=\"padding:6px 12px;\">Seuil requis</td><td style=\"padding:6px 12px;\"><strong>${threshold_amount:,.2f}</strong></td></tr>"
-        if threshold_status:
-            threshold_row += f"<tr><td style=\"padding:6px 12px;\">Statut du seuil</td><td style=\"padding:6px 12px;\"><strong>{threshold_status}</strong></td></tr>"
-
-        return f"""
-<div style="font-family:Arial, sans-serif; color:#111;">
-    {logo_html}
-    <p>Bonjour <strong>{student_name}</strong>,</p>
-    <p>Votre paiement a été reçu avec succès.</p>
-    <table style="border-collapse:collapse; margin:12px 0;">
-        {promotion_row}
-        <tr><td style="padding:6px 12px;">Montant payé</td><td style="padding:6px 12px;"><strong>${amount_paid:,.2f}</strong></td></tr>
-        <tr><td style="padding:6px 12px;">Total des frais académiques</td><td style="padding:6px 12px;"><strong>${final_fee:,.2f}</strong></td></tr>
-        <tr><td style="padding:6px 12px;">Montant restant</td><td style="padding:6px 12px;"><strong>${remaining:,.2f}</strong></td></tr>
-        {threshold_row}
-    </table>
-    {completion_html}
-    <p>Cordialement,<br/>U.O.R - Système de Contrôle d'Accès</p>
-</div>
-                """.strip()
-
-    def _build_threshold_change_email_html(self, student_name: str, rows: list,
-                                           threshold_status: str = None) -> str:
-        """Construit le HTML pour l'email de changement de seuil"""
-        logo_html = ""
-        if self.email_logo_path and os.path.exists(self.email_logo_path):
-            logo_html = "<div style='margin-bottom:16px;'><img src='cid:uor_logo' alt='U.O.R' style='height:64px;'/></div>"
-
-        table_html = ""
-        if rows:
-            table_rows = "".join(
-                f"<tr><td style='padding:6px 12px;'>{label}</td><td style='padding:6px 12px;'><strong>{value}</strong></td></tr>"
-                for label, value in rows
-            )
-            table_html = f"<table style='border-collapse:collapse; margin:12px 0;'>{table_rows}</table>"
-
-        threshold_note = ""
-        if threshold_status == "Non atteint":
-            threshold_note = "<p style='color:#b45309;font-weight:600;'>Vous n'avez pas encore atteint le nouveau seuil.</p>"
-
-        return f"""
-<div style="font-family:Arial, sans-serif; color:#111;">
-    {logo_html}
-    <p>Bonjour <strong>{student_name}</strong>,</p>
-    <p>Le seuil financier pour l'accès aux examens a été mis à jour.</p>
-    {table_html}
-    {threshold_note}
-    <p style="margin-top:12px;">IMPORTANT: Si vous aviez un code d'accès temporaire (paiement partiel), celui-ci a été invalidé.</p>
-    <p>Veuillez effectuer un nouveau paiement pour atteindre le nouveau seuil et obtenir un code valide.</p>
-    <p>Les étudiants ayant payé intégralement conservent leur code valable toute l'année.</p>
-    <p>Cordialement,<br/>U.O.R - Système de Contrôle d'Accès</p>
-</div>
-                """.strip()
-
-    def _build_text_table(self, rows: list) -> str:
-        """Construit une table texte robuste (lisible en email/WhatsApp)."""
-        if not rows:
-            return ""
-
-        def _truncate(value: str, max_len: int) -> str:
-            value = str(value)
-            if len(value) <= max_len:
-                return value
-            return value[: max_len - 1] + "…"
-
-        header = ["Élément", "Valeur"]
-        max_col1 = 20
-        max_col2 = 26
-
-        table_rows = [header] + [[str(label), str(value)] for label, value in rows]
-        col1 = min(max(len(r[0]) for r in table_rows), max_col1)
-        col2 = min(max(len(r[1]) for r in table_rows), max_col2)
-
-        def fmt_row(left: str, right: str) -> str:
-            left = _truncate(left, col1).ljust(col1)
-            right = _truncate(right, col2).ljust(col2)
-            return f"│ {left} │ {right} │"
-
-        top = f"┌{'─' * (col1 + 2)}┬{'─' * (col2 + 2)}┐"
-        mid = f"├{'─' * (col1 + 2)}┼{'─' * (col2 + 2)}┤"
-        bot = f"└{'─' * (col1 + 2)}┴{'─' * (col2 + 2)}┘"
-
-        parts = [top, fmt_row(header[0], header[1]), mid]
-        for label, value in rows:
-            parts.append(fmt_row(label, value))
-        parts.append(bot)
-        return "\n".join(parts)
+    def _deliver_whatsapp(self, student_phone: str, message: str) -> None:
+        """Envoie un message WhatsApp via Ultramsg; lève une exception en cas d'échec"""
+        if not student_phone:
+            raise ValueError("No phone number provided")
+
+        if not self.ultramsg_instance or not self.ultramsg_token:
+            raise RuntimeError(f"Ultramsg WhatsApp service not configured - Instance: {bool(self.ultramsg_instance)}, "
+                               f"Token: {bool(self.ultramsg_token)}")
+
+        # Numéro E.164 (déjà normalisé à la mise en file: lecture du cache)
+        to_number = normalize_phone(str(student_phone))
+        if not to_number:
+            raise ValueError(f"Invalid phone number: {student_phone!r}")
+        logger.debug(f"Sending WhatsApp to {to_number}, Instance: {self.ultramsg_instance}")
+
+        # API Ultramsg: connexion keep-alive partagée, débit limité
+        result = (self.whatsapp_client or get_whatsapp_client()).send(to_number, message)
+        logger.info(f"WhatsApp sent successfully to {to_number} (Ultramsg: {result.get('id', result)})")
 
     def send_whatsapp_with_template(self, student_phone: str, template_sid: str, 
                                    template_variables: list = None) -> bool:
@@ -0,0 +1,426 @@
+"""Modèles de notification compilés une fois par type
+
+Chaque `send_*` reconstruisait le texte, la table encadrée et le HTML avec des
+f-strings, testait la présence du logo sur disque à chaque rendu, et l'envoi
+relisait puis réencodait le fichier du logo pour chaque email. Ici:
+
+- les parties fixes (bloc logo, gabarits HTML, en-tête et bordures des tables
+  texte) sont préparées à la construction; un rendu ne formate plus que les
+  champs propres à l'étudiant;
+- `bind(kind, **communs)` prépare en plus les champs partagés d'une campagne
+  (ex: ancien/nouveau seuil) pour `NotificationService.broadcast`;
+- la partie MIME du logo (base64) est encodée une seule fois et partagée par
+  tous les emails (`logo_part()`).
+
+Le rendu est identique octet pour octet à l'ancien; scripts/benchmark_notification_render.py
+mesure le coût par message pour une campagne de 10 000 destinataires.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from email.mime.image import MIMEImage
+from functools import lru_cache, partial
+from typing import Callable, Optional
+from config.settings import EMAIL_LOGO_PATH
+
+_LOGO_HTML = "<div style='margin-bottom:16px;'><img src='cid:uor_logo' alt='U.O.R' style='height:64px;'/></div>"
+_SIGNATURE = "Cordialement,\nU.O.R - Système de Contrôle d'Accès"
+
+
+@dataclass
+class RenderedNotification:
+    """Contenu rendu d'une notification, commun à tous ses canaux"""
+
+    subject: str
+    body: str
+    whatsapp_body: Optional[str] = None
+    html_body: Optional[str] = None
+    attach_logo: bool = False
+
+
+# ---------- Table texte encadrée (email / WhatsApp) ----------
+
+_TABLE_HEADER = ("Élément", "Valeur")
+_MAX_COL1 = 20
+_MAX_COL2 = 26
+
+
+@lru_cache(maxsize=256)
+def _borders(col1: int, col2: int) -> tuple:
+    return (
+        f"┌{'─' * (col1 + 2)}┬{'─' * (col2 + 2)}┐",
+        f"├{'─' * (col1 + 2)}┼{'─' * (col2 + 2)}┤",
+        f"└{'─' * (col1 + 2)}┴{'─' * (col2 + 2)}┘",
+    )
+
+
+def _truncate(value: str, max_len: int) -> str:
+    if len(value) <= max_len:
+        return value
+    return value[: max_len - 1] + "…"
+
+
+@lru_cache(maxsize=4096)
+def _table_row(left: str, right: str, col1: int, col2: int) -> str:
+    return f"│ {_truncate(left, col1).ljust(col1)} │ {_truncate(right, col2).ljust(col2)} │"
+
+
+def text_table(rows: list) -> str:
+    """Table texte robuste (lisible en email/WhatsApp)"""
+    if not rows:
+        return ""
+    rows = [(str(label), str(value)) for label, value in rows]
+    col1 = min(max(len(_TABLE_HEADER[0]), *(len(label) for label, _ in rows)), _MAX_COL1)
+    col2 = min(max(len(_TABLE_HEADER[1]), *(len(value) for _, value in rows)), _MAX_COL2)
+    top, mid, bot = _borders(col1, col2)
+    parts = [top, _table_row(_TABLE_HEADER[0], _TABLE_HEADER[1], col1, col2), mid]
+    parts.extend(_table_row(label, value, col1, col2) for label, value in rows)
+    parts.append(bot)
+    return "\n".join(parts)
+
+
+def _usd(value: Optional[float]) -> Optional[str]:
+    return None if value is None else f"${float(value):,.2f}"
+
+
+def _threshold_status(threshold_reached: Optional[bool]) -> Optional[str]:
+    if threshold_reached is None:
+        return None
+    return "Atteint" if threshold_reached else "Non atteint"
+
+
+# ---------- Gabarits HTML (le bloc logo est fixé à la compilation) ----------
+
+_PAYMENT_HTML = """
+<div style="font-family:Arial, sans-serif; color:#111;">
+    {logo_html}
+    <p>Bonjour <strong>{student_name}</strong>,</p>
+    <p>Votre paiement a été reçu avec succès.</p>
+    <table style="border-collapse:collapse; margin:12px 0;">
+        {promotion_row}
+        <tr><td style="padding:6px 12px;">Montant payé</td><td style="padding:6px 12px;"><strong>{amount_paid}</strong></td></tr>
+        <tr><td style="padding:6px 12px;">Total des frais académiques</td><td style="padding:6px 12px;"><strong>{final_fee}</strong></td></tr>
+        <tr><td style="padding:6px 12px;">Montant restant</td><td style="padding:6px 12px;"><strong>{remaining}</strong></td></tr>
+        {threshold_row}
+    </table>
+    {completion_html}
+    <p>Cordialement,<br/>U.O.R - Système de Contrôle d'Accès</p>
+</div>
+"""
+_PAYMENT_HTML_ROW = '<tr><td style="padding:6px 12px;">{}</td><td style="padding:6px 12px;"><strong>{}</strong></td></tr>'
+_PAYMENT_COMPLETION_HTML = "<p style='color:#059669;font-weight:600;'>Félicitations ! Vous avez fini les frais académiques.</p>"
+
+_THRESHOLD_HTML = """
+<div style="font-family:Arial, sans-serif; color:#111;">
+    {logo_html}
+    <p>Bonjour <strong>{student_name}</strong>,</p>
+    <p>Le seuil financier pour l'accès aux examens a été mis à jour.</p>
+    {table_html}
+    {threshold_note}
+    <p style="margin-top:12px;">IMPORTANT: Si vous aviez un code d'accès temporaire (paiement partiel), celui-ci a été invalidé.</p>
+    <p>Veuillez effectuer un nouveau paiement pour atteindre le nouveau seuil et obtenir un code valide.</p>
+    <p>Les étudiants ayant payé intégralement conservent leur code valable toute l'année.</p>
+    <p>Cordialement,<br/>U.O.R - Système de Contrôle d'Accès</p>
+</div>
+"""
+_THRESHOLD_HTML_ROW = "<tr><td style='padding:6px 12px;'>{}</td><td style='padding:6px 12px;'><strong>{}</strong></td></tr>"
+_THRESHOLD_NOTE_HTML = "<p style='color:#b45309;font-weight:600;'>Vous n'avez pas encore atteint le nouveau seuil.</p>"
+
+_THRESHOLD_TEXT_HEAD = "Bonjour {student_name},\n\nLe seuil financier pour l'accès aux examens a été mis à jour.\n"
+_THRESHOLD_TEXT_TAIL = (
+    "\n\nIMPORTANT: Si vous aviez un code d'accès temporaire (paiement partiel), celui-ci a été invalidé.\n"
+    "Veuillez effectuer un nouveau paiement pour atteindre le nouveau seuil et obtenir un code valide.\n"
+    "\n"
+    "Les étudiants ayant payé intégralement conservent leur code valable toute l'année.\n"
+    "\n" + _SIGNATURE
+)
+
+_ACCESS_CODE_TEXT = """Bonjour {student_name},
+
+Félicitations! Votre code d'accès a été généré avec succès.
+
+Code d'accès: {access_code}
+{validity_msg}
+
+Utilisez ce code pour accéder à la salle d'examen.
+
+""" + _SIGNATURE
+_ACCESS_CODE_VALIDITY = {
+    "full": "Ce code est valable durant toutes les périodes d'examens de l'année académique.",
+    None: "Ce code est valable jusqu'à modification du seuil financier.",
+}
+
+_ACCESS_DENIED_TEXT = """Bonjour {student_name},
+
+Votre tentative d'accès à la salle d'examen a été refusée.
+Raison: {reason}
+
+Veuillez contacter l'administration pour plus d'informations.
+
+""" + _SIGNATURE
+
+_WELCOME_TEXT = """Bonjour {student_name},
+
+Bienvenue à l'Université Officielle de Ruwenzori (U.O.R) !
+
+Votre inscription a été enregistrée avec succès.
+
+📋 INFORMATIONS DE VOTRE COMPTE:
+• Matricule étudiant: {student_number}
+• Email: {student_email}
+• Téléphone: {student_phone}
+
+💰 INFORMATIONS FINANCIÈRES:
+• Seuil pour accès aux examens: ${threshold_required:,.2f}
+• Frais académiques totaux: ${final_fee:,.2f}
+
+ℹ️ IMPORTANT:
+Pour accéder aux salles d'examens, vous devez:
+1. Effectuer un paiement atteignant au moins le seuil requis
+2. Un code d'accès vous sera automatiquement envoyé par email/WhatsApp
+3. Présentez ce code au terminal d'accès le jour de l'examen
+
+Vous recevrez une notification automatique après chaque paiement.
+
+En cas de question, contactez l'administration.
+
+""" + _SIGNATURE
+_WELCOME_WHATSAPP = (
+    "Bienvenue {student_name} à l'Université Officielle de Ruwenzori (U.O.R)! "
+    "Matricule étudiant: {student_number}. "
+    "Seuil examens: ${threshold_required:,.2f}. "
+    "Frais totaux: ${final_fee:,.2f}. "
+    "Un code d'accès vous sera envoyé par email/WhatsApp après paiement du seuil."
+)
+
+
+class NotificationTemplates:
+    """Rendu des notifications par type (parties fixes préparées une fois)"""
+
+    SUBJECTS = {
+        "payment": "Notification de Paiement - U.O.R",
+        "access_code": "Votre code d'accès - U.O.R",
+        "threshold_change": "Mise à jour du seuil financier - Action requise - U.O.R",
+        "welcome": "Bienvenue à U.O.R - Informations importantes",
+        "access_denied": "Accès Refusé - U.O.R",
+    }
+
+    def __init__(self, logo_path: str = None):
+        self.logo_path = EMAIL_LOGO_PATH if logo_path is None else logo_path
+        self.has_logo = bool(self.logo_path and os.path.exists(self.logo_path))
+        logo_html = _LOGO_HTML if self.has_logo else ""
+        # Gabarits figés: seul le bloc logo est résolu ici, une fois
+        self._payment_html = _PAYMENT_HTML.replace("{logo_html}", logo_html).strip().format
+        self._threshold_html = _THRESHOLD_HTML.replace("{logo_html}", logo_html).strip().format
+        self._access_code_text = _ACCESS_CODE_TEXT.format
+        self._access_denied_text = _ACCESS_DENIED_TEXT.format
+        self._welcome_text = _WELCOME_TEXT.format
+        self._welcome_whatsapp = _WELCOME_WHATSAPP.format
+        self._logo_part: Optional[MIMEImage] = None
+        self._logo_lock = threading.Lock()
+        self._renderers = {
+            "payment": self.payment,
+            "access_code": self.access_code,
+            "threshold_change": self.threshold_change,
+            "welcome": self.welcome,
+            "access_denied": self.access_denied,
+        }
+
+    # ---------- Logo ----------
+
+    def logo_part(self) -> Optional[MIMEImage]:
+        """Partie MIME inline du logo, lue et encodée au premier usage
+
+        La même instance est attachée à tous les emails: elle n'est jamais
+        modifiée après sa construction, la sérialisation la lit seulement.
+        """
+        if not self.has_logo:
+            return None
+        if self._logo_part is None:
+            with self._logo_lock:
+                if self._logo_part is None:
+                    with open(self.logo_path, "rb") as f:
+                        part = MIMEImage(f.read())
+                    part.add_header("Content-ID", "<uor_logo>")
+                    part.add_header("Content-Disposition", "inline", filename=os.path.basename(self.logo_path))
+                    self._logo_part = part
+        return self._logo_part
+
+    # ---------- Rendu ----------
+
+    def render(self, kind: str, **fields) -> RenderedNotification:
+        return self._renderers[kind](**fields)
+
+    def bind(self, kind: str, **common) -> Callable[..., RenderedNotification]:
+        """Rendu d'une campagne: les champs communs sont préparés une seule fois"""
+        if kind == "threshold_change":
+            return self._bind_threshold_change(**common)
+        return partial(self._renderers[kind], **common)
+
+    def payment(self, student_name: str, amount_paid: float, remaining_amount: float, final_fee: float,
+                threshold_amount: float = None, threshold_reached: bool = None,
+                promotion_info: str = None, **_ignored) -> RenderedNotification:
+        amount_paid_usd = _usd(amount_paid)
+        remaining_usd = _usd(max(remaining_amount, 0))
+        final_fee_usd = _usd(final_fee)
+        threshold_usd = _usd(threshold_amount)
+        threshold_status = _threshold_status(threshold_reached)
+        completed = remaining_amount <= 0
+
+        table_rows = [("Promotion", promotion_info)] if promotion_info else []
+        table_rows.extend([
+            ("Montant payé", amount_paid_usd),
+            ("Total des frais académiques", final_fee_usd),
+            ("Montant restant", remaining_usd),
+        ])
+        if threshold_usd is not None:
+            table_rows.append(("Seuil requis", threshold_usd))
+        if threshold_status:
+            table_rows.append(("Statut du seuil", threshold_status))
+
+        body = f"Bonjour {student_name},\n\nVotre paiement a été reçu avec succès.\n\n{text_table(table_rows)}"
+        if completed:
+            body += "\n\nFélicitations! Vous avez fini les frais académiques."
+        if threshold_status == "Non atteint":
+            body += "\n\nNote: Vous n'avez pas encore atteint le seuil financier requis pour l'accès aux examens."
+        body += "\n\n" + _SIGNATURE
+
+        whatsapp_rows = [("Promo", promotion_info)] if promotion_info else []
+        whatsapp_rows.extend([("Payé", amount_paid_usd), ("Reste", remaining_usd)])
+        if threshold_usd is not None:
+            whatsapp_rows.append(("Seuil", threshold_usd))
+        if threshold_status:
+            whatsapp_rows.append(("Statut", threshold_status))
+        whatsapp_msg = f"Bonjour {student_name}, paiement reçu.\n{text_table(whatsapp_rows)}"
+        if completed:
+            whatsapp_msg += " Félicitations! Vous avez fini les frais académiques."
+        if threshold_status == "Non atteint":
+            whatsapp_msg += " Vous n'avez pas encore atteint le seuil requis."
+
+        threshold_row = ""
+        if threshold_usd is not None:
+            threshold_row += _PAYMENT_HTML_ROW.format("Seuil requis", threshold_usd)
+        if threshold_status:
+            threshold_row += _PAYMENT_HTML_ROW.format("Statut du seuil", threshold_status)
+        html_body = self._payment_html(
+            student_name=student_name,
+            promotion_row=_PAYMENT_HTML_ROW.format("Promotion", promotion_info) if promotion_info else "",
+            amount_paid=amount_paid_usd,
+            final_fee=final_fee_usd,
+            remaining=remaining_usd,
+            threshold_row=threshold_row,
+            completion_html=_PAYMENT_COMPLETION_HTML if completed else "",
+        )
+        return RenderedNotification(self.SUBJECTS["payment"], body, whatsapp_body=whatsapp_msg,
+                                    html_body=html_body, attach_logo=True)
+
+    def access_code(self, student_name: str, access_code: str, code_type: str = None,
+                    **_ignored) -> RenderedNotification:
+        validity_msg = _ACCESS_CODE_VALIDITY["full" if code_type == "full" else None]
+        body = self._access_code_text(student_name=student_name, access_code=access_code,
+                                      validity_msg=validity_msg)
+        whatsapp_msg = f"Bonjour {student_name}, votre code d'accès: {access_code}. {validity_msg}"
+        return RenderedNotification(self.SUBJECTS["access_code"], body, whatsapp_body=whatsapp_msg)
+
+    def access_denied(self, student_name: str, reason: str, **_ignored) -> RenderedNotification:
+        body = self._access_denied_text(student_name=student_name, reason=reason)
+        return RenderedNotification(self.SUBJECTS["access_denied"], body)
+
+    def welcome(self, student_name: str, student_number: str, threshold_required: float,
+                final_fee: float, student_email: str = None, student_phone: str = None,
+                **_ignored) -> RenderedNotification:
+        fields = dict(student_name=student_name, student_number=student_number,
+                      student_email=student_email, student_phone=student_phone,
+                      threshold_required=float(threshold_required or 0), final_fee=float(final_fee or 0))
+        return RenderedNotification(self.SUBJECTS["welcome"], self._welcome_text(**fields),
+                                    whatsapp_body=self._welcome_whatsapp(**fields))
+
+    def threshold_change(self, student_name: str, old_threshold: float = None, new_threshold: float = None,
+                         old_final_fee: float = None, new_final_fee: float = None, amount_paid: float = None,
+                         remaining_amount: float = None, threshold_reached: bool = None,
+                         **_ignored) -> RenderedNotification:
+        render = self._bind_threshold_change(old_threshold=old_threshold, new_threshold=new_threshold,
+                                             old_final_fee=old_final_fee, new_final_fee=new_final_fee)
+        return render(student_name=student_name, amount_paid=amount_paid,
+                      remaining_amount=remaining_amount, threshold_reached=threshold_reached)
+
+    def _bind_threshold_change(self, old_threshold: float = None, new_threshold: float = None,
+                               old_final_fee: float = None, new_final_fee: float = None,
+                               **_ignored) -> Callable[..., RenderedNotification]:
+        old_usd, new_usd = _usd(old_threshold), _usd(new_threshold)
+        old_fee_usd, new_fee_usd = _usd(old_final_fee), _usd(new_final_fee)
+        common_rows = [(label, value) for label, value in (
+            ("Ancien seuil", old_usd), ("Nouveau seuil", new_usd),
+            ("Anciens frais", old_fee_usd), ("Nouveaux frais", new_fee_usd),
+        ) if value is not None]
+        common_html = "".join(_THRESHOLD_HTML_ROW.format(label, value) for label, value in common_rows)
+
+        parts = []
+        if old_usd is not None and new_usd is not None:
+            parts.append(f"Seuil: {old_usd} → {new_usd}.")
+        elif new_usd is not None:
+            parts.append(f"Nouveau seuil: {new_usd}.")
+        if old_fee_usd is not None and new_fee_usd is not None:
+            parts.append(f"Frais: {old_fee_usd} → {new_fee_usd}.")
+        elif new_fee_usd is not None:
+            parts.append(f"Nouveaux frais: {new_fee_usd}.")
+        whatsapp_common = " ".join(parts)
+        whatsapp_tail = "Votre code temporaire a été invalidé si applicable."
+        subject = self.SUBJECTS["threshold_change"]
+        threshold_html = self._threshold_html
+
+        def render(student_name: str, amount_paid: float = None, remaining_amount: float = None,
+                   threshold_reached: bool = None, **_ignored) -> RenderedNotification:
+            threshold_status = _threshold_status(threshold_reached)
+            rows = list(common_rows)
+            if amount_paid is not None:
+                rows.append(("Montant payé", _usd(amount_paid)))
+            if remaining_amount is not None:
+                rows.append(("Montant restant", _usd(max(float(remaining_amount), 0))))
+            if threshold_status:
+                rows.append(("Statut du seuil", threshold_status))
+            table = text_table(rows)
+
+            body = _THRESHOLD_TEXT_HEAD.format(student_name=student_name)
+            if table:
+                body += "\n" + table
+            body += _THRESHOLD_TEXT_TAIL
+
+            whatsapp_msg = f"Bonjour {student_name}, mise à jour du seuil financier."
+            if whatsapp_common:
+                whatsapp_msg += " " + whatsapp_common
+            if threshold_status:
+                whatsapp_msg += f" Statut seuil: {threshold_status}."
+            whatsapp_msg += " " + whatsapp_tail
+            if table:
+                whatsapp_msg += "\n" + table
+
+            table_html = ""
+            if rows:
+                table_html = (
+                    "<table style='border-collapse:collapse; margin:12px 0;'>"
+                    + common_html
+                    + "".join(_THRESHOLD_HTML_ROW.format(label, value) for label, value in rows[len(common_rows):])
+                    + "</table>"
+                )
+            html_body = threshold_html(
+                student_name=student_name, table_html=table_html,
+                threshold_note=_THRESHOLD_NOTE_HTML if threshold_status == "Non atteint" else "",
+            )
+            return RenderedNotification(subject, body, whatsapp_body=whatsapp_msg,
+                                        html_body=html_body, attach_logo=True)
+
+        return render
+
+
+_shared_templates: Optional[NotificationTemplates] = None
+_shared_lock = threading.Lock()
+
+
+def get_notification_templates() -> NotificationTemplates:
+    """Modèles partagés par le processus (compilés au premier rendu)"""
+    global _shared_templates
+    with _shared_lock:
+        if _shared_templates is None:
+            _shared_templates = NotificationTemplates()
+        return _shared_templates
@@ -0,0 +1,251 @@
+"""Annuaire des destinataires: student_id -> email, téléphone E.164, langue
+
+Les envois de masse relisaient email et téléphone par des jointures larges
+(`SELECT *` sur student, photos comprises) et chaque envoi WhatsApp
+renormalisait le numéro. L'annuaire charge une fois les contacts des
+étudiants actifs (une requête, colonnes strictement nécessaires) dans un
+dictionnaire de tuples, avec un index par promotion:
+
+- numéros normalisés au chargement (E.164, indicatif NOTIFICATION_DEFAULT_COUNTRY_CODE
+  pour les numéros locaux); un numéro invalide est écarté (pas de WhatsApp);
+- langue préférée (colonne optionnelle preferred_language / language,
+  défaut NOTIFICATION_DEFAULT_LANGUAGE);
+- `update_student` met l'entrée à jour sans relecture; création et
+  désactivation relisent l'étudiant concerné;
+- rechargement complet après RECIPIENT_DIRECTORY_TTL_S (changements faits
+  par un autre processus).
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from config import settings
+from core.database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+_PHONE_NOISE = re.compile(r"[\s\-().]")
+_LANGUAGE_COLUMNS = ("preferred_language", "language")
+
+
+@lru_cache(maxsize=8192)
+def normalize_phone(raw: str) -> Optional[str]:
+    """Numéro au format E.164 (+ et 8 à 15 chiffres), None s'il est invalide
+
+    Accepte les préfixes `whatsapp:` et `00`, les séparateurs usuels et les
+    numéros locaux (0XXXXXXXXX -> +<indicatif>XXXXXXXXX).
+    """
+    if not raw:
+        return None
+    number = str(raw).strip()
+    if number.lower().startswith("whatsapp:"):
+        number = number[len("whatsapp:"):]
+    number = _PHONE_NOISE.sub("", number)
+    if number.startswith("00"):
+        number = "+" + number[2:]
+    elif number.startswith("0") and settings.NOTIFICATION_DEFAULT_COUNTRY_CODE:
+        number = f"+{settings.NOTIFICATION_DEFAULT_COUNTRY_CODE}{number[1:]}"
+    elif not number.startswith("+"):
+        number = "+" + number
+    digits = number[1:]
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        return None
+    return number
+
+
+class Contact(NamedTuple):
+    """Coordonnées d'un étudiant pour les notifications"""
+
+    student_id: int
+    firstname: str
+    lastname: str
+    email: Optional[str]
+    phone: Optional[str]          # E.164
+    language: str
+    promotion_id: Optional[int]
+
+    @property
+    def name(self) -> str:
+        return f"{self.firstname} {self.lastname}".strip()
+
+    def as_recipient(self) -> dict:
+        """Destinataire pour NotificationService.broadcast"""
+        return {"key": self.student_id, "email": self.email, "phone": self.phone,
+                "student_name": self.name, "language": self.language}
+
+
+class RecipientDirectory:
+    """Contacts des étudiants actifs en mémoire, tenus à jour par événements"""
+
+    def __init__(self, ttl_s: float = None):
+        self.ttl_s = settings.RECIPIENT_DIRECTORY_TTL_S if ttl_s is None else ttl_s
+        self._db = None
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self._contacts: Dict[int, Contact] = {}
+        self._by_promotion: Dict[int, Set[int]] = {}
+        self._language_column: Optional[str] = None
+
+    @property
+    def db(self) -> DatabaseConnection:
+        if self._db is None:
+            self._db = DatabaseConnection()
+        return self._db
+
+    # ---------- Chargement ----------
+
+    def _contact_query(self, where_sql: str = "") -> str:
+        language = self._language_column or "NULL"
+        return f"""
+            SELECT id, firstname, lastname, email, phone_number, promotion_id, {language} AS language
+            FROM student
+            WHERE is_active = 1{where_sql}
+        """
+
+    def _detect_language_column(self) -> Optional[str]:
+        rows = self.db.execute_query(
+            """
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'student'
+            """
+        ) or []
+        columns = {row.get("COLUMN_NAME") for row in rows}
+        return next((name for name in _LANGUAGE_COLUMNS if name in columns), None)
+
+    @staticmethod
+    def _contact(row: dict) -> Contact:
+        email = (row.get("email") or "").strip() or None
+        raw_phone = row.get("phone_number")
+        phone = normalize_phone(str(raw_phone)) if raw_phone else None
+        if raw_phone and phone is None:
+            logger.debug(f"Student {row['id']}: invalid phone number ignored for notifications")
+        language = sys.intern(str(row.get("language") or settings.NOTIFICATION_DEFAULT_LANGUAGE).strip().lower())
+        promotion_id = row.get("promotion_id")
+        return Contact(int(row["id"]), row.get("firstname") or "", row.get("lastname") or "", email, phone,
+                       language, int(promotion_id) if promotion_id is not None else None)
+
+    def load(self) -> int:
+        """Recharge l'annuaire complet (une requête); retourne le nombre de contacts"""
+        try:
+            self._language_column = self._detect_language_column()
+            rows = self.db.execute_query(self._contact_query()) or []
+        except Exception as e:
+            logger.error(f"Error loading recipient directory: {e}")
+            return 0
+        contacts = {}
+        by_promotion: Dict[int, Set[int]] = {}
+        for row in rows:
+            contact = self._contact(row)
+            contacts[contact.student_id] = contact
+            by_promotion.setdefault(contact.promotion_id, set()).add(contact.student_id)
+        with self._lock:
+            self._contacts, self._by_promotion = contacts, by_promotion
+            self._loaded_at = time.monotonic()
+        logger.info(f"Recipient directory loaded: {len(contacts)} contact(s)")
+        return len(contacts)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s:
+            self.load()
+
+    def invalidate(self) -> None:
+        """Force un rechargement complet à la prochaine lecture"""
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- Mise à jour par événements ----------
+
+    def _put(self, contact: Contact) -> None:
+        """Remplace l'entrée d'un étudiant (appelé sous verrou)"""
+        self._discard(contact.student_id)
+        self._contacts[contact.student_id] = contact
+        self._by_promotion.setdefault(contact.promotion_id, set()).add(contact.student_id)
+
+    def _discard(self, student_id: int) -> None:
+        previous = self._contacts.pop(student_id, None)
+        if previous is not None:
+            self._by_promotion.get(previous.promotion_id, set()).discard(student_id)
+
+    def refresh_students(self, student_ids: Iterable[int]) -> None:
+        """Relit quelques étudiants (création, désactivation, entrées manquantes)
+
+        Sans effet si l'annuaire n'est pas chargé (il sera construit à la demande).
+        """
+        ids = sorted({int(student_id) for student_id in student_ids or []})
+        if not ids or self._loaded_at is None:
+            return
+        try:
+            rows = self.db.execute_query(
+                self._contact_query(f" AND id IN ({', '.join(['%s'] * len(ids))})"), tuple(ids)
+            ) or []
+        except Exception as e:
+            logger.error(f"Error refreshing {len(ids)} recipient(s): {e}")
+            self.invalidate()
+            return
+        with self._lock:
+            found = set()
+            for row in rows:
+                contact = self._contact(row)
+                self._put(contact)
+                found.add(contact.student_id)
+            for student_id in set(ids) - found:
+                self._discard(student_id)
+
+    def apply_update(self, student_id: int, data: dict) -> None:
+        """Reporte les champs modifiés par `update_student` (sans relecture)"""
+        student_id = int(student_id)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            contact = self._contacts.get(student_id)
+        if contact is None:
+            self.refresh_students([student_id])
+            return
+        row = {
+            "id": student_id,
+            "firstname": data.get("firstname", contact.firstname),
+            "lastname": data.get("lastname", contact.lastname),
+            "email": data.get("email", contact.email),
+            "phone_number": data.get("phone_number", contact.phone),
+            "promotion_id": data.get("promotion_id", contact.promotion_id),
+            "language": next((data[name] for name in _LANGUAGE_COLUMNS if name in data), contact.language),
+        }
+        with self._lock:
+            self._put(self._contact(row))
+
+    # ---------- Lecture ----------
+
+    def get(self, student_id: int) -> Optional[Contact]:
+        self._ensure_loaded()
+        with self._lock:
+            return self._contacts.get(int(student_id))
+
+    def get_many(self, student_ids: Iterable[int]) -> Dict[int, Contact]:
+        """Contacts d'une liste d'étudiants; les absents sont relus en une requête"""
+        self._ensure_loaded()
+        ids = [int(student_id) for student_id in student_ids]
+        with self._lock:
+            missing = [student_id for student_id in ids if student_id not in self._contacts]
+        if missing:
+            self.refresh_students(missing)
+        with self._lock:
+            return {student_id: self._contacts[student_id] for student_id in ids if student_id in self._contacts}
+
+    def by_promotion(self, promotion_id: int) -> List[Contact]:
+        """Étudiants actifs d'une promotion, par student_id croissant"""
+        self._ensure_loaded()
+        with self._lock:
+            ids = sorted(self._by_promotion.get(int(promotion_id), ()))
+            return [self._contacts[student_id] for student_id in ids]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._contacts)
+
+
+# Instance partagée: les mises à jour d'un service profitent aux envois du même processus
+recipient_directory = RecipientDirectory()
@@ -0,0 +1,192 @@
+"""Pool de sessions SMTP authentifiées (STARTTLS + login une seule fois)
+
+Ouvrir une connexion par email (TCP, STARTTLS, AUTH, QUIT) coûte plusieurs
+allers-retours: pour une campagne de milliers de messages, la poignée de main
+domine. Le pool garde quelques sessions ouvertes et envoie plusieurs messages
+par session:
+
+- une session est fermée après SMTP_MAX_MESSAGES_PER_SESSION messages (limite
+  par connexion des fournisseurs) ou SMTP_IDLE_TIMEOUT_S d'inactivité;
+- une session coupée par le serveur (déconnexion, 421) est remplacée et le
+  message renvoyé une fois sur une nouvelle session;
+- le nombre de sessions simultanées est borné par SMTP_POOL_SIZE et le débit
+  par SMTP_RATE_PER_S (indépendant de celui de WhatsApp).
+"""
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+from typing import Optional
+from config import settings
+from app.services.integration.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class _Session:
+    __slots__ = ("smtp", "created_at", "last_used", "sent")
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.created_at = self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SmtpSessionPool:
+    """Sessions SMTP réutilisables, bornées et renouvelées automatiquement"""
+
+    def __init__(self, host: str = None, port: int = None, username: str = None, password: str = None,
+                 starttls: bool = None, size: int = None, max_messages: int = None,
+                 idle_timeout_s: float = None, timeout_s: float = None, rate_per_s: float = None):
+        self.host = host or settings.SMTP_HOST
+        self.port = port or settings.SMTP_PORT
+        self.username = settings.EMAIL_ADDRESS if username is None else username
+        self.password = settings.EMAIL_PASSWORD if password is None else password
+        self.starttls = settings.SMTP_STARTTLS if starttls is None else starttls
+        self.size = max(1, size or settings.SMTP_POOL_SIZE)
+        self.max_messages = max(1, max_messages or settings.SMTP_MAX_MESSAGES_PER_SESSION)
+        self.idle_timeout_s = settings.SMTP_IDLE_TIMEOUT_S if idle_timeout_s is None else idle_timeout_s
+        self.timeout_s = timeout_s or settings.SMTP_TIMEOUT_S
+        self.bucket = TokenBucket(settings.SMTP_RATE_PER_S if rate_per_s is None else rate_per_s,
+                                  burst=self.size)
+        # Sessions inactives, la plus récente d'abord (moins d'expirations)
+        self._idle: "queue.LifoQueue[_Session]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._metrics = {"connections": 0, "messages": 0, "reconnects": 0, "recycled": 0, "connect_s": 0.0}
+
+    def _connect(self) -> _Session:
+        started = time.monotonic()
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout_s)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._close(_Session(smtp), graceful=False)
+            raise
+        with self._lock:
+            self._metrics["connections"] += 1
+            self._metrics["connect_s"] += time.monotonic() - started
+        return _Session(smtp)
+
+    @staticmethod
+    def _close(session: _Session, graceful: bool = True) -> None:
+        try:
+            if graceful:
+                session.smtp.quit()
+            else:
+                session.smtp.close()
+        except Exception:
+            try:
+                session.smtp.close()
+            except Exception:
+                pass
+
+    def _acquire(self) -> _Session:
+        if not self._slots.acquire(timeout=self.timeout_s * 3):
+            raise TimeoutError(f"No SMTP session available after {self.timeout_s * 3:.0f}s")
+        try:
+            while True:
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - session.last_used > self.idle_timeout_s:
+                    self._close(session)
+                    continue
+                return session
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, session: _Session, healthy: bool) -> None:
+        try:
+            if not healthy:
+                self._close(session, graceful=False)
+            elif session.sent >= self.max_messages:
+                self._close(session)
+                with self._lock:
+                    self._metrics["recycled"] += 1
+            else:
+                session.last_used = time.monotonic()
+                self._idle.put(session)
+        finally:
+            self._slots.release()
+
+    def send(self, message) -> None:
+        """Envoie un `email.message.Message`; lève une exception en cas d'échec"""
+        self.bucket.acquire()
+        for attempt in (1, 2):
+            session = self._acquire()
+            healthy = True
+            try:
+                session.smtp.send_message(message)
+                session.sent += 1
+                with self._lock:
+                    self._metrics["messages"] += 1
+                return
+            except smtplib.SMTPServerDisconnected:
+                healthy = False
+                if attempt == 2:
+                    raise
+            except smtplib.SMTPResponseException as e:
+                # 421: le serveur ferme la session (limite atteinte, maintenance)
+                if e.smtp_code != 421:
+                    raise
+                healthy = False
+                if attempt == 2:
+                    raise
+            except smtplib.SMTPException:
+                # Refus d'un destinataire, etc.: la session reste utilisable
+                raise
+            except OSError:
+                healthy = False
+                if attempt == 2:
+                    raise
+            finally:
+                self._release(session, healthy)
+            with self._lock:
+                self._metrics["reconnects"] += 1
+            logger.info("SMTP session lost, retrying on a new session")
+
+    def close_all(self) -> None:
+        """Ferme les sessions inactives (arrêt du processus)"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["idle_sessions"] = self._idle.qsize()
+        metrics["size"] = self.size
+        if metrics["connections"]:
+            metrics["avg_connect_ms"] = round(metrics["connect_s"] / metrics["connections"] * 1000, 2)
+            metrics["messages_per_connection"] = round(metrics["messages"] / metrics["connections"], 1)
+        return metrics
+
+
+_shared_pool: Optional[SmtpSessionPool] = None
+_shared_lock = threading.Lock()
+
+
+def get_smtp_pool() -> SmtpSessionPool:
+    """Pool partagé par les workers email du processus (créé au premier envoi)"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            # Une session de plus par worker de la voie transactionnelle: un code
+            # d'accès n'attend pas qu'une session se libère après un email de campagne
+            _shared_pool = SmtpSessionPool(
+                size=settings.SMTP_POOL_SIZE + max(0, settings.NOTIFICATION_PRIORITY_EMAIL_WORKERS)
+            )
+            atexit.register(_shared_pool.close_all)
+        return _shared_pool
@@ -0,0 +1,160 @@
+"""Client Ultramsg WhatsApp: connexions keep-alive, envois concurrents bornés, débit limité
+
+Chaque `requests.post` ouvrait une connexion TLS neuve. Le client partage une
+`requests.Session` dont l'adaptateur garde WHATSAPP_HTTP_POOL_SIZE connexions
+ouvertes vers l'API; au plus WHATSAPP_MAX_IN_FLIGHT requêtes sont en vol et un
+seau à jetons (WHATSAPP_RATE_PER_S, rafale WHATSAPP_RATE_BURST) garde le
+débit sous la limite du fournisseur. Un 429 suspend le seau pendant
+Retry-After pour tous les threads avant un nouvel essai.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from config import settings
+from app.services.integration.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class WhatsAppRateLimited(RuntimeError):
+    """429 persistant: le message doit être replanifié plus tard"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Ultramsg rate limited, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _retry_after(response: requests.Response, default: float) -> float:
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class UltramsgClient:
+    """Envoi de messages texte via l'API Ultramsg /messages/chat"""
+
+    def __init__(self, instance_id: str = None, token: str = None, base_url: str = None,
+                 pool_size: int = None, max_in_flight: int = None, rate_per_s: float = None,
+                 burst: int = None, timeout_s: float = None):
+        self.instance_id = settings.ULTRAMSG_INSTANCE_ID if instance_id is None else instance_id
+        self.token = settings.ULTRAMSG_TOKEN if token is None else token
+        self.base_url = (base_url or settings.ULTRAMSG_BASE_URL).rstrip("/")
+        self.max_in_flight = max(1, max_in_flight or settings.WHATSAPP_MAX_IN_FLIGHT)
+        self.timeout_s = timeout_s or settings.WHATSAPP_HTTP_TIMEOUT_S
+        self.bucket = TokenBucket(
+            settings.WHATSAPP_RATE_PER_S if rate_per_s is None else rate_per_s,
+            burst or settings.WHATSAPP_RATE_BURST
+        )
+        pool_size = max(self.max_in_flight, pool_size or settings.WHATSAPP_HTTP_POOL_SIZE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._metrics = {"sent": 0, "failed": 0, "rate_limited": 0, "latency_s": 0.0}
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/{self.instance_id}/messages/chat"
+
+    def send(self, to_number: str, body: str) -> dict:
+        """Envoie un message; renvoie la réponse JSON, lève une exception en cas d'échec"""
+        payload = {"token": self.token, "to": to_number, "body": body}
+        for attempt in range(1, settings.WHATSAPP_MAX_429_RETRIES + 2):
+            if not self.bucket.acquire(timeout=settings.WHATSAPP_MAX_RETRY_AFTER_S):
+                raise WhatsAppRateLimited(settings.WHATSAPP_MAX_RETRY_AFTER_S)
+            with self._in_flight:
+                started = time.monotonic()
+                try:
+                    response = self.session.post(self.url, data=payload, timeout=self.timeout_s)
+                except requests.exceptions.RequestException:
+                    self._count("failed")
+                    raise
+                elapsed = time.monotonic() - started
+            if response.status_code == 429:
+                wait = _retry_after(response, default=1.0 / max(self.bucket.rate, 0.1))
+                self._count("rate_limited")
+                if wait > settings.WHATSAPP_MAX_RETRY_AFTER_S or attempt > settings.WHATSAPP_MAX_429_RETRIES:
+                    self.bucket.pause(min(wait, settings.WHATSAPP_MAX_RETRY_AFTER_S))
+                    raise WhatsAppRateLimited(wait)
+                logger.warning(f"Ultramsg 429, pausing WhatsApp sends for {wait:.1f}s")
+                self.bucket.pause(wait)
+                continue
+            try:
+                response.raise_for_status()
+                result = response.json()
+            except Exception:
+                self._count("failed")
+                raise
+            if result.get("sent") == "true" or result.get("sent") is True:
+                with self._lock:
+                    self._metrics["sent"] += 1
+                    self._metrics["latency_s"] += elapsed
+                return result
+            self._count("failed")
+            raise RuntimeError(f"Ultramsg sent=false - Response: {result}")
+        raise WhatsAppRateLimited(0)
+
+    def send_many(self, messages: Iterable[Tuple[str, str]]) -> Iterator[Tuple[int, Optional[Exception]]]:
+        """Envoie (numéro, texte) en parallèle; produit (index, erreur ou None) au fil des réponses"""
+        executor = self._get_executor()
+        window = []
+        for index, (to_number, body) in enumerate(messages):
+            window.append((index, executor.submit(self.send, to_number, body)))
+            # Au plus 2 × max_in_flight messages soumis: l'itérateur reste paresseux
+            while len(window) >= 2 * self.max_in_flight:
+                yield self._result(*window.pop(0))
+        for item in window:
+            yield self._result(*item)
+
+    @staticmethod
+    def _result(index: int, future) -> Tuple[int, Optional[Exception]]:
+        try:
+            future.result()
+            return index, None
+        except Exception as e:
+            return index, e
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                    thread_name_prefix="whatsapp-send")
+            return self._executor
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._metrics[key] += 1
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        if metrics["sent"]:
+            metrics["avg_latency_ms"] = round(metrics["latency_s"] / metrics["sent"] * 1000, 2)
+        return metrics
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_shared_client: Optional[UltramsgClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_whatsapp_client() -> UltramsgClient:
+    """Client partagé par les workers WhatsApp du processus (créé au premier envoi)"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = UltramsgClient()
+        return _shared_client
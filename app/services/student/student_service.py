@@ -7,6 +7,8 @@ from typing import List, Optional
 from core.models.student import Student
 from core.models.promotion import Promotion
 from core.database.connection import DatabaseConnection
+from app.services.finance.finance_aggregate_service import FinanceAggregateService
+from app.services.integration.recipient_directory import recipient_directory
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +18,8 @@ class StudentService:
     
     def __init__(self):
         self.db = DatabaseConnection()
+        self.aggregates = FinanceAggregateService()
+        self.recipients = recipient_directory
 
     def _get_table_columns(self, table_name: str) -> set:
         try:
@@ -46,7 +50,11 @@ class StudentService:
                 student.phone_number,
                 student.promotion_id
             )
-            self.db.execute_update(query, params)
+            with self.db.transaction() as cursor, \
+                    self.aggregates.track(cursor, "s.student_number = %s", (student.student_number,)):
+                cursor.execute(query, params)
+                student_id = cursor.lastrowid
+            self.recipients.refresh_students([student_id] if student_id else [])
             logger.info(f"Student {student.student_number} created successfully")
             return True
         except Exception as e:
@@ -89,7 +97,12 @@ class StudentService:
         """Désactive un étudiant"""
         try:
             query = "UPDATE student SET is_active = 0 WHERE student_number = %s"
-            self.db.execute_update(query, (student_number,))
+            with self.db.transaction() as cursor, \
+                    self.aggregates.track(cursor, "s.student_number = %s", (student_number,)):
+                cursor.execute(query, (student_number,))
+                cursor.execute("SELECT id FROM student WHERE student_number = %s", (student_number,))
+                student_ids = [row["id"] for row in cursor.fetchall()]
+            self.recipients.refresh_students(student_ids)
             logger.info(f"Student {student_number} deactivated")
             return True
         except Exception as e:
@@ -221,7 +234,13 @@ class StudentService:
             params.append(student_id)
             logger.debug(f"Update query: {query}")
             logger.debug(f"Update params: {params}")
-            self.db.execute_update(query, tuple(params))
+            if "promotion_id" in data:
+                # Changement de promotion: les agrégats suivent dans la même transaction
+                with self.db.transaction() as cursor, self.aggregates.track_students(cursor, [student_id]):
+                    cursor.execute(query, tuple(params))
+            else:
+                self.db.execute_update(query, tuple(params))
+            self.recipients.apply_update(student_id, data)
             logger.info(f"Student {student_id} updated successfully")
             return True
         except Exception as e:
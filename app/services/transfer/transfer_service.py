@@ -7,6 +7,7 @@ from typing import List, Dict, Optional, Tuple
 from decimal import Decimal
 
 from core.database.connection import DatabaseConnection
+from app.services.finance.finance_aggregate_service import FinanceAggregateService
 from core.models.student import Student
 from core.models.academic_record import AcademicRecord
 from core.models.student_document import StudentDocument
@@ -53,6 +54,7 @@ class TransferService:
     """Service pour gérer les transferts de données étudiantes entre universités"""
     def __init__(self):
         self.db = DatabaseConnection()
+        self.aggregates = FinanceAggregateService()
         self.university_code = "UOR"  # Code de notre université
         self.university_name = "Université Officielle de Ruwenzori"
     
@@ -301,18 +303,20 @@ class TransferService:
             # Mot de passe temporaire (doit être changé par l'étudiant)
             temp_password_hash = hashlib.sha256("ChangeMe123!".encode()).hexdigest()
             
-            cursor.execute(insert_student, (
-                student_number,
-                student_info.get('firstname'),
-                student_info.get('lastname'),
-                student_info.get('email'),
-                student_info.get('phone_number'),
-                target_promotion_id,
-                temp_password_hash,
-                True
-            ))
+            with self.aggregates.track(cursor, "s.student_number = %s", (student_number,)):
+                cursor.execute(insert_student, (
+                    student_number,
+                    student_info.get('firstname'),
+                    student_info.get('lastname'),
+                    student_info.get('email'),
+                    student_info.get('phone_number'),
+                    target_promotion_id,
+                    temp_password_hash,
+                    True
+                ))
+                # Lu avant la sortie de track(), dont l'upsert des agrégats remet lastrowid à zéro
+                student_id = cursor.lastrowid
             
-            student_id = cursor.lastrowid
             logger.info(f"Étudiant créé avec ID: {student_id}, Numéro: {student_number}")
             
             # 4. Importer les notes académiques
@@ -16,9 +16,48 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 JWT_EXPIRATION = int(os.getenv("JWT_EXPIRATION", 3600))
 PASSWORD_MIN_LENGTH = 6  # 6 chiffres minimum
 
+# Limitation des tentatives de connexion (protège le CPU avant bcrypt)
+LOGIN_THROTTLE_CAPACITY = int(os.getenv("LOGIN_THROTTLE_CAPACITY", 5))
+LOGIN_THROTTLE_REFILL_PER_MIN = float(os.getenv("LOGIN_THROTTLE_REFILL_PER_MIN", 5))
+LOGIN_THROTTLE_POINT_CAPACITY = int(os.getenv("LOGIN_THROTTLE_POINT_CAPACITY", 60))
+LOGIN_THROTTLE_POINT_REFILL_PER_MIN = float(os.getenv("LOGIN_THROTTLE_POINT_REFILL_PER_MIN", 60))
+LOGIN_THROTTLE_BACKOFF_BASE_S = float(os.getenv("LOGIN_THROTTLE_BACKOFF_BASE_S", 1.0))
+LOGIN_THROTTLE_BACKOFF_MAX_S = float(os.getenv("LOGIN_THROTTLE_BACKOFF_MAX_S", 300.0))
+LOGIN_THROTTLE_MAX_ENTRIES = int(os.getenv("LOGIN_THROTTLE_MAX_ENTRIES", 10000))
+
+# Instantané hors-ligne des éligibilités (terminaux de porte)
+# Clé HMAC partagée avec les terminaux: refusée si vide ou laissée à la valeur d'exemple
+SECRET_KEY_PLACEHOLDERS = ("your-secret-key-change-in-production", "your-secret-key-here")
+OFFLINE_SNAPSHOT_KEY = os.getenv("OFFLINE_SNAPSHOT_KEY") or SECRET_KEY
+OFFLINE_SNAPSHOT_DIR = os.getenv(
+    "OFFLINE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage", "offline_snapshots")
+)
+
 # Seuils financiers
 FINANCIAL_THRESHOLD = float(os.getenv("FINANCIAL_THRESHOLD", 0.0))
 
+# Émission groupée des codes d'accès (hachage bcrypt parallèle)
+ACCESS_CODE_HASH_WORKERS = int(os.getenv("ACCESS_CODE_HASH_WORKERS", os.cpu_count() or 2))
+ACCESS_CODE_BATCH_SIZE = int(os.getenv("ACCESS_CODE_BATCH_SIZE", 200))
+
+# Déploiement d'un changement de seuil par blocs de clés primaires (transactions courtes)
+THRESHOLD_ROLLOUT_CHUNK_SIZE = int(os.getenv("THRESHOLD_ROLLOUT_CHUNK_SIZE", 500))
+
+# Instantané des étudiants éligibles (bitsets): rechargement complet après ce délai
+ELIGIBILITY_SNAPSHOT_TTL_S = float(os.getenv("ELIGIBILITY_SNAPSHOT_TTL_S", 300.0))
+
+# Calendrier des périodes d'examen en mémoire: rechargement après ce délai
+EXAM_CALENDAR_TTL_S = float(os.getenv("EXAM_CALENDAR_TTL_S", 600.0))
+
+# Effets de bord financiers (notifications, codes d'accès): pool borné partagé
+FINANCE_SIDE_EFFECT_WORKERS = int(os.getenv("FINANCE_SIDE_EFFECT_WORKERS", 4))
+FINANCE_SIDE_EFFECT_QUEUE_SIZE = int(os.getenv("FINANCE_SIDE_EFFECT_QUEUE_SIZE", 500))
+# Politique si la file est pleine: block (attente bornée), caller_runs, drop
+FINANCE_SIDE_EFFECT_POLICY = os.getenv("FINANCE_SIDE_EFFECT_POLICY", "block")
+FINANCE_SIDE_EFFECT_BLOCK_TIMEOUT_S = float(os.getenv("FINANCE_SIDE_EFFECT_BLOCK_TIMEOUT_S", 5.0))
+FINANCE_SIDE_EFFECT_DRAIN_TIMEOUT_S = float(os.getenv("FINANCE_SIDE_EFFECT_DRAIN_TIMEOUT_S", 30.0))
+
 # Taux de conversion FC -> USD pour affichage
 USD_EXCHANGE_RATE_FC = float(os.getenv("USD_EXCHANGE_RATE_FC", 2700.0))
 
@@ -27,6 +66,16 @@ EMAIL_SERVICE = os.getenv("EMAIL_SERVICE", "gmail")  # ou autre
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
 
+# Sessions SMTP persistantes (plusieurs messages par connexion authentifiée)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "True").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_MAX_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", 100))
+SMTP_IDLE_TIMEOUT_S = float(os.getenv("SMTP_IDLE_TIMEOUT_S", 60.0))
+SMTP_TIMEOUT_S = float(os.getenv("SMTP_TIMEOUT_S", 10.0))
+SMTP_RATE_PER_S = float(os.getenv("SMTP_RATE_PER_S", 0.0))  # 0 = pas de limite
+
 # WhatsApp (Twilio - legacy)
 WHATSAPP_ACCOUNT_SID = os.getenv("WHATSAPP_ACCOUNT_SID", os.getenv("TWILIO_ACCOUNT_SID", ""))
 WHATSAPP_AUTH_TOKEN = os.getenv("WHATSAPP_AUTH_TOKEN", os.getenv("TWILIO_AUTH_TOKEN", ""))
@@ -35,6 +84,16 @@ WHATSAPP_FROM = os.getenv("WHATSAPP_FROM", os.getenv("TWILIO_WHATSAPP_FROM", "")
 # Ultramsg WhatsApp API
 ULTRAMSG_INSTANCE_ID = os.getenv("ULTRAMSG_INSTANCE_ID", "")
 ULTRAMSG_TOKEN = os.getenv("ULTRAMSG_TOKEN", "")
+ULTRAMSG_BASE_URL = os.getenv("ULTRAMSG_BASE_URL", "https://api.ultramsg.com")
+
+# Envoi WhatsApp: connexions keep-alive, requêtes en vol, seau à jetons (msg/s)
+WHATSAPP_HTTP_POOL_SIZE = int(os.getenv("WHATSAPP_HTTP_POOL_SIZE", 8))
+WHATSAPP_HTTP_TIMEOUT_S = float(os.getenv("WHATSAPP_HTTP_TIMEOUT_S", 10.0))
+WHATSAPP_MAX_IN_FLIGHT = int(os.getenv("WHATSAPP_MAX_IN_FLIGHT", 8))
+WHATSAPP_RATE_PER_S = float(os.getenv("WHATSAPP_RATE_PER_S", 5.0))
+WHATSAPP_RATE_BURST = int(os.getenv("WHATSAPP_RATE_BURST", 10))
+WHATSAPP_MAX_429_RETRIES = int(os.getenv("WHATSAPP_MAX_429_RETRIES", 2))
+WHATSAPP_MAX_RETRY_AFTER_S = float(os.getenv("WHATSAPP_MAX_RETRY_AFTER_S", 30.0))
 
 # WhatsApp Templates (optional - for pre-approved content Messages)
 WHATSAPP_TEMPLATE_ACCESS_CODE = os.getenv("WHATSAPP_TEMPLATE_ACCESS_CODE", "")
@@ -44,6 +103,35 @@ WHATSAPP_USE_TEMPLATES = os.getenv("WHATSAPP_USE_TEMPLATES", "False").lower() ==
 # Email branding
 EMAIL_LOGO_PATH = os.getenv("EMAIL_LOGO_PATH", "")
 
+# Outbox des notifications: workers par canal, essais avec délai exponentiel
+NOTIFICATION_EMAIL_WORKERS = int(os.getenv("NOTIFICATION_EMAIL_WORKERS", 2))
+NOTIFICATION_WHATSAPP_WORKERS = int(os.getenv("NOTIFICATION_WHATSAPP_WORKERS", 2))
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", 20))
+NOTIFICATION_OUTBOX_POLL_S = float(os.getenv("NOTIFICATION_OUTBOX_POLL_S", 5.0))
+NOTIFICATION_LEASE_S = int(os.getenv("NOTIFICATION_LEASE_S", 120))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 8))
+NOTIFICATION_RETRY_BASE_S = float(os.getenv("NOTIFICATION_RETRY_BASE_S", 30.0))
+NOTIFICATION_RETRY_MAX_S = float(os.getenv("NOTIFICATION_RETRY_MAX_S", 3600.0))
+# Campagnes (broadcast): destinataires mis en file par transaction
+NOTIFICATION_BROADCAST_BATCH_SIZE = int(os.getenv("NOTIFICATION_BROADCAST_BATCH_SIZE", 200))
+# Fenêtre de regroupement par destinataire (reçus successifs, reçu + code); 0 = désactivé
+NOTIFICATION_COALESCE_WINDOW_S = float(os.getenv("NOTIFICATION_COALESCE_WINDOW_S", 20.0))
+# Voie transactionnelle (codes d'accès, reçus): workers et requêtes WhatsApp réservés;
+# les campagnes se partagent le reste et au plus NOTIFICATION_BULK_RATE_SHARE du débit WhatsApp
+NOTIFICATION_PRIORITY_EMAIL_WORKERS = int(os.getenv("NOTIFICATION_PRIORITY_EMAIL_WORKERS", 1))
+NOTIFICATION_PRIORITY_WHATSAPP_WORKERS = int(os.getenv("NOTIFICATION_PRIORITY_WHATSAPP_WORKERS", 1))
+WHATSAPP_PRIORITY_IN_FLIGHT = int(os.getenv("WHATSAPP_PRIORITY_IN_FLIGHT", 2))
+NOTIFICATION_BULK_RATE_SHARE = float(os.getenv("NOTIFICATION_BULK_RATE_SHARE", 0.8))
+# Annuaire des destinataires (contacts en mémoire): indicatif des numéros locaux, langue par défaut
+NOTIFICATION_DEFAULT_COUNTRY_CODE = os.getenv("NOTIFICATION_DEFAULT_COUNTRY_CODE", "243")
+NOTIFICATION_DEFAULT_LANGUAGE = os.getenv("NOTIFICATION_DEFAULT_LANGUAGE", "fr")
+RECIPIENT_DIRECTORY_TTL_S = float(os.getenv("RECIPIENT_DIRECTORY_TTL_S", 900.0))
+# Registre des livraisons: écriture par lots, envoi jugé lent au-delà de NOTIFICATION_SLOW_MS
+NOTIFICATION_LEDGER_BATCH_SIZE = int(os.getenv("NOTIFICATION_LEDGER_BATCH_SIZE", 200))
+NOTIFICATION_LEDGER_FLUSH_S = float(os.getenv("NOTIFICATION_LEDGER_FLUSH_S", 5.0))
+NOTIFICATION_LEDGER_MAX_BUFFER = int(os.getenv("NOTIFICATION_LEDGER_MAX_BUFFER", 20000))
+NOTIFICATION_SLOW_MS = int(os.getenv("NOTIFICATION_SLOW_MS", 2000))
+
 # Arduino
 ARDUINO_PORT = os.getenv("ARDUINO_PORT", "COM3")
 ARDUINO_BAUD_RATE = int(os.getenv("ARDUINO_BAUD_RATE", 9600))
@@ -54,6 +142,16 @@ ESP32_PORT = int(os.getenv("ESP32_PORT", 5050))
 ESP32_SOCKET_TIMEOUT = float(os.getenv("ESP32_SOCKET_TIMEOUT", 1.5))
 ESP32_STATUS_REFRESH_MS = int(os.getenv("ESP32_STATUS_REFRESH_MS", 5000))
 
+# Passerelle d'accès multi-portes (format: "salle_a=192.168.1.10:5050,salle_b=192.168.1.11:5050")
+ACCESS_GATEWAY_DOORS = os.getenv("ACCESS_GATEWAY_DOORS", "")
+ACCESS_GATEWAY_WORKERS = int(os.getenv("ACCESS_GATEWAY_WORKERS", 4))
+ACCESS_GATEWAY_DOOR_QUEUE_SIZE = int(os.getenv("ACCESS_GATEWAY_DOOR_QUEUE_SIZE", 8))
+ACCESS_GATEWAY_RECONNECT_MAX_S = float(os.getenv("ACCESS_GATEWAY_RECONNECT_MAX_S", 30.0))
+ACCESS_GATEWAY_PENDING_TTL_S = float(os.getenv("ACCESS_GATEWAY_PENDING_TTL_S", 60.0))
+# PING périodique; connexion abandonnée après HEARTBEAT_S x MISSES sans aucune trame (lien à demi ouvert)
+ACCESS_GATEWAY_HEARTBEAT_S = float(os.getenv("ACCESS_GATEWAY_HEARTBEAT_S", 10.0))
+ACCESS_GATEWAY_HEARTBEAT_MISSES = int(os.getenv("ACCESS_GATEWAY_HEARTBEAT_MISSES", 3))
+
 # Application
 APP_NAME = "U.O.R - Plateforme d'Accès aux Examens"
 APP_VERSION = "1.0.0"
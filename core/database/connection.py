@@ -2,6 +2,7 @@
 import mysql.connector
 from mysql.connector import Error, pooling
 import logging
+from contextlib import contextmanager
 from config.settings import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT
 
 logger = logging.getLogger(__name__)
@@ -119,6 +120,52 @@ class DatabaseConnection:
             if connection and connection.is_connected():
                 connection.close()
     
+    def execute_many(self, query: str, params_list: list) -> int:
+        """
+        Exécute une requête pour un lot de paramètres dans une seule transaction
+
+        Args:
+            query: Requête SQL
+            params_list: Liste de tuples de paramètres
+
+        Returns:
+            Nombre de lignes affectées
+        """
+        if not params_list:
+            return 0
+        with self.transaction() as cursor:
+            cursor.executemany(query, params_list)
+            return cursor.rowcount
+
+    @contextmanager
+    def transaction(self, dictionary: bool = True):
+        """
+        Ouvre une transaction: commit à la sortie, rollback sur exception
+
+        Usage:
+            with db.transaction() as cursor:
+                cursor.execute(...)
+                cursor.execute(...)
+        """
+        connection = self.get_connection()
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=dictionary)
+            yield cursor
+            connection.commit()
+        except Exception as e:
+            try:
+                connection.rollback()
+            except Error:
+                pass
+            logger.error(f"Transaction rolled back: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection and connection.is_connected():
+                connection.close()
+
     def close_all_connections(self):
         """Ferme tous les pools de connexions"""
         if self._connection_pool:
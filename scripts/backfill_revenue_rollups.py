@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Reconstruit les séries d'encaissement (revenue_rollup) depuis payment_history
+
+Usage:
+    python scripts/backfill_revenue_rollups.py                    # tout l'historique
+    python scripts/backfill_revenue_rollups.py --since 2025-09-01 # à partir de ce mois
+    python scripts/backfill_revenue_rollups.py --plot revenue.png # + graphique des 12 derniers mois
+"""
+import sys
+import os
+import argparse
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.finance.revenue_rollup_service import RevenueRollupService, PERIOD_MONTH
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--since", type=date.fromisoformat, help="date ISO (alignée au début du mois)")
+    parser.add_argument("--plot", help="fichier PNG du graphique mensuel")
+    args = parser.parse_args()
+
+    service = RevenueRollupService()
+    rows = service.backfill(args.since)
+    logger.info(f"Backfill done: {rows} rollup row(s)")
+
+    series = service.get_series(PERIOD_MONTH)
+    for point in series:
+        logger.info(f"{point['period_start']:%Y-%m}: {point['payment_count']} payment(s), ${point['amount']:,.2f}")
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(10, 4))
+        ax.bar([f"{point['period_start']:%Y-%m}" for point in series], [point["amount"] for point in series])
+        ax.set_title("Encaissements mensuels (USD)")
+        ax.tick_params(axis="x", rotation=45)
+        fig.tight_layout()
+        fig.savefig(args.plot)
+        logger.info(f"Chart written to {args.plot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark de concurrence pour FinanceService.record_payment
+
+Lance de nombreux paiements simultanés sur un même étudiant et vérifie qu'aucune
+mise à jour n'est perdue: solde final = solde initial + somme des paiements acceptés,
+et une ligne payment_history par paiement accepté.
+
+⚠️ À exécuter sur une base de TEST: le solde de l'étudiant est restauré à la fin,
+mais les lignes payment_history créées sont supprimées par leur date.
+
+Usage:
+    python scripts/benchmark_concurrent_payments.py --student-id 12 --threads 32 --payments 20
+"""
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.database.connection import DatabaseConnection
+from app.services.finance.finance_service import FinanceService
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--student-id", type=int, required=True)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--payments", type=int, default=20, help="paiements par thread")
+    parser.add_argument("--amount", type=Decimal, default=Decimal("0.01"))
+    args = parser.parse_args()
+
+    db = DatabaseConnection()
+    finance_service = FinanceService()
+    # Pas de notifications ni d'émission de code pendant le benchmark
+    finance_service.notification_service.send_payment_notification = lambda **_kwargs: True
+    finance_service._issue_access_code_if_needed = lambda *_args: None
+
+    before = finance_service.get_student_finance(args.student_id)
+    if not before:
+        print(f"No finance profile for student {args.student_id}")
+        return 1
+    initial = Decimal(str(before["amount_paid"]))
+    started_at = datetime.now().replace(microsecond=0)
+
+    def worker(_index: int) -> int:
+        accepted = 0
+        for _ in range(args.payments):
+            if finance_service.record_payment(args.student_id, args.amount):
+                accepted += 1
+        return accepted
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        accepted = sum(pool.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - t0
+
+    after = finance_service.get_student_finance(args.student_id)
+    final = Decimal(str(after["amount_paid"]))
+    history = db.execute_query(
+        "SELECT COUNT(*) AS cnt FROM payment_history WHERE student_id = %s AND created_at >= %s",
+        (args.student_id, started_at)
+    )[0]["cnt"]
+
+    expected = initial + args.amount * accepted
+    attempts = args.threads * args.payments
+    print(f"Attempts:  {attempts} ({args.threads} threads x {args.payments})")
+    print(f"Accepted:  {accepted} (rejected as overpayment: {attempts - accepted})")
+    print(f"Balance:   {initial} -> {final} (expected {expected})")
+    print(f"History:   {history} new row(s)")
+    print(f"Throughput: {attempts / elapsed:,.0f} payments/s ({elapsed:.2f}s)")
+
+    ok = final == expected and history == accepted
+    print("RESULT:", "OK - no lost update" if ok else "FAIL - lost or phantom updates")
+
+    # Restauration de l'état initial
+    db.execute_update(
+        "UPDATE finance_profile SET amount_paid = %s, is_eligible = %s WHERE student_id = %s",
+        (str(initial), before.get("is_eligible") or 0, args.student_id)
+    )
+    db.execute_update(
+        "DELETE FROM payment_history WHERE student_id = %s AND created_at >= %s",
+        (args.student_id, started_at)
+    )
+    # Agrégats et séries d'encaissement recalculés après la restauration
+    finance_service.aggregates.rebuild()
+    finance_service.rollups.backfill(started_at.date())
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
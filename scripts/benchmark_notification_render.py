@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Coût de rendu par message pour une campagne de N destinataires
+
+Mesure, sans base ni fournisseur:
+- rendu d'un changement de seuil avec `bind()` (champs communs préparés une fois)
+  et sans (`threshold_change()` par destinataire);
+- rendu d'un reçu de paiement;
+- assemblage MIME d'un email avec la partie logo en cache, comparé à une
+  relecture + réencodage du fichier à chaque message (ancien comportement).
+
+Usage:
+    python scripts/benchmark_notification_render.py --count 10000 --logo assets/uor_logo.jpg
+"""
+import argparse
+import os
+import sys
+import time
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.integration.notification_templates import NotificationTemplates
+
+COMMON = {"old_threshold": 300.0, "new_threshold": 450.0, "old_final_fee": 900.0, "new_final_fee": 1200.0}
+
+
+def _recipients(count: int):
+    for i in range(count):
+        paid = (i * 37) % 1200
+        yield {"student_name": f"Étudiant {i:05d} Kasereka", "amount_paid": float(paid),
+               "remaining_amount": float(1200 - paid), "threshold_reached": paid >= 450}
+
+
+def _timed(label: str, count: int, func) -> float:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1000:9.1f} ms total  {elapsed / count * 1e6:8.2f} µs/msg")
+    return elapsed
+
+
+def _mime(rendered, logo_part) -> bytes:
+    msg = MIMEMultipart("related")
+    alt = MIMEMultipart("alternative")
+    alt.attach(MIMEText(rendered.body, "plain"))
+    alt.attach(MIMEText(rendered.html_body, "html"))
+    msg.attach(alt)
+    if logo_part is not None:
+        msg.attach(logo_part)
+    msg["To"] = "student@uor.example"
+    msg["Subject"] = rendered.subject
+    return msg.as_bytes()
+
+
+def _uncached_logo(path: str) -> MIMEImage:
+    with open(path, "rb") as f:
+        part = MIMEImage(f.read())
+    part.add_header("Content-ID", "<uor_logo>")
+    part.add_header("Content-Disposition", "inline", filename=os.path.basename(path))
+    return part
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--mime-count", type=int, default=1000, help="emails assemblés (sérialisation MIME)")
+    parser.add_argument("--logo", default="", help="PNG du logo (défaut: EMAIL_LOGO_PATH)")
+    args = parser.parse_args()
+
+    templates = NotificationTemplates(logo_path=args.logo or None)
+    recipients = list(_recipients(args.count))
+    print(f"{args.count} recipients, logo: {templates.logo_path if templates.has_logo else 'none'}\n")
+
+    render = templates.bind("threshold_change", **COMMON)
+    _timed("threshold_change (bound)", args.count, lambda: [render(**r) for r in recipients])
+    _timed("threshold_change (per message)", args.count,
+           lambda: [templates.threshold_change(**COMMON, **r) for r in recipients])
+    _timed("payment receipt", args.count, lambda: [
+        templates.payment(student_name=r["student_name"], amount_paid=150.0,
+                          remaining_amount=r["remaining_amount"], final_fee=1200.0,
+                          threshold_amount=450.0, threshold_reached=r["threshold_reached"],
+                          promotion_info="Sciences / Informatique / L2")
+        for r in recipients
+    ])
+
+    rendered = [render(**r) for r in recipients[:args.mime_count]]
+    count = len(rendered)
+    if templates.has_logo:
+        cached = templates.logo_part()
+        _timed("MIME email, cached logo part", count, lambda: [_mime(x, cached) for x in rendered])
+        _timed("MIME email, logo re-read", count,
+               lambda: [_mime(x, _uncached_logo(templates.logo_path)) for x in rendered])
+    else:
+        _timed("MIME email (no logo)", count, lambda: [_mime(x, None) for x in rendered])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
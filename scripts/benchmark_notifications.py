@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""Banc de charge des notifications contre des fournisseurs simulés
+
+Démarre un sink SMTP et un serveur Ultramsg locaux (scripts/notification_standins.py),
+branche NotificationService dessus (pool SMTP et client WhatsApp dédiés) puis
+pilote un chemin d'envoi de masse:
+
+- broadcast: `NotificationService.broadcast("threshold_change", ...)` sur N étudiants;
+- receipts: N `send_payment_notification` (rafale de reçus de caisse);
+- mixed: la campagne, et pendant qu'elle s'écoule --access-codes codes d'accès
+  (un toutes les --access-code-interval-ms): la voie transactionnelle doit
+  garder une attente en file faible malgré la campagne.
+
+Rapport par canal: messages livrés / échoués, débit (msg/s) et latences
+p50/p95/p99/max de l'appel fournisseur et de bout en bout (mise en file ->
+livraison), puis l'attente de bout en bout par voie de priorité. Aucun
+identifiant Gmail/Ultramsg n'est nécessaire.
+
+Deux files possibles:
+- --outbox memory (défaut): file en mémoire avec les voies et la concurrence
+  des workers de l'outbox (workers réservés à la voie transactionnelle, part
+  des requêtes WhatsApp en vol et du débit laissée aux campagnes); mesure la
+  livraison seule, sans MySQL;
+- --outbox mysql: outbox persistante réelle et ses workers (base de TEST:
+  les messages de la campagne restent dans notification_outbox).
+
+Usage:
+    python scripts/benchmark_notifications.py --recipients 2000 --smtp-handshake-ms 150 \\
+        --wa-latency-ms 120 --wa-error-rate 0.02 --wa-rate 50
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import settings
+from app.services.integration.notification_ledger import delivery_ledger
+from app.services.integration.notification_outbox import (
+    CHANNEL_EMAIL, CHANNEL_WHATSAPP, CHANNELS, LANES, PRIORITY_BULK, PRIORITY_TRANSACTIONAL,
+    NotificationOutbox, default_priority,
+)
+from app.services.integration.notification_service import NotificationService
+from app.services.integration.smtp_pool import SmtpSessionPool
+from app.services.integration.whatsapp_client import UltramsgClient
+from notification_standins import SmtpSink, UltramsgStandIn
+
+
+class DeliveryRecorder:
+    """Chronomètre chaque appel `deliver()` du service (latence fournisseur, échecs)"""
+
+    def __init__(self, service: NotificationService):
+        self._deliver = service.deliver
+        self._lock = threading.Lock()
+        self.calls = {channel: [] for channel in CHANNELS}   # (début, fin, ok)
+        service.deliver = self.deliver
+
+    def deliver(self, channel, *args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            self._deliver(channel, *args, **kwargs)
+            ok = True
+        finally:
+            with self._lock:
+                self.calls[channel].append((started, time.perf_counter(), ok))
+
+
+class MemoryOutbox:
+    """File en mémoire au contrat de NotificationOutbox (enqueue, enqueue_many, progression)
+
+    Voies et concurrence identiques à l'outbox: une file par canal et par voie,
+    des workers réservés à la voie transactionnelle, des workers de masse qui
+    la servent en premier; WhatsApp: requêtes en vol par voie et part du débit
+    des campagnes reprises de NotificationOutbox.
+    """
+
+    def __init__(self, deliverer: NotificationService):
+        self.deliverer = deliverer
+        self.queued = 0
+        self.done = 0
+        self.end_to_end = {channel: [] for channel in CHANNELS}
+        self.lane_waits = {lane: [] for lane in LANES}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queues = {(channel, lane): queue.Queue() for channel in CHANNELS for lane in LANES}
+        self._lanes = NotificationOutbox()   # limites par voie et seau des campagnes (sans base)
+        workers = {
+            CHANNEL_EMAIL: {PRIORITY_TRANSACTIONAL: settings.NOTIFICATION_PRIORITY_EMAIL_WORKERS,
+                            PRIORITY_BULK: settings.NOTIFICATION_EMAIL_WORKERS},
+            CHANNEL_WHATSAPP: {lane: self._lanes._in_flight_limit(CHANNEL_WHATSAPP, lane) for lane in LANES},
+        }
+        for channel, counts in workers.items():
+            for lane, count in counts.items():
+                for index in range(max(1, count)):
+                    threading.Thread(target=self._worker, args=(channel, lane), daemon=True,
+                                     name=f"bench-{channel}-{LANES[lane]}-{index}").start()
+
+    def _put(self, messages) -> int:
+        now = time.perf_counter()
+        with self._lock:
+            self.queued += len(messages)
+        for message in messages:
+            lane = default_priority(message.kind) if message.priority is None else message.priority
+            self._queues[(message.channel, lane)].put((now, message))
+        return len(messages)
+
+    def enqueue(self, messages, idempotency_key=None, cursor=None) -> int:
+        return self._put(list(messages))
+
+    def enqueue_many(self, items, cursor=None) -> int:
+        return sum(self._put(list(messages)) for _key, messages in items)
+
+    def wake(self, channel=None) -> None:
+        pass
+
+    def get_progress(self, _key_prefix: str) -> dict:
+        with self._lock:
+            return {"sent": self.done, "pending": self.queued - self.done}
+
+    def _next(self, channel: str, lane: int):
+        urgent = self._queues[(channel, PRIORITY_TRANSACTIONAL)]
+        if lane == PRIORITY_TRANSACTIONAL:
+            return PRIORITY_TRANSACTIONAL, urgent.get()
+        while True:
+            try:
+                return PRIORITY_TRANSACTIONAL, urgent.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                return PRIORITY_BULK, self._queues[(channel, PRIORITY_BULK)].get(timeout=0.02)
+            except queue.Empty:
+                continue
+
+    def _worker(self, channel: str, lane: int) -> None:
+        while True:
+            priority, (queued_at, message) = self._next(channel, lane)
+            self._lanes._throttle_bulk({"channel": channel, "priority": priority})
+            with self._lock:
+                self.lane_waits[priority].append(time.perf_counter() - queued_at)
+            try:
+                self.deliverer.deliver(message.channel, message.recipient, message.subject, message.body,
+                                       html_body=message.html_body, attach_logo=message.attach_logo)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self.end_to_end[channel].append(time.perf_counter() - queued_at)
+                    self.done += 1
+                    self._idle.notify_all()
+
+    def drain(self, timeout_s: float) -> bool:
+        deadline = time.monotonic() + timeout_s
+        with self._lock:
+            while self.done < self.queued:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency_line(label: str, values: list) -> str:
+    ms = [v * 1000 for v in values]
+    return (f"    {label:<12} p50 {_percentile(ms, 50):8.1f}  p95 {_percentile(ms, 95):8.1f}  "
+            f"p99 {_percentile(ms, 99):8.1f}  max {max(ms) if ms else 0:8.1f} ms")
+
+
+def _recipients(count: int):
+    for i in range(count):
+        paid = float((i * 37) % 1200)
+        yield {"key": i, "email": f"student{i}@uor.example", "phone": f"+24381{i:07d}",
+               "student_name": f"Étudiant {i:05d}", "amount_paid": paid,
+               "remaining_amount": 1200.0 - paid, "threshold_reached": paid >= 450}
+
+
+def _access_codes(service: NotificationService, count: int, interval_s: float) -> None:
+    for i in range(count):
+        service.send_access_code_notification(
+            student_email=f"door{i}@uor.example", student_phone=f"+24389{i:07d}",
+            student_name=f"Étudiant {i:05d}", access_code=f"{i:06d}", code_type="exam",
+            expires_at="", idempotency_key=f"bench-access:{time.time_ns()}:{i}",
+        )
+        time.sleep(interval_s)
+
+
+def _report(recorder: DeliveryRecorder, outbox, elapsed: float) -> None:
+    total_ok = 0
+    for channel in CHANNELS:
+        calls = recorder.calls[channel]
+        if not calls:
+            continue
+        ok = [end - start for start, end, success in calls if success]
+        failed = len(calls) - len(ok)
+        window = max(end for _, end, _ in calls) - min(start for start, _, _ in calls)
+        total_ok += len(ok)
+        print(f"\n  {channel}: {len(ok)} delivered, {failed} failed, {len(ok) / window if window else 0:8.1f} msg/s")
+        print(_latency_line("provider", [end - start for start, end, _ in calls]))
+        if isinstance(outbox, MemoryOutbox):
+            print(_latency_line("end-to-end", outbox.end_to_end[channel]))
+    print(f"\n  overall: {total_ok} delivered in {elapsed:.2f}s -> {total_ok / elapsed if elapsed else 0:.1f} msg/s")
+    print("\n  queue wait per lane (mise en file -> prise en charge):")
+    if isinstance(outbox, MemoryOutbox):
+        for lane, name in LANES.items():
+            if outbox.lane_waits[lane]:
+                print(_latency_line(name, outbox.lane_waits[lane]) + f"  ({len(outbox.lane_waits[lane])} msg)")
+    else:
+        delivery_ledger.flush()
+        for name, summary in delivery_ledger.get_channel_summary(hours=1, by="lane").items():
+            waits = delivery_ledger.get_latency_percentiles(lane=name, minutes=60, metric="queue_ms")
+            print(f"    {name:<12} p50 {waits.get('p50', 0):8.1f}  p95 {waits.get('p95', 0):8.1f}  "
+                  f"p99 {waits.get('p99', 0):8.1f}  max {summary['queue_ms_max']:8.1f} ms  "
+                  f"({summary['attempts']} attempt(s))")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("broadcast", "receipts", "mixed"), default="broadcast")
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--outbox", choices=("memory", "mysql"), default="memory")
+    parser.add_argument("--smtp-handshake-ms", type=float, default=150.0)
+    parser.add_argument("--smtp-message-ms", type=float, default=5.0)
+    parser.add_argument("--smtp-failure-rate", type=float, default=0.0)
+    parser.add_argument("--wa-latency-ms", type=float, default=120.0)
+    parser.add_argument("--wa-jitter-ms", type=float, default=40.0)
+    parser.add_argument("--wa-error-rate", type=float, default=0.0)
+    parser.add_argument("--wa-reject-rate", type=float, default=0.0)
+    parser.add_argument("--wa-server-limit", type=float, default=0.0, help="429 au-delà de N req/s (0: aucun)")
+    parser.add_argument("--wa-rate", type=float, default=0.0, help="seau à jetons client (msg/s, 0: aucun)")
+    parser.add_argument("--access-codes", type=int, default=50, help="mixed: codes d'accès pendant la campagne")
+    parser.add_argument("--access-code-interval-ms", type=float, default=50.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    # Pas de fenêtre de coalescence: chaque destinataire est unique dans le banc
+    settings.NOTIFICATION_COALESCE_WINDOW_S = 0
+    # Débit WhatsApp du banc: la part des campagnes (NOTIFICATION_BULK_RATE_SHARE) s'y rapporte
+    settings.WHATSAPP_RATE_PER_S = args.wa_rate
+
+    with SmtpSink(handshake_delay_s=args.smtp_handshake_ms / 1000, message_delay_s=args.smtp_message_ms / 1000,
+                  failure_rate=args.smtp_failure_rate, seed=1) as sink, \
+            UltramsgStandIn(latency_ms=args.wa_latency_ms, jitter_ms=args.wa_jitter_ms,
+                            error_rate=args.wa_error_rate, reject_rate=args.wa_reject_rate,
+                            rate_limit_per_s=args.wa_server_limit, seed=1) as ultramsg:
+        service = NotificationService()
+        service.email_address, service.email_password = "bench@uor.example", "bench"
+        service.ultramsg_instance, service.ultramsg_token = ultramsg.instance_id, ultramsg.token
+        host, port = sink.address
+        service.smtp_pool = SmtpSessionPool(host=host, port=port, username="bench", password="bench",
+                                            starttls=False,
+                                            size=settings.NOTIFICATION_EMAIL_WORKERS
+                                            + settings.NOTIFICATION_PRIORITY_EMAIL_WORKERS,
+                                            rate_per_s=0)
+        service.whatsapp_client = UltramsgClient(ultramsg.instance_id, ultramsg.token, base_url=ultramsg.base_url,
+                                                 rate_per_s=args.wa_rate)
+        recorder = DeliveryRecorder(service)
+
+        if args.outbox == "memory":
+            outbox = MemoryOutbox(service)
+        else:
+            outbox = service.outbox
+            outbox._deliverer = service
+            outbox.start()
+        service.outbox = outbox
+
+        print(f"{args.scenario}: {args.recipients} recipient(s), outbox={args.outbox}, "
+              f"email workers={settings.NOTIFICATION_EMAIL_WORKERS}, "
+              f"WhatsApp in flight={settings.WHATSAPP_MAX_IN_FLIGHT}")
+        started = time.perf_counter()
+        expected = 2 * args.recipients
+        door = None
+        if args.scenario == "mixed":
+            expected += 2 * args.access_codes
+            door = threading.Thread(target=_access_codes, daemon=True,
+                                    args=(service, args.access_codes, args.access_code_interval_ms / 1000))
+        if args.scenario in ("broadcast", "mixed"):
+            if door is not None:
+                # Les codes arrivent pendant que la campagne s'écoule
+                threading.Timer(0.2, door.start).start()
+            result = service.broadcast(
+                "threshold_change", _recipients(args.recipients),
+                common={"old_threshold": 300.0, "new_threshold": 450.0, "new_final_fee": 1200.0},
+                wait_timeout_s=args.timeout if args.outbox == "mysql" and door is None else None,
+            )
+            print(f"  queued {result.messages_queued} message(s) in {result.elapsed_s:.2f}s")
+            if door is not None:
+                while not door.is_alive() and not door.ident:
+                    time.sleep(0.01)
+                door.join()
+        else:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda r: service.send_payment_notification(
+                    student_email=r["email"], student_phone=r["phone"], student_name=r["student_name"],
+                    amount_paid=r["amount_paid"], remaining_amount=r["remaining_amount"], final_fee=1200.0,
+                    threshold_amount=450.0, threshold_reached=r["threshold_reached"],
+                    idempotency_key=f"bench-receipt:{time.time_ns()}:{r['key']}",
+                ), _recipients(args.recipients)))
+        if isinstance(outbox, MemoryOutbox):
+            drained = outbox.drain(args.timeout)
+        else:
+            deadline = time.monotonic() + args.timeout
+            while sum(len(c) for c in recorder.calls.values()) < expected and time.monotonic() < deadline:
+                time.sleep(0.2)
+            drained = sum(len(c) for c in recorder.calls.values()) >= expected
+        elapsed = time.perf_counter() - started
+
+        _report(recorder, outbox, elapsed)
+        print(f"\n  stand-ins: SMTP {sink.messages} accepted / {sink.failures} refused over {sink.sessions} session(s); "
+              f"Ultramsg {ultramsg.delivered} sent, {ultramsg.errors} 5xx, {ultramsg.rejected} sent=false, "
+              f"{ultramsg.rate_limited} 429")
+        service.smtp_pool.close_all()
+        service.whatsapp_client.close()
+        return 0 if drained else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Débit SMTP: une connexion par message vs sessions persistantes du pool
+
+Les deux stratégies envoient le même nombre d'emails au sink SMTP local
+(scripts/notification_standins.py), avec un délai de poignée de main qui
+simule STARTTLS + AUTH chez le fournisseur. Aucune base ni compte réel requis.
+
+Usage:
+    python scripts/benchmark_smtp_pool.py --messages 500 --workers 2 --handshake-ms 150
+"""
+import argparse
+import os
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.integration.smtp_pool import SmtpSessionPool
+from notification_standins import SmtpSink
+
+
+def _message(index: int) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg.attach(MIMEText(f"Paiement reçu - reçu n°{index}\nMontant: 150.00 USD", "plain"))
+    msg["From"] = "finance@uor.example"
+    msg["To"] = f"student{index}@uor.example"
+    msg["Subject"] = f"Reçu de paiement #{index}"
+    return msg
+
+
+def _send_per_connection(host: str, port: int, msg) -> None:
+    smtp = smtplib.SMTP(host, port, timeout=10)
+    smtp.ehlo()
+    smtp.login("bench", "bench")
+    smtp.send_message(msg)
+    smtp.quit()
+
+
+def _run(label: str, send, count: int, workers: int, sink: SmtpSink) -> float:
+    sessions_before, messages_before = sink.sessions, sink.messages
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(send, (_message(i) for i in range(count))))
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed
+    print(f"{label:<16} {count} msgs in {elapsed:6.2f}s -> {rate:8.1f} msg/s "
+          f"({sink.sessions - sessions_before} session(s), {sink.messages - messages_before} received)")
+    return rate
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2, help="threads d'envoi (= NOTIFICATION_EMAIL_WORKERS)")
+    parser.add_argument("--handshake-ms", type=float, default=150.0, help="coût TLS + AUTH simulé")
+    parser.add_argument("--message-ms", type=float, default=2.0)
+    parser.add_argument("--max-per-session", type=int, default=100)
+    args = parser.parse_args()
+
+    with SmtpSink(handshake_delay_s=args.handshake_ms / 1000, message_delay_s=args.message_ms / 1000,
+                  max_messages_per_session=args.max_per_session) as sink:
+        host, port = sink.address
+        baseline = _run("per-connection", lambda msg: _send_per_connection(host, port, msg),
+                        args.messages, args.workers, sink)
+
+        pool = SmtpSessionPool(host=host, port=port, username="bench", password="bench", starttls=False,
+                               size=args.workers, max_messages=args.max_per_session, idle_timeout_s=60)
+        pooled = _run("pooled", pool.send, args.messages, args.workers, sink)
+        pool.close_all()
+        print(f"\nSpeed-up: x{pooled / baseline:.1f}  pool metrics: {pool.get_metrics()}")
+        return 0 if sink.messages == 2 * args.messages else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Exporte l'instantané hors-ligne (ou un delta) pour les terminaux de porte
+
+Usage:
+    python scripts/export_offline_snapshot.py                 # instantané complet de l'année active
+    python scripts/export_offline_snapshot.py --delta         # delta depuis le dernier instantané
+"""
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import OFFLINE_SNAPSHOT_DIR
+from app.services.finance.academic_year_service import AcademicYearService
+from app.services.access.offline_snapshot import OfflineSnapshotExporter
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--delta", action="store_true", help="exporter seulement les changements")
+    parser.add_argument("--year", type=int, help="academic_year_id (défaut: année active)")
+    parser.add_argument("--exam-period", type=int, default=0, help="exam_period id")
+    args = parser.parse_args()
+
+    year_id = args.year
+    if not year_id:
+        active_year = AcademicYearService().get_active_year()
+        if not active_year:
+            logger.error("No active academic year found. Create one first.")
+            return 1
+        year_id = active_year["academic_year_id"]
+
+    snapshot_path = os.path.join(OFFLINE_SNAPSHOT_DIR, f"snapshot_{year_id}.bin")
+    try:
+        exporter = OfflineSnapshotExporter()
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    if args.delta:
+        if not os.path.exists(snapshot_path):
+            logger.error(f"No base snapshot at {snapshot_path}")
+            return 1
+        result = exporter.export_delta(os.path.join(OFFLINE_SNAPSHOT_DIR, f"delta_{year_id}.bin"), snapshot_path)
+        logger.info(f"Delta: {result['changes']} change(s) -> {result['path']}")
+    else:
+        result = exporter.export_snapshot(snapshot_path, year_id, args.exam_period)
+        logger.info(f"Snapshot: {result['students']} students ({result['eligible']} eligible) -> {result['path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
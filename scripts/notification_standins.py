@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Serveurs de substitution en mémoire pour tester les notifications sans fournisseur
+
+SmtpSink: serveur SMTP minimal (EHLO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT)
+qui compte les messages reçus. Les délais simulent le coût réel d'un
+fournisseur: `handshake_delay_s` à l'accueil et à l'authentification
+(poignée de main TLS + AUTH), `message_delay_s` par message accepté.
+`max_messages_per_session` reproduit la limite par connexion (réponse 421),
+`failure_rate` une part de refus temporaires (451) en fin de DATA.
+
+UltramsgStandIn: serveur HTTP qui reproduit le contrat de
+POST /{instance}/messages/chat (formulaire token/to/body, réponse JSON
+{"sent": "true", "message": "ok", "id": n}), avec latence (moyenne + gigue),
+part d'échecs (500 ou sent=false) et limite de débit (429 + Retry-After).
+
+Usage:
+    python scripts/notification_standins.py --port 2525 --http-port 8089
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        sink: "SmtpSink" = self.server.sink
+        with sink._lock:
+            sink.sessions += 1
+        time.sleep(sink.handshake_delay_s)
+        self._reply("220 smtp-sink ESMTP ready")
+        accepted = 0
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250-SIZE 26214400\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif verb == "AUTH":
+                time.sleep(sink.handshake_delay_s)
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                if accepted >= sink.max_messages_per_session:
+                    self._reply("421 4.7.0 Too many messages for this session")
+                    return
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line == b".\r\n":
+                        break
+                    size += len(line)
+                time.sleep(sink.message_delay_s)
+                if sink._fail():
+                    self._reply("451 4.3.0 Temporary local problem, try again later")
+                    continue
+                accepted += 1
+                with sink._lock:
+                    sink.messages += 1
+                    sink.bytes_received += size
+                self._reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SmtpSink:
+    """Serveur SMTP local (thread de fond) qui accepte et compte les messages"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, handshake_delay_s: float = 0.0,
+                 message_delay_s: float = 0.0, max_messages_per_session: int = 10 ** 9,
+                 failure_rate: float = 0.0, seed: int = None):
+        self.handshake_delay_s = handshake_delay_s
+        self.message_delay_s = message_delay_s
+        self.max_messages_per_session = max_messages_per_session
+        self.failure_rate = failure_rate
+        self.failures = 0
+        self._random = random.Random(seed)
+        self.sessions = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _SmtpHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def _fail(self) -> bool:
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                self.failures += 1
+                return True
+        return False
+
+    def start(self) -> "SmtpSink":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="smtp-sink")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "SmtpSink":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+
+class _UltramsgHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, comme l'API réelle
+
+    def log_message(self, *_args) -> None:
+        pass
+
+    def _json(self, status: int, payload: dict, headers: dict = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        standin: "UltramsgStandIn" = self.server.standin
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 3 or parts[1:] != ["messages", "chat"]:
+            self._json(404, {"error": "Not found"})
+            return
+        if form.get("token") != standin.token:
+            self._json(401, {"error": "Wrong token. Please provide token as a GET parameter."})
+            return
+        if not form.get("to") or "body" not in form:
+            self._json(400, {"error": [{"to": "is required"}]})
+            return
+
+        outcome = standin._admit()
+        if outcome == "rate_limited":
+            self._json(429, {"error": "Too many requests"}, {"Retry-After": f"{standin.retry_after_s:g}"})
+            return
+        time.sleep(standin._latency())
+        if outcome == "error":
+            self._json(500, {"error": "Internal server error"})
+        elif outcome == "rejected":
+            self._json(200, {"sent": "false", "message": "phone not registered on WhatsApp"})
+        else:
+            self._json(200, {"sent": "true", "message": "ok", "id": standin._record(form)})
+
+
+class UltramsgStandIn:
+    """Serveur HTTP local au contrat de l'API Ultramsg /messages/chat"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, instance_id: str = "instance0",
+                 token: str = "standin-token", latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, reject_rate: float = 0.0, rate_limit_per_s: float = 0.0,
+                 retry_after_s: float = 1.0, seed: int = None):
+        self.instance_id = instance_id
+        self.token = token
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.rate_limit_per_s = rate_limit_per_s
+        self.retry_after_s = retry_after_s
+        self.requests = 0
+        self.delivered = 0
+        self.errors = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _UltramsgHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _admit(self) -> str:
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_per_s:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start, self._window_count = now, 0
+                if self._window_count >= self.rate_limit_per_s:
+                    self.rate_limited += 1
+                    return "rate_limited"
+                self._window_count += 1
+            draw = self._random.random()
+            if draw < self.error_rate:
+                self.errors += 1
+                return "error"
+            if draw < self.error_rate + self.reject_rate:
+                self.rejected += 1
+                return "rejected"
+            return "ok"
+
+    def _latency(self) -> float:
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _record(self, _form: dict) -> int:
+        with self._lock:
+            self.delivered += 1
+            return self.delivered
+
+    def start(self) -> "UltramsgStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="ultramsg-standin")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "UltramsgStandIn":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    parser.add_argument("--message-ms", type=float, default=0.0)
+    parser.add_argument("--http-port", type=int, default=8089)
+    parser.add_argument("--http-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    sink = SmtpSink(port=args.port, handshake_delay_s=args.handshake_ms / 1000,
+                    message_delay_s=args.message_ms / 1000)
+    ultramsg = UltramsgStandIn(port=args.http_port, latency_ms=args.http_latency_ms).start()
+    print(f"SMTP sink listening on {sink.address[0]}:{sink.address[1]}")
+    print(f"Ultramsg stand-in at {ultramsg.base_url}/{ultramsg.instance_id}/messages/chat "
+          f"(token {ultramsg.token}) - Ctrl+C to stop")
+    try:
+        sink._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{sink.messages} email(s) over {sink.sessions} session(s), "
+              f"{ultramsg.delivered} WhatsApp message(s)")
+        ultramsg.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Recalcule entièrement la table finance_aggregate (réparation)
+
+Les agrégats sont maintenus de façon incrémentale par les paiements, les
+changements de seuil et la gestion des étudiants. À lancer après une écriture
+manuelle en base ou pour vérifier une dérive (--check).
+
+Usage:
+    python scripts/rebuild_finance_aggregates.py
+    python scripts/rebuild_finance_aggregates.py --check
+"""
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.finance.finance_aggregate_service import FinanceAggregateService, AGGREGATE_FIELDS
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--check", action="store_true",
+                        help="comparer la ligne globale avant/après reconstruction")
+    args = parser.parse_args()
+
+    service = FinanceAggregateService()
+    before = service.get_overall() if args.check else None
+    rows = service.rebuild()
+    after = service.get_aggregate()
+    if not after:
+        logger.error("Rebuild failed, see errors above")
+        return 1
+
+    logger.info(f"Rebuilt {rows} aggregate row(s)")
+    if before:
+        drift = {
+            field: (before[field], after[field])
+            for field in AGGREGATE_FIELDS
+            if before[field] != after[field]
+        }
+        if drift:
+            for field, (old, new) in drift.items():
+                logger.warning(f"Drift on {field}: {old} -> {new}")
+        else:
+            logger.info("No drift detected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
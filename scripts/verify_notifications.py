@@ -20,7 +20,7 @@ def verify():
         'send_welcome_notification',  # NOUVELLE!
         '_send_email',
         '_send_whatsapp',
-        '_build_payment_email_html',
+        'broadcast',
         'get_channel_status'
     ]
     
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Vérifie que l'instantané hors-ligne décide comme le chemin en ligne
+
+Profils types (code partiel, code complet, code expiré, seuil non atteint)
+évalués à plusieurs instants autour de deux périodes d'examen:
+- en ligne: EligibilityMaterializer.is_eligible (règle de is_access_code_valid);
+- hors-ligne: instantané signé écrit puis relu, OfflineSnapshot.verify.
+Sans connexion MySQL: le calendrier d'examens partagé est chargé avec les
+périodes de test, les profils sont fournis directement.
+
+Usage:
+    python scripts/verify_offline_eligibility.py   # code de sortie 1 si divergence
+"""
+import heapq
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services.access.offline_snapshot import KIND_FULL, OfflineSnapshot, OfflineSnapshotExporter, _exam_periods
+from app.services.finance.eligibility_materializer import EligibilityMaterializer
+from app.services.finance.exam_calendar import _YearCalendar, exam_calendar
+from core.security.password_hasher import PasswordHasher
+
+YEAR_ID = 1
+PASSWORD = "123456"
+AS_OF = datetime(2026, 5, 20, 8, 0)
+PERIODS = [
+    {"exam_period_id": 1, "name": "Session 1", "start": datetime(2026, 6, 1),
+     "end": datetime(2026, 6, 14, 23, 59, 59, 999999)},
+    {"exam_period_id": 2, "name": "Session 2", "start": datetime(2026, 9, 1),
+     "end": datetime(2026, 9, 5, 23, 59, 59, 999999)},
+]
+# student_id, matricule, payé, seuil, frais, type de code, expiration
+PROFILES = [
+    (1, "PARTIAL", 400, 300, 1000, "partial", None),
+    (2, "FULL", 1000, 300, 1000, "full", datetime(2026, 9, 30)),
+    (3, "FULL_EXPIRING", 1000, 300, 1000, "full", datetime(2026, 6, 10)),
+    (4, "BELOW", 100, 300, 1000, "partial", None),
+    (5, "NO_CODE", 500, 300, 1000, None, None),
+    (6, "PARTIAL_EXPIRED", 400, 300, 1000, "partial", datetime(2026, 5, 25)),
+]
+CHECKPOINTS = [
+    datetime(2026, 5, 31, 23, 59, 59),   # veille de la session 1
+    datetime(2026, 6, 1, 0, 0),          # ouverture
+    datetime(2026, 6, 10, 12, 0),        # après l'expiration de FULL_EXPIRING
+    datetime(2026, 6, 14, 23, 59, 59),   # dernier jour
+    datetime(2026, 6, 15, 0, 0, 1),      # lendemain
+    datetime(2026, 9, 3, 9, 0),          # session 2
+    datetime(2026, 10, 1, 9, 0),         # après l'expiration des codes complets
+]
+
+
+def _profile_row(student_id, amount_paid, threshold, code_type, expires_at) -> dict:
+    return {"student_id": student_id, "amount_paid": amount_paid, "threshold_required": threshold,
+            "academic_year_id": YEAR_ID, "access_code_type": code_type, "access_code_expires_at": expires_at}
+
+
+def _online(when: datetime) -> dict:
+    materializer = EligibilityMaterializer(ttl_s=float("inf"))
+    with materializer._lock:
+        for student_id, _number, amount_paid, threshold, _fee, code_type, expires_at in PROFILES:
+            materializer._apply_row(_profile_row(student_id, amount_paid, threshold, code_type, expires_at), AS_OF)
+        # Comme load(): le tas des expirations est ordonné après le chargement
+        heapq.heapify(materializer._expiry_heap)
+        materializer._loaded_at = time.monotonic()
+    return {number: materializer.is_eligible(student_id, when) for student_id, number, *_ in PROFILES}
+
+
+def _write_snapshot(path: str) -> bytes:
+    password_hash = PasswordHasher.hash_password(PASSWORD)
+    rows = [
+        {"student_number": number, "password_hash": password_hash, "is_active": 1,
+         "amount_paid": amount_paid, "threshold_required": threshold, "final_fee": fee,
+         "access_code_type": code_type, "access_code_expires_at": expires_at}
+        for _id, number, amount_paid, threshold, fee, code_type, expires_at in PROFILES
+    ]
+    exporter = OfflineSnapshotExporter(key=os.urandom(32))
+    records = exporter._build_records(rows, 0, AS_OF)
+    exporter._write(path, KIND_FULL, records, 0, AS_OF, YEAR_ID, PERIODS[0]["exam_period_id"],
+                    periods=_exam_periods(YEAR_ID))
+    return exporter.key
+
+
+def verify() -> list:
+    with exam_calendar._lock:
+        exam_calendar._years = {YEAR_ID: _YearCalendar(PERIODS)}
+        exam_calendar._loaded_at = time.monotonic()
+        exam_calendar.ttl_s = float("inf")
+
+    errors = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.bin")
+        key = _write_snapshot(path)
+        snapshot = OfflineSnapshot(path, key=key)
+        try:
+            for when in CHECKPOINTS:
+                online = _online(when)
+                for number, expected in online.items():
+                    offline = snapshot.verify(number, PASSWORD, now=when)["finance_valid"]
+                    if offline != expected:
+                        errors.append(f"{when:%Y-%m-%d %H:%M:%S} {number}: online={expected} offline={offline}")
+        finally:
+            snapshot.close()
+    return errors
+
+
+def main() -> int:
+    errors = verify()
+    for error in errors:
+        print(f"✗ {error}")
+    if errors:
+        print(f"\n{len(errors)} offline/online divergence(s)")
+        return 1
+    print(f"✓ Offline snapshot matches online eligibility "
+          f"({len(PROFILES)} profiles x {len(CHECKPOINTS)} instants)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
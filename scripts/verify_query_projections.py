@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Vérifie que les requêtes du chemin critique ne sélectionnent que les colonnes utiles
+
+Pour chaque méthode listée dans HOT_PATHS, les chaînes SQL du code source
+(analyse AST, sans connexion MySQL) ne doivent contenir:
+- ni `SELECT *` ni `alias.*`;
+- ni colonne BLOB de student, sauf si la méthode l'utilise (liste autorisée).
+Les projections déclarées dans finance_projections ne doivent pas non plus
+contenir de colonne BLOB.
+
+Usage:
+    python scripts/verify_query_projections.py   # code de sortie 1 si violation
+"""
+import ast
+import re
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services.finance import finance_projections
+from app.services.finance.finance_projections import STUDENT_BLOB_COLUMNS
+
+# {fichier: {classe: {méthode: colonnes BLOB autorisées}}}
+HOT_PATHS = {
+    "app/services/finance/finance_service.py": {
+        "FinanceService": {
+            "get_student_finance": (),
+            "get_finance_status": (),
+            "get_student_contact": (),
+            "is_threshold_reached": (),
+            "is_access_code_valid": (),
+            "is_eligible_now": (),
+            "record_payment": (),
+            "_issue_access_code_if_needed": (),
+            "issue_access_codes_bulk": (),
+            "_notify_threshold_change": (),
+            "get_eligible_students": (),
+            "get_non_eligible_students": (),
+        },
+    },
+    "app/services/finance/eligibility_materializer.py": {
+        "EligibilityMaterializer": {
+            "_profile_query": (),
+            "load": (),
+            "refresh_students": (),
+        },
+    },
+    "app/services/finance/payment_import_service.py": {
+        "PaymentImportService": {
+            "_apply_chunk": (),
+        },
+    },
+    "app/services/auth/authentication_service.py": {
+        "AuthenticationService": {
+            "authenticate_student": (),
+        },
+    },
+    "app/services/access/access_controller.py": {
+        "AccessController": {
+            # Comparaison du visage: seule lecture légitime de l'encodage
+            "verify_access": ("face_encoding",),
+        },
+    },
+}
+
+_SQL = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+_STAR = re.compile(r"\bSELECT\s+(DISTINCT\s+)?\*|\b[A-Za-z_]\w*\.\*", re.IGNORECASE)
+
+
+def _sql_strings(node: ast.AST):
+    """Chaînes littérales (et parties fixes des f-strings) qui ressemblent à du SQL"""
+    for child in ast.walk(node):
+        if isinstance(child, ast.JoinedStr):
+            text = "".join(part.value for part in child.values
+                           if isinstance(part, ast.Constant) and isinstance(part.value, str))
+        elif isinstance(child, ast.Constant) and isinstance(child.value, str):
+            text = child.value
+        else:
+            continue
+        if _SQL.search(text):
+            yield child.lineno, text
+
+
+def _check_method(path: str, method: ast.FunctionDef, allowed_blobs) -> list:
+    errors = []
+    for lineno, text in _sql_strings(method):
+        where = f"{path}:{lineno} {method.name}"
+        if _STAR.search(text):
+            errors.append(f"{where}: wildcard projection")
+        for column in STUDENT_BLOB_COLUMNS:
+            if column not in allowed_blobs and re.search(rf"\b{column}\b", text):
+                errors.append(f"{where}: selects BLOB column {column}")
+    return errors
+
+
+def verify() -> list:
+    errors = []
+    for path, classes in HOT_PATHS.items():
+        tree = ast.parse((ROOT / path).read_text(encoding="utf-8"), filename=path)
+        found = {}
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name in classes:
+                for item in node.body:
+                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        found[(node.name, item.name)] = item
+        for class_name, methods in classes.items():
+            for method_name, allowed_blobs in methods.items():
+                method = found.get((class_name, method_name))
+                if method is None:
+                    errors.append(f"{path}: {class_name}.{method_name} not found (update HOT_PATHS)")
+                    continue
+                errors.extend(_check_method(path, method, allowed_blobs))
+
+    for name in dir(finance_projections):
+        if name.endswith("_COLUMNS") and name != "STUDENT_BLOB_COLUMNS":
+            for column in set(getattr(finance_projections, name)) & set(STUDENT_BLOB_COLUMNS):
+                errors.append(f"finance_projections.{name}: contains BLOB column {column}")
+    return errors
+
+
+def main() -> int:
+    errors = verify()
+    for error in errors:
+        print(f"✗ {error}")
+    if errors:
+        print(f"\n{len(errors)} projection violation(s)")
+        return 1
+    print("✓ Hot-path queries select explicit, BLOB-free columns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
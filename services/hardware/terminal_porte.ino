@@ -59,5 +59,13 @@ void gererReponseServeur(String cmd) {
     afficherMessage("ERREUR", "CODE INVALIDE");
     delay(2000);
     afficherMessage("U.O.R. ACCES", "ENTREZ VOTRE CODE");
+  } else if (cmd == "ERR_FACE") {
+    afficherMessage("REFUSE", "VISAGE NON RECONNU");
+    delay(3000);
+    afficherMessage("U.O.R. ACCES", "ENTREZ VOTRE CODE");
+  } else if (cmd == "ERR_BUSY") {
+    afficherMessage("SERVEUR OCCUPE", "REESSAYEZ");
+    delay(1500);
+    afficherMessage("U.O.R. ACCES", "ENTREZ VOTRE CODE");
   }
 }
\ No newline at end of file
@@ -22,6 +22,7 @@ from app.services.auth.authentication_service import AuthenticationService
 from app.services.auth.face_recognition_service import FaceRecognitionService
 from app.services.finance.finance_service import FinanceService
 from app.services.finance.academic_year_service import AcademicYearService
+from app.services.finance.threshold_simulator import ThresholdSimulator
 from app.services.integration.notification_service import NotificationService
 from app.services.integration.esp32_status_service import ESP32StatusService
 from app.services.transfer.transfer_service import TransferService
@@ -281,6 +282,10 @@ class AdminDashboard(ctk.CTkFrame):
         
         self.pack(fill="both", expand=True)
         self._create_ui()
+        # Reprendre un changement de seuil interrompu (crash, fermeture)
+        threading.Thread(target=self.finance_service.threshold_rollout.resume_pending, daemon=True).start()
+        # Livrer les notifications restées en file (redémarrage)
+        threading.Thread(target=self.notification_service.outbox.start, daemon=True).start()
     def _register_wrap(self, label, ratio: float = 0.35, min_width: int = 280, max_width: int = 600):
         """Enregistre un label pour ajuster automatiquement son wraplength"""
         self._responsive_labels.append((label, ratio, min_width, max_width))
@@ -3323,12 +3328,7 @@ class AdminDashboard(ctk.CTkFrame):
                     success = False
                     error_msg = None
                     try:
-                        # Simuler la progression
-                        for i in [10, 30, 60, 80]:
-                            self.after(200, lambda p=i: update_progress(p, f"Traitement... {p}%"))
-                            import time
-                            time.sleep(0.3)
-                        
+                        self.after(0, lambda: update_progress(50, "Traitement..."))
                         success = self.finance_service.record_payment(student_id, amount_usd)
                     except Exception as ex:
                         error_msg = str(ex)
@@ -3525,6 +3525,81 @@ class AdminDashboard(ctk.CTkFrame):
         except Exception:
             return
     
+    def _import_bank_statement(self):
+        """Importe un relevé bancaire: simulation (dry-run), confirmation puis application"""
+        file_path = filedialog.askopenfilename(
+            title="Choisir un relevé bancaire",
+            filetypes=[("Relevés", "*.csv *.xlsx *.xls"), ("CSV", "*.csv"), ("Excel", "*.xlsx *.xls")]
+        )
+        if not file_path:
+            return
+
+        from app.services.finance.payment_import_service import PaymentImportService
+        import_service = PaymentImportService(finance_service=self.finance_service)
+
+        def describe(summary: dict) -> str:
+            return (
+                f"Lignes: {summary['total']}\n"
+                f"Acceptées: {summary['accepted']} ({self._format_usd(summary['amount'])})\n"
+                f"Rejetées: {summary['rejected']}\n"
+                f"Étudiants crédités: {summary['students']}\n"
+                f"Nouvellement éligibles: {summary['newly_eligible']}"
+            )
+
+        def save_report(summary: dict):
+            report_path = os.path.splitext(file_path)[0] + ("_simulation.csv" if summary["dry_run"] else "_rapport.csv")
+            try:
+                import_service.write_report(summary, report_path)
+                return report_path
+            except Exception as e:
+                logger.warning(f"Import report not written: {e}")
+                return None
+
+        def apply_import():
+            try:
+                summary = import_service.import_file(file_path, dry_run=False)
+                error_msg = None
+            except Exception as ex:
+                summary, error_msg = None, str(ex)
+
+            def finish():
+                if error_msg:
+                    ErrorManager.show_error("payment_processing", error_msg)
+                    return
+                report_path = save_report(summary)
+                message = describe(summary)
+                if report_path:
+                    message += f"\n\nRapport: {report_path}"
+                ErrorManager.show_success("Import terminé", message)
+                self._render_current_view()
+
+            self.after(0, finish)
+
+        def simulate():
+            try:
+                summary = import_service.import_file(file_path, dry_run=True)
+                error_msg = None
+            except Exception as ex:
+                summary, error_msg = None, str(ex)
+
+            def confirm():
+                if error_msg:
+                    ErrorManager.show_error("validation_error", error_msg)
+                    return
+                report_path = save_report(summary)
+                message = "Simulation de l'import:\n\n" + describe(summary)
+                if report_path:
+                    message += f"\n\nDétail ligne par ligne: {report_path}"
+                if not summary["accepted"]:
+                    ErrorManager.show_warning("Import", message + "\n\nAucune ligne à importer.")
+                    return
+                if messagebox.askyesno("Confirmer l'import", message + "\n\nAppliquer ces paiements ?"):
+                    threading.Thread(target=apply_import, daemon=True).start()
+
+            self.after(0, confirm)
+
+        threading.Thread(target=simulate, daemon=True).start()
+
     def _show_finance(self):
         """Affiche la page Finances"""
         self.current_view = "finance"
@@ -3543,6 +3618,17 @@ class AdminDashboard(ctk.CTkFrame):
             font=ctk.CTkFont(size=24, weight="bold"),
             text_color=self.colors["text_dark"]
         ).pack(side="left")
+
+        ctk.CTkButton(
+            header,
+            text="📥 Importer relevé bancaire",
+            fg_color="#0a84ff",
+            hover_color="#0078d4",
+            text_color="#ffffff",
+            font=ctk.CTkFont(size=12, weight="bold"),
+            height=36,
+            command=self._import_bank_statement
+        ).pack(side="right")
         
         # === KPIs FINANCIERS ===
         kpi_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
@@ -3958,6 +4044,8 @@ class AdminDashboard(ctk.CTkFrame):
         ).pack(side="left", padx=(0, 10))
 
         promotions = self.student_service.get_promotions_with_fees()
+        # Aperçu d'impact des seuils: données chargées une fois, au premier enregistrement
+        simulator = ThresholdSimulator()
         faculty_names = sorted({p.get("faculty_name") for p in promotions if p.get("faculty_name")})
         faculty_filter = ctk.CTkComboBox(
             filter_row,
@@ -4057,6 +4145,13 @@ class AdminDashboard(ctk.CTkFrame):
                                     "Le seuil ne peut pas dépasser les frais académiques."
                                 )
                                 return
+
+                            impact = simulator.preview(float(threshold_val), promotion_id)
+                            if not messagebox.askyesno(
+                                "Confirmer le nouveau seuil",
+                                self._format_threshold_impact(impact)
+                            ):
+                                return
                             
                             # Afficher le loading dialog
                             loading_dialog, loading_indicator = self._show_loading_dialog(
@@ -4087,40 +4182,29 @@ class AdminDashboard(ctk.CTkFrame):
                                         email_ok = channel_status.get("email_configured")
                                         whatsapp_ok = channel_status.get("whatsapp_configured")
                                         
-                                        # Récupérer les étudiants et envoyer les notifications
-                                        students = self.student_service.get_students_by_promotion(promotion_id)
-                                        if students:
-                                            for i, student in enumerate(students):
-                                                loading_indicator.set_status(
-                                                    f"Notification {i+1}/{len(students)} aux étudiants..."
-                                                )
-                                                try:
-                                                    student_email = student.get('email')
-                                                    student_phone = student.get('phone_number')
-                                                    if not student_email and not student_phone:
-                                                        skipped_no_contact += 1
-                                                        continue
-
-                                                    sent = self.notification_service.send_threshold_change_notification(
-                                                        student_email=student_email,
-                                                        student_phone=student_phone,
-                                                        student_name=f"{student.get('firstname', '')} {student.get('lastname', '')}",
-                                                        old_threshold=old_threshold if old_threshold > 0 else None,
-                                                        new_threshold=float(threshold_val),
-                                                        old_final_fee=old_fee if old_fee > 0 else None,
-                                                        new_final_fee=float(fee_val)
-                                                    )
-                                                    if sent:
-                                                        notification_count += 1
-                                                    else:
-                                                        failed_count += 1
-                                                except Exception as notif_err:
-                                                    logger.warning(f"Failed to notify student {student.get('id')}: {notif_err}")
-                                                    failed_count += 1
-                                        else:
-                                            skipped_no_contact = 0
-                                            failed_count = 0
-                                            notification_count = 0
+                                        # Coordonnées depuis l'annuaire en mémoire (aucune lecture par étudiant)
+                                        students = self.student_service.recipients.by_promotion(promotion_id)
+                                        total = len(students)
+
+                                        def on_progress(progress):
+                                            loading_indicator.set_status(
+                                                f"Notification {progress.processed}/{total} aux étudiants..."
+                                            )
+
+                                        result = self.notification_service.broadcast(
+                                            "threshold_change",
+                                            (student.as_recipient() for student in students),
+                                            common={
+                                                "old_threshold": old_threshold if old_threshold > 0 else None,
+                                                "new_threshold": float(threshold_val),
+                                                "old_final_fee": old_fee if old_fee > 0 else None,
+                                                "new_final_fee": float(fee_val),
+                                            },
+                                            progress_callback=on_progress,
+                                        )
+                                        notification_count = result.recipients_queued
+                                        failed_count = result.failed
+                                        skipped_no_contact = result.skipped
                                         
                                 except Exception as ex:
                                     error_msg = str(ex)
@@ -4236,6 +4320,20 @@ class AdminDashboard(ctk.CTkFrame):
         else:
             ctk.CTkLabel(exam_card, text="❌ Créez une année académique d'abord", font=ctk.CTkFont(size=12), text_color=self.colors["danger"]).pack(anchor="w", padx=25, pady=20)
     
+    def _format_threshold_impact(self, impact: dict, resets_partial_codes: bool = False) -> str:
+        """Résumé lisible d'un aperçu ThresholdSimulator pour la confirmation"""
+        partial_codes = impact["active_partial_codes"] if resets_partial_codes else impact["partial_codes_invalidated"]
+        return (
+            f"Nouveau seuil: {self._format_usd(impact['threshold'])}\n\n"
+            f"Étudiants concernés: {impact['students']}\n"
+            f"Éligibles après changement: {impact['eligible']}\n"
+            f"Deviennent éligibles: +{impact['becomes_eligible']}\n"
+            f"Perdent l'éligibilité: -{impact['loses_eligibility']}\n"
+            f"Codes partiels invalidés: {partial_codes}\n"
+            f"Reste à encaisser pour atteindre le seuil: {self._format_usd(impact['revenue_gap'])}\n\n"
+            f"Appliquer ce changement ?"
+        )
+
     def _update_thresholds(self, new_threshold_str, new_fee_str, academic_year_id):
         """Met à jour les seuils financiers et notifie tous les étudiants"""
         try:
@@ -4262,36 +4360,68 @@ class AdminDashboard(ctk.CTkFrame):
                 messagebox.showerror("Erreur", "Aucune année académique active")
                 return
             
+            simulator = ThresholdSimulator()
+            simulator.load(academic_year_id)
+            impact = simulator.preview(float(new_threshold))
+            if not messagebox.askyesno(
+                "Confirmer le nouveau seuil",
+                self._format_threshold_impact(impact, resets_partial_codes=True)
+            ):
+                return
+
             # Récupérer l'année pour avoir partial_valid_days
             active_year = self.academic_year_service.get_active_year()
             partial_valid_days = active_year.get('partial_valid_days', 30) if active_year else 30
             
-            # Mettre à jour
-            self.finance_service.update_financial_thresholds(
-                academic_year_id=academic_year_id,
-                threshold_amount=new_threshold,
-                final_fee=new_fee,
-                partial_valid_days=partial_valid_days
-            )
-            
-            channel_status = self.notification_service.get_channel_status()
-            email_ok = channel_status.get("email_configured")
-            whatsapp_ok = channel_status.get("whatsapp_configured")
-            notif_line = "Notifications envoyées via Email et WhatsApp."
-            if not email_ok and not whatsapp_ok:
-                notif_line = "Notifications non envoyées (Email/WhatsApp non configurés)."
-            elif not email_ok:
-                notif_line = "Notifications envoyées via WhatsApp uniquement (Email non configuré)."
-            elif not whatsapp_ok:
-                notif_line = "Notifications envoyées via Email uniquement (WhatsApp non configuré)."
-
-            messagebox.showinfo("Succès", f"Seuils mis à jour avec succès!\n\n"
-                              f"Nouveau seuil: ${float(new_threshold_usd):,.2f}\n"
-                              f"Nouveaux frais: ${float(new_fee_usd):,.2f}\n\n"
-                              f"{notif_line}")
-            
-            # Recharger la vue en cours (rafraîchissement automatique)
-            self._render_current_view()
+            # Mise à jour par blocs dans un thread: l'interface reste réactive
+            loading_dialog, loading_indicator = self._show_loading_dialog("Mise à jour des seuils...")
+
+            def on_progress(done, total):
+                self.after(0, lambda: loading_indicator.set_status(f"Profils mis à jour: {done}/{total}"))
+
+            def worker():
+                success = False
+                error_msg = None
+                try:
+                    success = self.finance_service.update_financial_thresholds(
+                        academic_year_id=academic_year_id,
+                        threshold_amount=new_threshold,
+                        final_fee=new_fee,
+                        partial_valid_days=partial_valid_days,
+                        progress_callback=on_progress
+                    )
+                except Exception as ex:
+                    error_msg = str(ex)
+
+                def finish():
+                    loading_indicator.stop()
+                    loading_dialog.destroy()
+                    if not success:
+                        messagebox.showerror("Erreur", f"Erreur lors de la mise à jour: {error_msg or 'échec'}")
+                        return
+
+                    channel_status = self.notification_service.get_channel_status()
+                    email_ok = channel_status.get("email_configured")
+                    whatsapp_ok = channel_status.get("whatsapp_configured")
+                    notif_line = "Notifications en cours d'envoi via Email et WhatsApp."
+                    if not email_ok and not whatsapp_ok:
+                        notif_line = "Notifications non envoyées (Email/WhatsApp non configurés)."
+                    elif not email_ok:
+                        notif_line = "Notifications en cours d'envoi via WhatsApp uniquement (Email non configuré)."
+                    elif not whatsapp_ok:
+                        notif_line = "Notifications en cours d'envoi via Email uniquement (WhatsApp non configuré)."
+
+                    messagebox.showinfo("Succès", f"Seuils mis à jour avec succès!\n\n"
+                                      f"Nouveau seuil: ${float(new_threshold_usd):,.2f}\n"
+                                      f"Nouveaux frais: ${float(new_fee_usd):,.2f}\n\n"
+                                      f"{notif_line}")
+
+                    # Recharger la vue en cours (rafraîchissement automatique)
+                    self._render_current_view()
+
+                self.after(0, finish)
+
+            threading.Thread(target=worker, daemon=True).start()
             
         except (ValueError, TypeError):
             messagebox.showerror("Erreur", "Veuillez entrer des montants valides (nombres)")
@@ -4306,11 +4436,11 @@ class AdminDashboard(ctk.CTkFrame):
             new_fee = float(new_fee_str) if new_fee_str.strip() else 500
             
             # Récupérer un étudiant d'exemple pour la prévisualisation
-            students = self.student_service.get_students_by_promotion(1)
+            students = self.student_service.recipients.by_promotion(1)
             example_student = students[0] if students else None
             
-            student_name = example_student.get("firstname", "Jean") if example_student else "Jean"
-            student_phone = example_student.get("phone_number", "+243...") if example_student else "+243..."
+            student_name = (example_student.firstname or "Jean") if example_student else "Jean"
+            student_phone = (example_student.phone or "+243...") if example_student else "+243..."
             
             active_year = self.academic_year_service.get_active_year()
             old_threshold = float(active_year.get("threshold_amount") or 300) if active_year else 300